@@ -189,7 +189,11 @@ if [ ! -z "${APPLICATION}" ]; then
     CMAKE_SETTINGS="${CMAKE_SETTINGS} -DMY_CPP_FLAGS=BULK_FLUXES" 
   # schism
   elif [ "${APPLICATION}" == "CSTLS" ]; then
-    CMAKE_SETTINGS="${CMAKE_SETTINGS} -DUSE_ATMOS=ON -DNO_PARMETIS=OFF -DOLDIO=ON -DBUILD_TOOLS=ON"
+    CMAKE_SETTINGS="${CMAKE_SETTINGS} -DUSE_ATMOS=ON -DOLDIO=ON -DBUILD_TOOLS=ON"
+    # ParMETIS is used unless it is disabled with --cmake-settings="-DNO_PARMETIS=ON" (to use partition.prop)
+    if [[ "${CMAKE_SETTINGS}" != *"-DNO_PARMETIS="* ]]; then
+      CMAKE_SETTINGS="${CMAKE_SETTINGS} -DNO_PARMETIS=OFF"
+    fi
   fi
 fi
 
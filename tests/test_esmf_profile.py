@@ -0,0 +1,93 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / 'ush'))
+
+from utils import esmf_profile
+
+DATA = Path(__file__).parent / 'esmf_profile'
+
+@pytest.fixture
+def config():
+    return esmf_profile.parse_configure(DATA / 'ufs.configure')
+
+def regions_of(regions, label, phase):
+    return [r for r in regions if r['label'] == label and r['phase'] == phase]
+
+def test_parse_summary():
+    regions = esmf_profile.parse_summary(DATA / 'ESMF_Profile.summary')
+    assert len(regions) == 13
+    ocn = regions_of(regions, 'OCN', 'RunPhase1')[0]
+    assert (ocn['pets'], ocn['count'], ocn['mean'], ocn['min'], ocn['max']) == (4, 24, 90.0, 85.0, 95.0)
+    # Nested region of the same component
+    datm = regions_of(regions, 'ATM', 'datm_datamode_gfs')[0]
+    assert regions[datm['parent']]['label'] == 'ATM'
+    assert datm['depth'] == 3
+    assert esmf_profile.wall_time(regions) == pytest.approx(130.3)
+
+def test_parse_per_pet_table():
+    regions = esmf_profile.parse_summary(DATA / 'ESMF_Profile.0000')
+    # Mean, min and max columns are per call, the time of the PET is the total time
+    atm = regions_of(regions, 'ATM', 'RunPhase1')[0]
+    assert (atm['mean'], atm['min'], atm['max']) == (30.0, 30.0, 30.0)
+    assert regions_of(regions, 'OCN', 'RunPhase1') == []
+
+def test_parse_configure(config):
+    assert config['components']['OCN'] == {'model': 'schism', 'petlist': (2, 5), 'threads': 1}
+    assert config['components']['MED']['petlist'] == (0, 1)
+    entries = esmf_profile.parse_sequence(config['run_sequence'])
+    assert [(e['label'], e['phase']) for e in entries] == [
+        ('ATM-TO-MED', 'RunPhase1'),
+        ('MED', 'med_phases_prep_ocn_accum'),
+        ('MED-TO-OCN', 'RunPhase1'),
+        ('OCN', 'RunPhase1'),
+        ('ATM', 'RunPhase1')]
+    assert all(e['interval'] == 3600 for e in entries)
+
+def test_attribute(config):
+    regions = esmf_profile.parse_summary(DATA / 'ESMF_Profile.summary')
+    components, entries = esmf_profile.attribute(regions, esmf_profile.parse_sequence(config['run_sequence']))
+    # Nested region of the same component is not counted twice
+    assert components['ATM']['run'] == pytest.approx(30.0)
+    assert components['ATM']['init'] == pytest.approx(2.1)
+    assert components['OCN']['run'] == pytest.approx(95.0)
+    assert components['OCN']['balance'] == pytest.approx(90.0/95.0)
+    assert components['OCN']['pets'] == 4
+    times = {(e['label'], e['phase']): (e['calls'], e['time']) for e in entries}
+    assert times[('MED', 'med_phases_prep_ocn_accum')] == (24, 10.0)
+    assert sum(e['share'] for e in entries) == pytest.approx(1.0)
+
+def test_attribute_per_pet_table(config):
+    regions = esmf_profile.parse_summary(DATA / 'ESMF_Profile.0000')
+    components, _ = esmf_profile.attribute(regions)
+    assert components['ATM']['run'] == pytest.approx(30.0)
+    assert components['MED']['run'] == pytest.approx(10.0)
+    assert components['ATM']['balance'] == pytest.approx(1.0)
+
+def test_advise(config):
+    regions = esmf_profile.parse_summary(DATA / 'ESMF_Profile.summary')
+    components, _ = esmf_profile.attribute(regions)
+    advice = esmf_profile.advise(config, components)
+    assert advice['current_cores'] == 6
+    assert advice['current_time'] == pytest.approx(95.0)
+    # One core for the data component and the mediator, the rest for the ocean model
+    assert advice['layout'] == 'concurrent'
+    assert advice['petlist_bounds'] == {'ATM': '0-0', 'MED': '0-0', 'OCN': '1-5'}
+    assert advice['time'] == pytest.approx(76.0)
+    assert advice['speedup'] == pytest.approx(1.25)
+
+def test_advise_cores(config):
+    regions = esmf_profile.parse_summary(DATA / 'ESMF_Profile.summary')
+    components, _ = esmf_profile.attribute(regions)
+    for cores in [12, 600]:
+        advice = esmf_profile.advise(config, components, cores=cores)
+        last = max(int(bounds.split('-')[1]) for bounds in advice['petlist_bounds'].values())
+        assert last == cores-1
+        assert advice['time'] < 95.0
+
+def test_compositions():
+    assert list(esmf_profile.compositions(4, 2)) == [(1, 3), (2, 2), (3, 1)]
+    assert len(list(esmf_profile.compositions(10, 3))) == 36
+    assert list(esmf_profile.compositions(2, 3)) == []
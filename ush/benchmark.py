@@ -0,0 +1,114 @@
+"""
+Offline benchmarks of the provisioning utilities with synthetic inputs
+
+Examples:
+  python benchmark.py --sizes 10000 100000 --output baseline.json
+  python benchmark.py --sizes 10000 100000 --compare baseline.json
+  python benchmark.py --cases --import-time --import-budget 1.5
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+# pylint: disable=wrong-import-position
+
+from utils.bench import cases, synthetic
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks provisioning utilities with synthetic SCHISM grids and atmospheric forcing')
+    parser.add_argument('--workdir', default='./bench', help='directory for synthetic inputs, they are reused across runs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 5000000], help='number of mesh nodes')
+    parser.add_argument('--open-boundaries', type=int, default=1, help='number of open boundary segments')
+    parser.add_argument('--nvrt', type=int, default=20, help='number of vertical levels')
+    parser.add_argument('--forcing', nargs='+', default=['200x150', '1799x1059'], help='forcing grid sizes (NXxNY)')
+    parser.add_argument('--forcing-times', type=int, default=25, help='number of time slices in forcing files')
+    parser.add_argument('--cases', nargs='*', choices=list(cases.CASES.keys()), default=list(cases.CASES.keys()), help='cases to run')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repetitions, best wall time is reported')
+    parser.add_argument('--warmup', type=int, default=1, help='number of unmeasured runs before the measured ones')
+    parser.add_argument('--import-time', action='store_true', help='measure import time of the modules given by --import-modules')
+    parser.add_argument('--import-modules', nargs='+', default=['coastal'], help='modules used to measure import time')
+    parser.add_argument('--import-budget', type=float, help='maximum allowed import time (in seconds)')
+    parser.add_argument('--output', help='write results to JSON file')
+    parser.add_argument('--compare', help='compare results with given JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative increase reported as regression')
+    return parser.parse_args(argv)
+
+def run(args):
+    """
+    Creates synthetic inputs and runs benchmark cases
+    """
+    results = {}
+    for name in args.cases:
+        kind = cases.CASES[name][0]
+        if kind == 'mesh':
+            configs = [(cases.case_key(name, nodes=n, open=args.open_boundaries),
+                        synthetic.create_mesh(os.path.join(args.workdir, f'mesh_{n}_{args.open_boundaries}'), n, open_boundaries=args.open_boundaries, nvrt=args.nvrt))
+                       for n in args.sizes]
+        else:
+            configs = []
+            for size in args.forcing:
+                nx, ny = map(int, size.lower().split('x'))
+                configs.append((cases.case_key(name, grid=size, times=args.forcing_times),
+                                synthetic.create_forcing(os.path.join(args.workdir, f'forcing_{size}_{args.forcing_times}'), nx, ny, ntimes=args.forcing_times)))
+        for key, files in configs:
+            logging.info('Running %s', key)
+            results[key] = cases.run_isolated(name, files, os.path.join(args.workdir, 'run'), repeat=args.repeat, warmup=args.warmup)
+            result = results[key]
+            if result['status'] == 'ok':
+                logging.info('%s: %.3f s, peak memory increase %.1f MB', key, result['wall_time'], result['peak_rss_increase']/1024**2)
+            else:
+                logging.warning('%s: %s (%s)', key, result['status'], result['reason'])
+    if args.import_time or args.import_budget:
+        key = cases.case_key('import_time', modules='+'.join(args.import_modules))
+        results[key] = cases.import_time(args.import_modules, cwd=str(Path(__file__).parent))
+        result = results[key]
+        if result['status'] == 'ok':
+            logging.info('%s: %.3f s, %d modules', key, result['wall_time'], result['modules'])
+            for name, t in result['slowest'].items():
+                logging.info('  %s: %.3f s', name, t)
+        else:
+            logging.warning('%s: %s (%s)', key, result['status'], result['reason'])
+    return results
+
+def check_budget(results, budget):
+    """
+    Checks import time against given budget
+    """
+    ok = True
+    for key, result in results.items():
+        if key.startswith('import_time[') and result['status'] == 'ok' and result['wall_time'] > budget:
+            logging.error('%s: import time %.3f s exceeds the budget of %.3f s', key, result['wall_time'], budget)
+            ok = False
+    return ok
+
+def print_comparison(rows):
+    print('{:<60} {:<18} {:>12} {:>12} {:>8}'.format('case', 'metric', 'baseline', 'current', 'ratio'))
+    for key, metric, old, new, ratio, regression in rows:
+        fmt = lambda v: '{:.4g}'.format(v) if isinstance(v, (int, float)) else str(v)
+        print('{:<60} {:<18} {:>12} {:>12} {:>8}{}'.format(key, metric, fmt(old), fmt(new), fmt(ratio) if ratio else '-', ' REGRESSION' if regression else ''))
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+    results = run(args)
+    if args.output:
+        cases.write_baseline(args.output, results)
+    status = 0
+    if args.import_budget and not check_budget(results, args.import_budget):
+        status = 1
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        rows = cases.compare(baseline, results, threshold=args.threshold)
+        print_comparison(rows)
+        if any(row[-1] for row in rows):
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
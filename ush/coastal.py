@@ -1,17 +1,17 @@
 import os
 import sys
 import logging
+import multiprocessing
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
-from contextlib import redirect_stdout
 from pathlib import Path
 
 from iotaa import asset, refs, task, tasks
-from uwtools.api.cdeps import CDEPS
 from uwtools.api.config import YAMLConfig
 from uwtools.api.driver import DriverCycleBased
 from uwtools.api.fs import link
 from uwtools.api.logging import use_uwtools_logger
-from uwtools.api.schism import SCHISM
 from uwtools.api.template import render
 from uwtools.utils.tasks import file
 
@@ -19,11 +19,14 @@ sys.path.append(str(Path(__file__).parent))
 
 # pylint: disable=wrong-import-position
 
-from utils.data.esmf import create_grid_definition 
-from utils.data.get_input import download
-from utils.data.shared import get_time_range 
-from utils.schism import gen_bctides, gen_bnd, gen_gr3
-from utils.schism.utils import bounding_rectangle_2d
+from utils.data import campaign, esmf, get_herbie, get_input, get_s3, get_wget, prefetch, shared, weights
+from utils import ensemble, planner, restart, scaling
+from utils.manifest import Manifest
+from utils.profiling import Profiler, run_profiled
+from utils.scheduler import job_log, report, run_graph
+from utils.schism import bnd_source, gen_bctides, gen_bnd, gen_gr3, gen_partition, thnc
+from utils.schism import utils as schism_utils
+from utils.schism import vgrid as schism_vgrid
 
 use_uwtools_logger()
 
@@ -41,8 +44,8 @@ class Coastal(DriverCycleBased):
         """
         CDEPS forcing data.
         """
-        config_fd = {}
-        config = self.config_full
+        # Tasks can run concurrently, so the configuration is updated on a copy
+        config = deepcopy(self.config_full)
         # List of arguments that need to be checked for consistency
         arg_list = [
             "nx_global",
@@ -50,82 +53,45 @@ class Coastal(DriverCycleBased):
             "model_maskfile",
             "model_meshfile"
         ]
-        # Loop over each cdeps sub-component
-        for comp in config["cdeps"].keys():
-            if comp == "template_file":
-                continue
-            # Check if streams section exists (atm_streams, ocn_streams, etc.)
-            if "streams" in config["cdeps"][comp].keys():
-                for key, val in config["cdeps"][comp]["streams"].items():
-                    # Check data section for stream to retrive
-                    if "data" in val.keys():
-                        if not comp in config_fd.keys():
-                            config_fd[comp] = {}
-                        config_fd[comp][key] = val
-                        # Check for combine option 
-                        combine = False
-                        if "herbie" in val["data"]["protocol"]:
-                            logging.info("Data protocol is set to 'herbie' for {}/{}. Set combine as True".format(comp, key))
-                            combine = True
-                        else:
-                            if "combine" in val["data"].keys():
-                                combine = val["data"]["combine"]
-                        # Check for target directory
-                        target_dir = "INPUT"
-                        if "target_directory" in val["data"].keys():
-                            target_dir = val["data"]["target_directory"]
-                        if not os.path.abspath(target_dir) or not os.path.isdir(target_dir):
-                            target_dir = os.path.join(self.rundir, target_dir)
-                        config_fd[comp][key]["data"]["target_directory"] = target_dir
-                        # Check for stream data files
-                        if not "stream_data_files" in val.keys() and combine:
-                            fn = "combined_{}_stream{}.nc".format(comp, key[6:9])
-                            config_fd[comp][key]["stream_data_files"] = [ os.path.join(target_dir, fn) ]
-                        else:
-                            config_fd[comp][key]["stream_data_files"] = []
-                            for fn in val["data"]["files"]:
-                                config_fd[comp][key]["stream_data_files"].append(os.path.join(target_dir, os.path.basename(fn)))
-                        # Check for mesh file
-                        if not "stream_mesh_file" in val.keys():
-                            fn = "mesh_{}_stream{}.nc".format(comp, key[6:9])
-                            config_fd[comp][key]["stream_mesh_file"] = os.path.join(target_dir, fn)
+        # Find streams that require data retrieval
+        config_fd = self._cdeps_streams(config)
         # Create run directory if it is not done before
         self.rundir.mkdir(parents=True, exist_ok=True)
         # Get bounding box to subset data if it is requested
         bbox = self._bounding_box()
         # Retrieve data for each stream and component if it is requested
         files = []
-        with open(self.rundir / "cdeps.log", "w", encoding="utf-8") as f:
-            with redirect_stdout(f):
-                for comp in config_fd.keys():
-                    for key, cfg in config_fd[comp].items():
-                        logging.info("%s Downloading forcing data for %s and %s", self.taskname(""), comp, key)
-                        # Check subset option
-                        subset = False
-                        if "subset" in config_fd[comp][key]["data"].keys():
-                            subset = config_fd[comp][key]["data"]["subset"]
-                        # Retrieve data for stream
-                        output_file = config_fd[comp][key]["stream_data_files"][0]
-                        if subset:
-                            download(cfg, self.cycle, bbox=bbox)
-                        else:
-                            download(cfg, self.cycle, bbox=None)
-                        files.append(Path(output_file))
-                        # Create ESMF mesh
-                        input_file = output_file
-                        output_file = config_fd[comp][key]["stream_mesh_file"]
-                        out = create_grid_definition(input_file, output_file=output_file, ff='mesh', output_dir=self.rundir)
-                        files.append(Path(output_file))
-                        # Update configuration
-                        if not "nx_global" in config["cdeps"][comp]["update_values"]["{}_nml".format(comp)].keys():
-                            config["cdeps"][comp]["update_values"]["{}_nml".format(comp)].update(
-                                {
-                                    "nx_global": out['shape'][0],
-                                    "ny_global": out['shape'][1],
-                                    "model_maskfile": out['output_file'],
-                                    "model_meshfile": out['output_file']
-                                }
-                            )
+        # Log of the retrieval, only the records of this task are written to it
+        with job_log(self.rundir / "cdeps.log"):
+            for comp in config_fd.keys():
+                for key, cfg in config_fd[comp].items():
+                    logging.info("%s Downloading forcing data for %s and %s", self.taskname(""), comp, key)
+                    # Check subset option
+                    subset = False
+                    if "subset" in config_fd[comp][key]["data"].keys():
+                        subset = config_fd[comp][key]["data"]["subset"]
+                    # Retrieve data for stream
+                    output_file = config_fd[comp][key]["stream_data_files"][0]
+                    if subset:
+                        get_input.download(cfg, self.cycle, bbox=bbox)
+                    else:
+                        get_input.download(cfg, self.cycle, bbox=None)
+                    files.append(Path(output_file))
+                    # Create ESMF mesh
+                    input_file = output_file
+                    output_file = config_fd[comp][key]["stream_mesh_file"]
+                    out = esmf.create_grid_definition(input_file, output_file=output_file, ff='mesh', output_dir=self.rundir)
+                    files.append(Path(output_file))
+                    # Update configuration
+                    if not "nx_global" in config["cdeps"][comp]["update_values"]["{}_nml".format(comp)].keys():
+                        config["cdeps"][comp]["update_values"]["{}_nml".format(comp)].update(
+                            {
+                                "nx_global": out['shape'][0],
+                                "ny_global": out['shape'][1],
+                                "model_maskfile": out['output_file'],
+                                "model_meshfile": out['output_file']
+                            }
+                        )
         # Additional check for cdeps data component 
         for comp in config["cdeps"].keys():
             if comp == "template_file":
@@ -143,7 +109,7 @@ class Coastal(DriverCycleBased):
             if comp == "template_file":
                 continue
             for key, cfg in config["cdeps"][comp]["streams"].items():
-                date_first, date_last = get_time_range(cfg["stream_data_files"], self.rundir)
+                date_first, date_last = shared.get_time_range(cfg["stream_data_files"], self.rundir)
                 year_first = date_first.year
                 year_last = date_last.year
                 # Update configuration
@@ -211,67 +177,134 @@ class Coastal(DriverCycleBased):
         yield asset(path, path.is_file)
         template_file = "../templates/ufs.configure"
         yield file(path=Path(template_file))
-        config = self.config_full
+        config = deepcopy(self.config_full)
+        if self._restart()[0]:
+            restart.update_attributes(config["nuopc"]["driver"])
+        # Mapping weights created offline
+        for pair, cfg in self._med_weights().items():
+            for attr in cfg["attributes"]:
+                config["nuopc"]["med"].setdefault("attributes", {})[attr] = cfg["file"].name
         d = {"driver": config["nuopc"]["driver"]}
         for component in config["nuopc"]["driver"]["componentList"]:
             d[component.lower()] = config["nuopc"][component.lower()]
         render(input_file=template_file, output_file=path, overrides={"config": d})
 
+    @task
+    def med_weights(self):
+        """
+        Mapping weights of the mediator, created offline so they are not computed at model initialization.
+        """
+        yield self.taskname("Mediator mapping weights")
+        maps = self._med_weights()
+        if maps:
+            files = [cfg["file"] for cfg in maps.values()]
+            fingerprint = self._manifest().fingerprint({"weights": self.config_full["nuopc"]["med"]["weights"]},
+                                                       [self.config_full["schism"]["hgrid"]]+[cfg["source"] for cfg in maps.values()])
+            yield [asset(fn, self._up_to_date("weights", fingerprint, files)) for fn in files]
+        else:
+            yield None
+        yield None
+        self.rundir.mkdir(parents=True, exist_ok=True)
+        for pair, cfg in maps.items():
+            self._run_cpu(weights.create, cfg["source"], self.config_full["schism"]["hgrid"], cfg["file"], mapalgo=cfg["mapalgo"], location=cfg["location"])
+        self._manifest().update("weights", fingerprint, files)
+
     @task
     def restart_dir(self):
         """
-        RESTART directory in run directory.
+        RESTART directory in run directory, with restart files of the previous cycle if it is warm started.
         """
         path = self.rundir / "RESTART"
+        files, pointers = self._restart()
         yield self.taskname("RESTART directory")
-        yield asset(path, path.is_dir)
+        yield [asset(path, path.is_dir)] + [asset(self.rundir / fn, (self.rundir / fn).is_file) for fn in list(files.values())+list(pointers.keys())]
         yield None
-        path.mkdir(parents=True)
+        path.mkdir(parents=True, exist_ok=True)
+        # Restart files of the previous cycle
+        restart.stage(files, pointers, self.rundir)
 
     @task
     def schism_bnd_inputs(self):
         """
         Generate boundary files
         """
-        path = lambda fn: self.rundir / fn
         yield self.taskname("SCHSIM boundary input files")
-        if "boundary" in self.config_full["schism"].keys():
-            hgrid = self.config_full["schism"]["hgrid"]
-            vgrid = self.config_full["schism"]["vgrid"]
-            ocean_bnd_ids = self.config_full["schism"]["boundary"]["ids"]
-            bnd_vars = self.config_full["schism"]["boundary"]["vars"]
-            _files = gen_bnd.execute(hgrid, vgrid, self.cycle, 1, ocean_bnd_ids=ocean_bnd_ids, output_dir=self.rundir, output_vars=bnd_vars)
-            yield [asset(path(fn), path(fn).is_file) for fn in _files]
+        schism = self.config_full["schism"]
+        if "boundary" in schism.keys():
+            hgrid = schism["hgrid"]
+            vgrid = schism["vgrid"]
+            bnd_vars = schism["boundary"]["vars"]
+            files, fingerprint = self._schism_outputs("boundary")
+            yield [asset(fn, self._up_to_date("boundary", fingerprint, files)) for fn in files]
         else:
             yield None
         yield None
+        ocean_bnd_ids = schism["boundary"]["ids"]
+        bnd_source = None
+        if "source" in schism["boundary"].keys():
+            bnd_source = schism["boundary"]["source"]
+        zlib = False
+        if "zlib" in schism["boundary"].keys():
+            zlib = schism["boundary"]["zlib"]
+        shuffle = False
+        if "shuffle" in schism["boundary"].keys():
+            shuffle = schism["boundary"]["shuffle"]
+        self.rundir.mkdir(parents=True, exist_ok=True)
+        ensemble.unshare_outputs(files)
+        self._run_cpu(gen_bnd.execute, hgrid, vgrid, self.cycle, 1, ocean_bnd_ids=ocean_bnd_ids, output_dir=self.rundir, output_vars=bnd_vars, source=bnd_source, zlib=zlib, shuffle=shuffle)
+        self._manifest().update("boundary", fingerprint, files)
 
     @task
     def schism_gr3_inputs(self):
         """
         Generate gr3 input files
         """
-        path = lambda fn: self.rundir / fn
         schism = self.config_full["schism"]
+        files, fingerprint = self._schism_outputs("gr3")
         yield self.taskname("SCHSIM gr3 input files")
-        _files = gen_gr3.execute(schism, output_dir=self.rundir)
-        yield [asset(path(fn), path(fn).is_file) for fn in _files]
+        yield [asset(fn, self._up_to_date("gr3", fingerprint, files)) for fn in files]
+        yield None
+        ensemble.unshare_outputs(files)
+        self._run_cpu(gen_gr3.execute, schism, output_dir=self.rundir)
+        self._manifest().update("gr3", fingerprint, files)
+
+    @task
+    def schism_partition(self):
+        """
+        Generate domain partition file, so SCHISM does not partition the mesh at startup
+        """
+        yield self.taskname("SCHSIM domain partition file")
+        schism = self.config_full["schism"]
+        if "partition" in schism.keys():
+            files, fingerprint = self._schism_outputs("partition")
+            yield [asset(fn, self._up_to_date("partition", fingerprint, files)) for fn in files]
+        else:
+            yield None
         yield None
+        self.rundir.mkdir(parents=True, exist_ok=True)
+        # The default build partitions the mesh with ParMETIS, the file can not be checked at this point
+        logging.warning("%s %s is only used by SCHISM built with NO_PARMETIS=ON, it is ignored otherwise", self.taskname(""), gen_partition.PARTITION_FILE)
+        ensemble.unshare_outputs(files)
+        self._run_cpu(gen_partition.execute, schism, self._schism_nparts(), output_dir=self.rundir)
+        self._manifest().update("partition", fingerprint, files)
 
     @task
     def schism_tidal_inputs(self):
         """
         Generate tidal boundary condition input files
         """
-        path = lambda fn: self.rundir / fn
-        schism = self.config_full["schism"]
         yield self.taskname("SCHSIM tidal input files")
-        if "bctides" in self.config_full["schism"].keys():
-            _files = gen_bctides.execute(schism, self.cycle, 1, output_dir=self.rundir)
-            yield [asset(path(fn), path(fn).is_file) for fn in _files]
+        schism = self.config_full["schism"]
+        if "bctides" in schism.keys():
+            files, fingerprint = self._schism_outputs("bctides")
+            yield [asset(fn, self._up_to_date("bctides", fingerprint, files)) for fn in files]
         else:
             yield None
         yield None
+        self.rundir.mkdir(parents=True, exist_ok=True)
+        ensemble.unshare_outputs(files)
+        self._run_cpu(gen_bctides.execute, schism, self.cycle, 1, output_dir=self.rundir)
+        self._manifest().update("bctides", fingerprint, files)
 
     @tasks
     def provisioned_rundir(self):
@@ -280,32 +313,217 @@ class Coastal(DriverCycleBased):
         """
         yield self.taskname("Provisioned run directory")
         run_duration = self._run_duration()
-        self.linked_files()
-        cdeps_cfg = self.cdeps_data()
+        parallel = self._parallel()
+        # Independent tasks run concurrently, the ones that need outputs of other tasks wait for them
+        jobs = {
+            "linked_files": (self.linked_files, []),
+            "cdeps_data": (self.cdeps_data, []),
+            "schism_config": (lambda: self._schism_update_config(run_duration), []),
+            "cdeps": (lambda cdeps_cfg: self._cdeps_files(cdeps_cfg), ["cdeps_data"]),
+            "med_weights": (lambda cdeps_cfg: self.med_weights(), ["cdeps_data"]),
+            "schism_bnd_inputs": (self.schism_bnd_inputs, []),
+            "schism_gr3_inputs": (self.schism_gr3_inputs, []),
+            "schism_tidal_inputs": (self.schism_tidal_inputs, []),
+            "schism_partition": (self.schism_partition, []),
+            "schism_namelist": (lambda schism_cfg: self._schism_files(schism_cfg), ["schism_config"]),
+            "model_configure": (lambda: self._model_configure(run_duration), []),
+            "ufs_configure": (self.ufs_configure, []),
+            "restart_dir": (self.restart_dir, []),
+            "runscript": (self.runscript, []),
+        }
+        # Load manifest before tasks start, all of them share the same one
+        self._manifest()
+        # CPU bound generators run in separate processes, members use the process pool of their driver
+        owner = parallel > 1 and not hasattr(self, "_process_pool")
+        if owner:
+            self._process_pool = ProcessPoolExecutor(max_workers=parallel, mp_context=multiprocessing.get_context("spawn"))
+        # Members write their records to the profile of their driver, task names start with the member name
+        own_profiler = not hasattr(self, "_profiler_cache")
+        profiler = self._profiler()
+        if profiler:
+            prefix = "" if own_profiler else "{}/".format(self.rundir.name)
+            jobs = {name: (profiler.wrap(func, name=prefix+name, category="task"), deps) for name, (func, deps) in jobs.items()}
+        try:
+            results, timing = run_graph(jobs, max_workers=parallel)
+        finally:
+            if owner:
+                self._process_pool.shutdown()
+                del self._process_pool
+            if profiler and own_profiler:
+                profiler.restore()
+                self._write_profile(profiler)
+                del self._profiler_cache
+        report(jobs, timing, label=self.taskname("Provisioning"))
+        yield [
+            results["cdeps"],
+            results["med_weights"],
+            results["schism_bnd_inputs"],
+            results["schism_gr3_inputs"],
+            results["schism_tidal_inputs"],
+            results["schism_partition"],
+            results["schism_namelist"],
+            results["model_configure"],
+            results["ufs_configure"],
+            results["restart_dir"],
+            results["runscript"],
+        ]
+
+    def plan(self):
+        """
+        Returns remote objects that would be downloaded and files that would be generated
+        while provisioning the run directory. Nothing is downloaded or written.
+        """
+        config = deepcopy(self.config_full)
+        generate = []
+        def add(task, fn, current, size=None):
+            generate.append({"task": task, "file": str(fn), "status": "current" if current else "generate", "size": size})
+        # Forcing data
+        streams = self._cdeps_streams(config) if "cdeps" in config.keys() else {}
+        bbox = self._bounding_box()
+        downloads = planner.remote_objects(streams, self.cycle, bbox=bbox)
+        for comp in streams.keys():
+            for key, cfg in streams[comp].items():
+                for fn in cfg["stream_data_files"]+[cfg["stream_mesh_file"]]:
+                    add("cdeps_data", fn, os.path.isfile(fn))
+        # SCHISM input files
+        if "schism" in config.keys():
+            schism = config["schism"]
+            sections = {"boundary": "schism_bnd_inputs", "gr3": "schism_gr3_inputs", "bctides": "schism_tidal_inputs", "partition": "schism_partition"}
+            for section, name in sections.items():
+                if section != "gr3" and not section in schism.keys():
+                    continue
+                files, fingerprint = self._schism_outputs(section)
+                current = self._up_to_date(section, fingerprint, files)()
+                sizes = {}
+                if section == "boundary":
+                    sizes = planner.estimate_boundary(files, schism["hgrid"], schism["vgrid"], schism["boundary"]["ids"])
+                elif section == "gr3":
+                    sizes = planner.estimate_gr3(files, schism["hgrid"])
+                for fn in files:
+                    add(name, fn, current, sizes.get(fn))
+        # Configuration files rendered from templates
+        for fn in ["cdeps.yaml", "schism.yaml", "datm_in", "datm.streams", "param.nml", "model_configure", "ufs.configure"]:
+            add("configuration", self.rundir / fn, (self.rundir / fn).is_file())
+        links = [{"file": str(self.rundir / fn), "target": str(target), "exists": (self.rundir / fn).is_file()} for fn, target in self.config["links"].items()]
+        plan = {
+            "cycle": self.cycle.isoformat(),
+            "rundir": str(self.rundir),
+            "run_duration": self._run_duration(),
+            "bbox": None if bbox is None else [float(v) for v in bbox],
+            "downloads": downloads,
+            "generate": generate,
+            "links": links
+        }
+        plan["summary"] = planner.summary(plan)
+        return plan
+
+    def ensemble(self):
+        """
+        Provisions run directories of the ensemble members given in ensemble/members section.
+        The first member is provisioned first, the files of the other members that are created
+        from the same inputs are hard linked from it and only the perturbed ones are generated.
+        """
+        members = self.config["ensemble"]["members"]
+        if not members:
+            logging.error("No member is given in ensemble/members section!")
+            sys.exit(1)
+        # Create driver for each member, the overrides are applied to the full configuration
+        drivers = {}
+        for name, overrides in members.items():
+            config = ensemble.merge(self.config_full, overrides)
+            config[self.driver_name()].pop("ensemble", None)
+            config[self.driver_name()]["rundir"] = str(self.rundir / name)
+            drivers[name] = Coastal(config=config, cycle=self.cycle, schema_file=Path(__file__).parent / "coastal.jsonschema")
+        return self._provision_members(drivers, "Ensemble")
+
+    def campaign(self, last_cycle, cadence=6):
+        """
+        Provisions run directories of the cycles from the driver cycle to the last cycle with given
+        cadence (in hours). The forcing data of each hour is retrieved once for all cycles and the
+        cycle independent SCHISM input files are generated once and hard linked to the other cycles.
+        """
+        if last_cycle < self.cycle:
+            logging.error("Last cycle %s of the campaign is before the first cycle %s!", last_cycle.strftime("%Y%m%d%H"), self.cycle.strftime("%Y%m%d%H"))
+            sys.exit(1)
+        if (last_cycle-self.cycle) % timedelta(hours=cadence):
+            logging.error("Last cycle %s of the campaign is not on the %d hour cadence of the first cycle %s!", last_cycle.strftime("%Y%m%d%H"), cadence, self.cycle.strftime("%Y%m%d%H"))
+            sys.exit(1)
+        ncycles = (last_cycle-self.cycle)//timedelta(hours=cadence)+1
+        cycles = prefetch.upcoming_cycles(self.cycle, cadence, ncycles)
+        # Create driver for each cycle, run directories are created under the driver run directory
+        drivers = {}
+        for cycle in cycles:
+            config = deepcopy(self.config_full)
+            config[self.driver_name()]["rundir"] = str(self.rundir / cycle.strftime("%Y%m%d%H"))
+            drivers[cycle] = Coastal(config=config, cycle=cycle, schema_file=Path(__file__).parent / "coastal.jsonschema")
+        # Forcing data of all cycles
+        streams = {}
+        if "cdeps" in self.config_full.keys():
+            streams = {cycle: driver._cdeps_streams(deepcopy(driver.config_full)) for cycle, driver in drivers.items()}
+            campaign.provision_forcing(streams, str(self.rundir / "data"), bbox=self._bounding_box())
+        def share(driver, base):
+            driver._share_from(base, streams=False)
+            if streams:
+                campaign.share_meshes(streams[base.cycle], streams[driver.cycle])
+        drivers = {cycle.strftime("%Y%m%d%H"): driver for cycle, driver in drivers.items()}
+        return self._provision_members(drivers, "Campaign", share=share)
+
+    def scaling(self):
+        """
+        Provisions run directories of the scaling study given in scaling section. Each case is a
+        combination of PET layout (and so number of cores), thread counts and coupling interval.
+        The first case is provisioned first and its input and forcing files are hard linked to the others.
+        """
+        study = scaling.cases(self.config_full, self.driver_name())
+        # Create driver for each case, the overrides are applied to the full configuration
+        drivers = {}
+        for name, case in study.items():
+            config = ensemble.merge(self.config_full, case["overrides"])
+            config[self.driver_name()].pop("scaling", None)
+            config[self.driver_name()].pop("ensemble", None)
+            config[self.driver_name()]["rundir"] = str(self.rundir / name)
+            drivers[name] = Coastal(config=config, cycle=self.cycle, schema_file=Path(__file__).parent / "coastal.jsonschema")
+        results = self._provision_members(drivers, "Scaling study")
+        # Description of the cases, used to collect the results after the runs
+        self.rundir.mkdir(parents=True, exist_ok=True)
+        scaling.write_cases(self.rundir / "scaling.json", study)
+        return results
+
+    def prefetch(self, cadence=6, ncycles=1, poll=300, timeout=None, once=False):
+        """
+        Downloads forcing data of the upcoming cycles (starting from the driver cycle) to the
+        target directories of the streams. Returns list of cycles that could not be retrieved.
+        """
+        config = deepcopy(self.config_full)
+        streams = self._cdeps_streams(config) if "cdeps" in config.keys() else {}
+        return prefetch.run(streams, self.cycle, cadence, ncycles, bbox=self._bounding_box(), poll=poll, timeout=timeout, once=once)
+
+    def _cdeps_files(self, cdeps_cfg):
+        """
+        CDEPS namelist and stream files.
+        """
+        from uwtools.api.cdeps import CDEPS
+
         cdeps = CDEPS(
             config=refs(cdeps_cfg["cdeps-config"]),
             controller=[self.driver_name()],
             cycle=self.cycle,
         )
-        schism_cfg = self._schism_update_config(run_duration) 
+        return [cdeps.atm_nml(), cdeps.atm_stream()]
+
+    def _schism_files(self, schism_cfg):
+        """
+        SCHISM namelist file.
+        """
+        from uwtools.api.schism import SCHISM
+
         schism = SCHISM(
             config=refs(schism_cfg)["schism-config"],
             controller=[self.driver_name()],
             cycle=self.cycle,
             schema_file="utils/schism/schism.jsonschema",
         )
-        yield [
-            cdeps.atm_nml(),
-            cdeps.atm_stream(),
-            self.schism_bnd_inputs(),
-            self.schism_gr3_inputs(),
-            self.schism_tidal_inputs(),
-            schism.namelist_file(),
-            self._model_configure(run_duration),
-            self.ufs_configure(),
-            self.restart_dir(),
-            self.runscript(),
-        ]
+        return schism.namelist_file()
 
     @task
     def _schism_update_config(self, run_duration):
@@ -318,7 +536,7 @@ class Coastal(DriverCycleBased):
             "schism-config": asset(path_schism_config, path_schism_config.is_file)
         }
         yield None
-        config = self.config_full
+        config = deepcopy(self.config_full)
         config["schism"]["namelist"]["template_values"].update(
             {
                 "start_year": self.cycle.year,
@@ -329,10 +547,276 @@ class Coastal(DriverCycleBased):
                 "rnday": run_duration / 24.0
             }
         )
+        # Hotstart with time reset to 0, start date is already set to the cycle
+        if "hotstart.nc" in self._restart()[0].values():
+            config["schism"]["namelist"]["template_values"]["ihot"] = 1
         YAMLConfig(config).dump(path_schism_config)
 
     # Private helper methods
 
+    def _cdeps_streams(self, config):
+        """
+        Returns configuration of CDEPS streams that have data section, with resolved file names.
+        """
+        config_fd = {}
+        # Loop over each cdeps sub-component
+        for comp in config["cdeps"].keys():
+            if comp == "template_file":
+                continue
+            # Check if streams section exists (atm_streams, ocn_streams, etc.)
+            if "streams" in config["cdeps"][comp].keys():
+                for key, val in config["cdeps"][comp]["streams"].items():
+                    # Check data section for stream to retrive
+                    if "data" in val.keys():
+                        if not comp in config_fd.keys():
+                            config_fd[comp] = {}
+                        config_fd[comp][key] = val
+                        # Check for combine option 
+                        combine = False
+                        if "herbie" in val["data"]["protocol"]:
+                            logging.info("Data protocol is set to 'herbie' for {}/{}. Set combine as True".format(comp, key))
+                            combine = True
+                        else:
+                            if "combine" in val["data"].keys():
+                                combine = val["data"]["combine"]
+                        # Check for target directory
+                        target_dir = "INPUT"
+                        if "target_directory" in val["data"].keys():
+                            target_dir = val["data"]["target_directory"]
+                        if not os.path.abspath(target_dir) or not os.path.isdir(target_dir):
+                            target_dir = os.path.join(self.rundir, target_dir)
+                        config_fd[comp][key]["data"]["target_directory"] = target_dir
+                        # Check for stream data files
+                        if not "stream_data_files" in val.keys() and combine:
+                            fn = "combined_{}_stream{}.nc".format(comp, key[6:9])
+                            config_fd[comp][key]["stream_data_files"] = [ os.path.join(target_dir, fn) ]
+                        else:
+                            config_fd[comp][key]["stream_data_files"] = []
+                            for fn in val["data"]["files"]:
+                                config_fd[comp][key]["stream_data_files"].append(os.path.join(target_dir, os.path.basename(fn)))
+                        # Check for mesh file
+                        if not "stream_mesh_file" in val.keys():
+                            fn = "mesh_{}_stream{}.nc".format(comp, key[6:9])
+                            config_fd[comp][key]["stream_mesh_file"] = os.path.join(target_dir, fn)
+        return config_fd
+
+    def _provision_members(self, drivers, label, share=None):
+        """
+        Provisions run directories of the members (ensemble members, cycles or scaling cases). The first member
+        is provisioned first and share(driver, base) stages its files to each of the others (by default, the files
+        created from the same inputs). The other members run concurrently, each of them runs its own tasks one
+        after another and all of them use a single process pool, so at most parallel tasks run at the same time.
+        """
+        share = share or (lambda driver, base: driver._share_from(base))
+        names = list(drivers.keys())
+        base = drivers[names[0]]
+        parallel = self._parallel()
+        def member(driver):
+            def run(_):
+                share(driver, base)
+                return driver.provisioned_rundir()
+            return run
+        jobs = {names[0]: (base.provisioned_rundir, [])}
+        for name in names[1:]:
+            drivers[name]._member = True
+            jobs[name] = (member(drivers[name]), [names[0]])
+        pool = None
+        if parallel > 1:
+            pool = ProcessPoolExecutor(max_workers=parallel, mp_context=multiprocessing.get_context("spawn"))
+            for driver in drivers.values():
+                driver._process_pool = pool
+        # Functions are instrumented once for all members, the profile is written to the run directory of the driver
+        profiler = self._profiler()
+        if profiler:
+            for driver in drivers.values():
+                driver._profiler_cache = profiler
+        try:
+            results, timing = run_graph(jobs, max_workers=parallel)
+        finally:
+            if pool:
+                pool.shutdown()
+                for driver in drivers.values():
+                    del driver._process_pool
+            if profiler:
+                profiler.restore()
+                self._write_profile(profiler)
+                del self._profiler_cache
+        report(jobs, timing, label=self.taskname(label))
+        return results
+
+    def _share_from(self, base, streams=True):
+        """
+        Hard links files of the base member that are created from the same inputs.
+        Forcing files are not shared if streams is False (i.e. base is another cycle).
+        """
+        manifest = self._manifest()
+        base_manifest = base._manifest()
+        # Reuse hashes of the input files
+        with manifest.lock:
+            for path, entry in base_manifest.data["files"].items():
+                manifest.data["files"].setdefault(path, entry)
+        # SCHISM input files, they are shared if their fingerprints match
+        if "schism" in self.config_full.keys():
+            schism = self.config_full["schism"]
+            for section in ["boundary", "gr3", "bctides", "partition"]:
+                if section != "gr3" and not section in schism.keys():
+                    continue
+                base_files, base_fingerprint = base._schism_outputs(section)
+                files, fingerprint = self._schism_outputs(section)
+                if fingerprint == base_fingerprint and base_manifest.is_current(section, base_fingerprint, base_files):
+                    self.rundir.mkdir(parents=True, exist_ok=True)
+                    ensemble.share_outputs(base_files, files)
+                    manifest.update(section, fingerprint, files)
+        # Forcing data and ESMF mesh files of the streams with the same configuration
+        if streams and "cdeps" in self.config_full.keys():
+            base_streams = base._cdeps_streams(deepcopy(base.config_full))
+            streams = self._cdeps_streams(deepcopy(self.config_full))
+            staged = ensemble.share_streams(base_streams, streams)
+            if staged:
+                logging.info("%s Shared forcing files: %s", self.taskname(""), ", ".join(map(str, staged)))
+        manifest.save()
+
+    def _med_weights(self):
+        """
+        Returns mapping weights given in nuopc/med/weights section (i.e. atm2ocn), with the source mesh,
+        the weight file in run directory and the mediator attributes that are set to the file name.
+        """
+        nuopc = self.config_full["nuopc"]
+        if not "weights" in nuopc.get("med", {}).keys():
+            return {}
+        maps = {}
+        for pair, cfg in nuopc["med"]["weights"].items():
+            src, _, dst = pair.partition("2")
+            if not src in nuopc.keys() or not dst in nuopc.keys() or nuopc[dst]["model"] != "schism" or not nuopc[src]["model"] in self.config_full.get("cdeps", {}).keys():
+                logging.error("Weights can only be created from a CDEPS data component to SCHISM, %s is not supported!", pair)
+                sys.exit(1)
+            model = nuopc[src]["model"]
+            # Mesh of the data component, it is the mesh of its first stream unless it is given
+            nml = self.config_full["cdeps"][model]["update_values"].get("{}_nml".format(model), {})
+            if "model_meshfile" in nml.keys():
+                source = nml["model_meshfile"]
+            else:
+                streams = self._cdeps_streams(deepcopy(self.config_full))[model]
+                source = streams[list(streams.keys())[0]]["stream_mesh_file"]
+            mapalgo = "bilinear"
+            if "mapalgo" in (cfg or {}).keys():
+                mapalgo = cfg["mapalgo"]
+            attributes = ["{}_smapname".format(pair), "{}_vmapname".format(pair)]
+            if "attributes" in (cfg or {}).keys():
+                attributes = cfg["attributes"]
+            location = "node"
+            if nuopc[dst].get("attributes", {}).get("meshloc") == "element":
+                location = "element"
+            maps[pair] = {
+                "source": source,
+                "file": self.rundir / "map_{}_{}.nc".format(pair, mapalgo),
+                "mapalgo": mapalgo,
+                "location": location,
+                "attributes": attributes
+            }
+        return maps
+
+    def _restart(self):
+        """
+        Returns restart files of the previous cycle (source: path in run directory) and content of
+        their pointer files, both are empty if the cycle is cold started.
+        """
+        if hasattr(self, "_restart_cache"):
+            return self._restart_cache
+        self._restart_cache = ({}, {})
+        if not "restart" in self.config.keys():
+            return self._restart_cache
+        cfg = self.config["restart"]
+        cadence = 6
+        if "cadence" in cfg.keys():
+            cadence = cfg["cadence"]
+        required = True
+        if "required" in cfg.keys():
+            required = cfg["required"]
+        hotstart = "outputs/hotstart_it=*.nc"
+        if "hotstart" in cfg.keys():
+            hotstart = cfg["hotstart"]
+        previous, prev_dir = restart.previous_rundir(cfg["directory"], self.cycle, cadence)
+        try:
+            files, pointers = restart.find_restarts(prev_dir, self.cycle)
+            if "schism" in self.config_full.keys() and hotstart:
+                fn = restart.find_hotstart(prev_dir, hotstart, (self.cycle-previous).total_seconds())
+                files[fn] = "hotstart.nc"
+        except ValueError as e:
+            if required:
+                logging.error("%s Restart of the previous cycle could not be found: %s", self.taskname(""), str(e))
+                sys.exit(1)
+            logging.warning("%s Cold start, restart of the previous cycle could not be found: %s", self.taskname(""), str(e))
+            return self._restart_cache
+        logging.info("%s Warm start from %s", self.taskname(""), prev_dir)
+        self._restart_cache = (files, pointers)
+        return self._restart_cache
+
+    def _schism_outputs(self, section):
+        """
+        Returns files generated for given schism section and fingerprint of their inputs.
+        """
+        schism = self.config_full["schism"]
+        if section == "boundary":
+            files = gen_bnd.output_files(schism["boundary"]["vars"], output_dir=self.rundir)
+            fingerprint = self._fingerprint("boundary", [schism["hgrid"], schism["vgrid"]]+gen_bnd.input_files(schism["boundary"].get("source"), self.cycle, 1))
+        elif section == "gr3":
+            files = gen_gr3.output_files(schism, output_dir=self.rundir)
+            fingerprint = self._fingerprint("gr3", [schism["hgrid"]]+gen_gr3.input_files(schism), cycle=False)
+        elif section == "partition":
+            files = gen_partition.output_files(output_dir=self.rundir)
+            fingerprint = self._fingerprint("partition", [schism["hgrid"]], cycle=False, extra={"nparts": self._schism_nparts()})
+        else:
+            files = gen_bctides.output_files(schism, output_dir=self.rundir)
+            fingerprint = self._fingerprint("bctides", [schism["hgrid"], schism["vgrid"]]+gen_bctides.input_files(schism))
+        return [Path(fn) for fn in files], fingerprint
+
+    def _schism_nparts(self):
+        """
+        Returns number of parts of the SCHISM domain, one for each MPI task of the ocean component.
+        """
+        schism = self.config_full["schism"]
+        if "nparts" in (schism["partition"] or {}).keys():
+            return int(schism["partition"]["nparts"])
+        for key, val in self.config_full["nuopc"].items():
+            if key != "driver" and val.get("model") == "schism":
+                first, last = scaling.parse_bounds(val["petlist_bounds"])
+                threads = 1
+                if "omp_num_threads" in val.keys():
+                    threads = int(val["omp_num_threads"])
+                return max(1, (last-first+1)//threads)
+        logging.error("SCHISM component is not found in nuopc section, set number of parts in schism/partition/nparts!")
+        sys.exit(1)
+
+    def _fingerprint(self, section, files, cycle=True, extra=None):
+        """
+        Returns fingerprint of the inputs used by given schism section
+        """
+        schism = self.config_full["schism"]
+        config = {
+            "section": schism.get(section),
+            "hgrid": schism["hgrid"],
+            "vgrid": schism["vgrid"],
+        }
+        if cycle:
+            config["cycle"] = self.cycle
+        config.update(extra or {})
+        return self._manifest().fingerprint(config, files)
+
+    def _manifest(self):
+        """
+        Returns manifest that keeps fingerprints of generated files in the run directory
+        """
+        if not hasattr(self, "_manifest_cache"):
+            self._manifest_cache = Manifest(self.rundir)
+        return self._manifest_cache
+
+    def _up_to_date(self, key, fingerprint, files):
+        """
+        Returns readiness check for files generated with the given input fingerprint
+        """
+        return lambda: self._manifest().is_current(key, fingerprint, files)
+
     def _bounding_box(self):
         """
         Returns bounding box based on used component and its mesh
@@ -341,9 +825,68 @@ class Coastal(DriverCycleBased):
         bbox = None
         if "schism" in self.config_full:
             hgrid = self.config_full["schism"]["hgrid"]
-            bbox = bounding_rectangle_2d(hgrid)
+            bbox = schism_utils.bounding_rectangle_2d(hgrid)
         return bbox
 
+    def _parallel(self):
+        """
+        Returns number of tasks that can run concurrently while provisioning run directory.
+        Members that are provisioned concurrently run their own tasks one after another.
+        """
+        if getattr(self, "_member", False):
+            return 1
+        parallel = 1
+        if "parallel" in self.config.keys():
+            parallel = int(self.config["parallel"])
+        return max(1, parallel)
+
+    def _profiler(self):
+        """
+        Returns profiler with instrumented data and schism utilities if profiling is requested.
+        Functions are replaced for the whole process, so they are instrumented once by the outermost
+        driver and the members of ensemble, campaign and scaling use the profiler of their driver.
+        """
+        if hasattr(self, "_profiler_cache"):
+            return self._profiler_cache
+        if not self.config.get("profile", False):
+            return None
+        profiler = Profiler()
+        for module in [esmf, get_herbie, get_input, get_s3, get_wget, prefetch, shared]:
+            profiler.instrument(module, category="utils.data")
+        for module in [bnd_source, gen_bctides, gen_bnd, gen_gr3, gen_partition, thnc, schism_vgrid, schism_utils]:
+            profiler.instrument(module, category="utils.schism")
+        self._profiler_cache = profiler
+        return profiler
+
+    def _write_profile(self, profiler):
+        """
+        Writes profiling report (and Chrome trace if it is requested) to run directory.
+        """
+        options = self.config["profile"]
+        chrome_trace = isinstance(options, dict) and options.get("chrome_trace", False)
+        self.rundir.mkdir(parents=True, exist_ok=True)
+        profiler.write(self.rundir / "profile.json")
+        if chrome_trace:
+            profiler.write_chrome_trace(self.rundir / "profile.trace.json")
+
+    def _run_cpu(self, func, *args, **kwargs):
+        """
+        Runs CPU bound function in process pool if it is available.
+        If profiling is requested, the function is profiled in the worker and its records are added to the profile.
+        """
+        if not hasattr(self, "_process_pool"):
+            return func(*args, **kwargs)
+        profiler = getattr(self, "_profiler_cache", None)
+        if not profiler:
+            return self._process_pool.submit(func, *args, **kwargs).result()
+        # Instrumented functions are pickled by name, so the worker gets the original function
+        original = getattr(func, "__profiled__", func)
+        name = "{}.{}".format(original.__module__, original.__name__)
+        category = dict(profiler.modules).get(original.__module__, "function")
+        result, records = self._process_pool.submit(run_profiled, func, name, category, profiler.modules, profiler.t0, args, kwargs).result()
+        profiler.merge(records)
+        return result
+
     def _run_duration(self):
         """
         Returns run duration for the simulation.
@@ -0,0 +1,125 @@
+"""
+Command line tools for the Coastal driver
+
+Examples:
+  python coastal_tools.py plan --config-file coastal.yaml --cycle 2024-08-05T12
+  python coastal_tools.py ensemble --config-file coastal.yaml --cycle 2024-08-05T12
+  python coastal_tools.py campaign --config-file coastal.yaml --cycle 2024-08-01T00 --last-cycle 2024-08-31T18 --cadence 6
+  python coastal_tools.py scaling --config-file coastal.yaml --cycle 2024-08-05T12
+  python coastal_tools.py scaling-report --rundir /path/to/study --output scaling.csv
+  python coastal_tools.py prefetch --config-file coastal.yaml --cycle 2024-08-05T12 --cadence 6 --cycles 4
+"""
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+# pylint: disable=wrong-import-position
+
+from coastal import Coastal
+from utils import scaling as scaling_study
+
+def driver(args):
+    """
+    Returns Coastal driver for given configuration and cycle
+    """
+    return Coastal(
+        config=args.config_file,
+        cycle=args.cycle,
+        schema_file=Path(__file__).parent / "coastal.jsonschema",
+    )
+
+def plan(args):
+    """
+    Prints what would be downloaded and generated to provision the run directory
+    """
+    out = driver(args).plan()
+    text = json.dumps(out, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text+"\n")
+    else:
+        print(text)
+    return 0
+
+def ensemble(args):
+    """
+    Provisions run directories of ensemble members
+    """
+    driver(args).ensemble()
+    return 0
+
+def campaign(args):
+    """
+    Provisions run directories of consecutive cycles, shared data is retrieved and generated once
+    """
+    driver(args).campaign(args.last_cycle, cadence=args.cadence)
+    return 0
+
+def scaling(args):
+    """
+    Provisions run directories of the scaling study
+    """
+    driver(args).scaling()
+    return 0
+
+def scaling_report(args):
+    """
+    Collects wall times and ESMF profile results of the scaling study into a table
+    """
+    rows = scaling_study.collect(args.rundir)
+    scaling_study.write_table(rows, args.output)
+    return 0
+
+def prefetch(args):
+    """
+    Downloads forcing data of the upcoming cycles ahead of time
+    """
+    pending = driver(args).prefetch(cadence=args.cadence, ncycles=args.cycles, poll=args.poll, timeout=args.timeout, once=args.once)
+    if pending:
+        logging.error("Data could not be retrieved for %s", ", ".join(map(str, pending)))
+        return 1
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Coastal driver tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    # Options used by all commands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config-file", required=True, help="driver configuration file")
+    common.add_argument("--cycle", required=True, type=datetime.fromisoformat, help="cycle in ISO 8601 format (e.g. 2024-08-05T12)")
+    # Commands
+    sub = subparsers.add_parser("plan", parents=[common], help="report remote objects and files that would be created, nothing is written")
+    sub.add_argument("--output", help="write plan to JSON file instead of standard output")
+    sub.set_defaults(func=plan)
+    sub = subparsers.add_parser("ensemble", parents=[common], help="provision run directories of the members given in ensemble section")
+    sub.set_defaults(func=ensemble)
+    sub = subparsers.add_parser("campaign", parents=[common], help="provision run directories of the cycles from the given cycle to the last one")
+    sub.add_argument("--last-cycle", required=True, type=datetime.fromisoformat, help="last cycle in ISO 8601 format")
+    sub.add_argument("--cadence", type=int, default=6, help="interval between cycles (in hours)")
+    sub.set_defaults(func=campaign)
+    sub = subparsers.add_parser("scaling", parents=[common], help="provision run directories of the cases given in scaling section")
+    sub.set_defaults(func=scaling)
+    sub = subparsers.add_parser("scaling-report", help="collect run times of the scaling study cases after they run")
+    sub.add_argument("--rundir", required=True, help="run directory of the scaling study (the one that has scaling.json)")
+    sub.add_argument("--output", help="write table to CSV file instead of standard output")
+    sub.set_defaults(func=scaling_report)
+    sub = subparsers.add_parser("prefetch", parents=[common], help="download forcing data of the upcoming cycles, starting from the given one")
+    sub.add_argument("--cadence", type=int, default=6, help="interval between cycles (in hours)")
+    sub.add_argument("--cycles", type=int, default=1, help="number of cycles")
+    sub.add_argument("--poll", type=int, default=300, help="interval between checks for new data (in seconds)")
+    sub.add_argument("--timeout", type=int, help="stop waiting after given time (in seconds)")
+    sub.add_argument("--once", action="store_true", help="check data sources only once (i.e. when it runs as a cron job)")
+    sub.set_defaults(func=prefetch)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
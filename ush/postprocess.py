@@ -0,0 +1,50 @@
+"""
+Post-processes SCHISM 2D outputs: maximum elevation and velocity of each node and time series at stations
+
+Examples:
+  python postprocess.py --outputs /path/to/run/outputs --hgrid /path/to/run/hgrid.gr3
+  python postprocess.py --outputs /path/to/run/outputs --hgrid hgrid.ll --stations stations.csv --workers 8
+"""
+import os
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+# pylint: disable=wrong-import-position
+
+from utils.schism import postprocess
+from utils.schism.mesh_index import load_index
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Computes maximum elevation and velocity and extracts station time series from SCHISM outputs')
+    parser.add_argument('--outputs', required=True, help='directory of SCHISM outputs')
+    parser.add_argument('--hgrid', required=True, help='horizontal grid (hgrid.gr3 or hgrid.ll) in the coordinates of the stations')
+    parser.add_argument('--pattern', default='out2d_*.nc', help='pattern of the output files')
+    parser.add_argument('--stations', help='stations as CSV file (name, lon, lat) or SCHISM station.in file')
+    parser.add_argument('--workers', type=int, default=4, help='number of processes, each one processes a file')
+    parser.add_argument('--records', type=int, default=postprocess.RECORDS, help='number of time records read at once')
+    parser.add_argument('--output-dir', default='.', help='directory of the results (maxele.nc and stations.nc)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+    files = postprocess.output_files(args.outputs, pattern=args.pattern)
+    if not files:
+        logging.error('No output file matching %s is found in %s', args.pattern, args.outputs)
+        return 1
+    index = load_index(args.hgrid)
+    stations = postprocess.read_stations(args.stations) if args.stations else None
+    logging.info('Processing %d files with %d workers', len(files), args.workers)
+    out = postprocess.process(files, stations=stations, index=index, workers=args.workers, records=args.records)
+    os.makedirs(args.output_dir, exist_ok=True)
+    logging.info('Created %s', postprocess.write_max(os.path.join(args.output_dir, 'maxele.nc'), index.mesh, out))
+    if stations:
+        logging.info('Created %s', postprocess.write_stations(os.path.join(args.output_dir, 'stations.nc'), stations, out))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
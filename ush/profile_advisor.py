@@ -0,0 +1,92 @@
+"""
+Reports time spent by the components and coupling phases of completed runs (ESMF_RUNTIME_PROFILE=ON)
+and recommends PET layout for ufs.configure
+
+Examples:
+  python profile_advisor.py --rundir /path/to/run
+  python profile_advisor.py --rundir /path/to/run --cores 12 --output advice.json
+  python profile_advisor.py --summary ESMF_Profile.summary --configure ufs.configure --scaling schism=0.9
+"""
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+# pylint: disable=wrong-import-position
+
+from utils import esmf_profile
+
+def scaling(text):
+    """
+    Parses scaling exponent of a model (model=exponent)
+    """
+    model, _, value = text.partition('=')
+    return model, float(value)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Analyzes ESMF profiles of coupled runs and recommends PET layout')
+    parser.add_argument('--rundir', help='run directory that has ESMF_Profile.summary (or ESMF_Profile.NNNN) and ufs.configure')
+    parser.add_argument('--summary', help='ESMF profile, overrides the one found in run directory')
+    parser.add_argument('--configure', help='ufs.configure, overrides the one found in run directory')
+    parser.add_argument('--cores', type=int, help='total number of cores of the recommended layout, default is the cores used by the run')
+    parser.add_argument('--scaling', type=scaling, nargs='+', default=[], help='scaling exponents of the models (e.g. schism=0.9 datm=0.3)')
+    parser.add_argument('--output', help='write results to JSON file')
+    return parser.parse_args(argv)
+
+def report(components, entries, config, wall, advice):
+    """
+    Prints time of the components, run sequence entries and the recommended layout
+    """
+    comps = config['components']
+    labels = list(comps.keys())+sorted(set(e['label'] for e in entries if e['label'] not in comps.keys()))
+    print('Total time: {:.2f} s'.format(wall))
+    print('{:<14} {:>8} {:>10} {:>10} {:>10} {:>8}'.format('component', 'PETs', 'init (s)', 'run (s)', 'final (s)', 'balance'))
+    for label in labels:
+        if label in components.keys():
+            c = components[label]
+            print('{:<14} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>8.2f}'.format(label, c['pets'], c['init'], c['run'], c['final'], c['balance']))
+    print()
+    print('{:<40} {:>8} {:>10} {:>8}'.format('run sequence', 'calls', 'time (s)', 'share'))
+    for e in entries:
+        print('{:<40} {:>8} {:>10.2f} {:>7.1f}%'.format(e['entry'][:40], e['calls'], e['time'], 100*e['share']))
+    print()
+    print('Recommended {} layout for {} cores (estimated run time {:.2f} s, current {:.2f} s on {} cores, speedup {:.2f})'.format(
+        advice['layout'], advice['cores'], advice['time'], advice['current_time'], advice['current_cores'], advice['speedup']))
+    for group, idle in advice['idle'].items():
+        print('  {} idle {:.0f}% of the time'.format(group, 100*idle))
+    print('ufs.configure:')
+    for name in comps.keys():
+        print('  {}_petlist_bounds: {}'.format(name, advice['petlist_bounds'][name].replace('-', ' ')))
+        print('  {}_omp_num_threads: {}'.format(name, advice['omp_num_threads'][name]))
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args(argv)
+    summary, configure = esmf_profile.find_files(args.rundir) if args.rundir else (None, None)
+    summary = args.summary or summary
+    configure = args.configure or configure
+    if summary is None or configure is None:
+        logging.error('Either run directory or both profile and ufs.configure are needed.')
+        return 1
+    for fn in [summary, configure]:
+        if not Path(fn).is_file():
+            logging.error('The file %s does not exist.', fn)
+            return 1
+
+    regions = esmf_profile.parse_summary(summary)
+    config = esmf_profile.parse_configure(configure)
+    components, entries = esmf_profile.attribute(regions, esmf_profile.parse_sequence(config['run_sequence']))
+    advice = esmf_profile.advise(config, components, cores=args.cores, scaling=dict(args.scaling))
+    wall = esmf_profile.wall_time(regions)
+    report(components, entries, config, wall, advice)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'configure': configure, 'wall_time': wall, 'components': components,
+                       'run_sequence': entries, 'advice': advice}, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
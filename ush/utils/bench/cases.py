@@ -0,0 +1,259 @@
+import os
+import gc
+import sys
+import json
+import shutil
+import tempfile
+import logging
+import platform
+import resource
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import numpy as np
+from ..profiling import Profiler
+
+def _read_hgrid(files, workdir):
+    from ..schism import utils as schism_utils
+    return lambda: schism_utils.read_hgrid(files['hgrid'])
+
+def _parse_hgrid(files, workdir):
+    from ..schism import utils as schism_utils
+    return lambda: schism_utils.parse_hgrid(files['hgrid'])
+
+def _read_hgrid_boundaries(files, workdir):
+    from ..schism import gen_bctides
+    return lambda: gen_bctides.read_hgrid_boundaries(files['hgrid'])
+
+def _gen_gr3(files, workdir):
+    from ..schism import gen_gr3
+    return lambda: gen_gr3.execute({'hgrid': files['hgrid']}, output_dir=workdir)
+
+def _build_mesh_index(files, workdir):
+    from ..schism import utils as schism_utils
+    from ..schism.mesh_index import MeshIndex
+    mesh = schism_utils.load_mesh(files['hgrid'])
+    return lambda: MeshIndex.build(mesh)
+
+def _locate(files, workdir):
+    from ..schism import mesh_index
+    index = mesh_index.load_index(files['hgrid'])
+    # Random points over the mesh extent
+    rng = np.random.default_rng(0)
+    x = rng.uniform(index.mesh.x.min(), index.mesh.x.max(), 100000)
+    y = rng.uniform(index.mesh.y.min(), index.mesh.y.max(), 100000)
+    return lambda: index.locate(x, y)
+
+def _partition(files, workdir):
+    from ..schism import utils as schism_utils
+    from ..schism import gen_partition
+    mesh = schism_utils.load_mesh(files['hgrid'])
+    return lambda: gen_partition.partition(mesh, 64, method='rcb')
+
+def _parse_vgrid(files, workdir):
+    from ..schism import vgrid
+    return lambda: vgrid.parse_vgrid(files['vgrid'])
+
+def _create_elev2d_th_nc(files, workdir):
+    from pyschism.mesh import Hgrid
+    from ..schism import gen_bctides
+    hgrid = Hgrid.open(files['hgrid'], crs='epsg:4326')
+    timeseries = np.loadtxt(files['elev_th'])
+    ofile = os.path.join(workdir, 'elev2D.th.nc')
+    return lambda: gen_bctides.create_elev2d_th_nc(ofile, timeseries, hgrid, None)
+
+def _create_grid_definition(kind):
+    def setup(files, workdir):
+        from ..data import esmf
+        ofile = os.path.join(workdir, 'scrip.nc')
+        def run():
+            # Output is not created again if it exists
+            if os.path.isfile(ofile):
+                os.remove(ofile)
+            return esmf.create_grid_definition(files[kind], output_file='scrip.nc', ff='scrip', output_dir=workdir)
+        return run
+    return setup
+
+def _calc_corners(files, workdir):
+    import xarray as xr
+    from ..data import esmf
+    with xr.open_dataset(files['hrrr']) as ds:
+        xc = ds['longitude'].to_numpy()
+        yc = ds['latitude'].to_numpy()
+    return lambda: esmf.calc_corners(xc, yc)
+
+def _get_time_range(files, workdir):
+    from ..data import shared
+    input_files = [os.path.basename(files['hrrr'])]
+    run_dir = os.path.dirname(files['hrrr'])
+    return lambda: shared.get_time_range(input_files, run_dir)
+
+# Benchmark cases, case type defines the synthetic input (mesh or forcing)
+CASES = {
+    'parse_hgrid': ('mesh', _parse_hgrid),
+    'read_hgrid': ('mesh', _read_hgrid),
+    'read_hgrid_boundaries': ('mesh', _read_hgrid_boundaries),
+    'gen_gr3.execute': ('mesh', _gen_gr3),
+    'mesh_index.build': ('mesh', _build_mesh_index),
+    'mesh_index.locate': ('mesh', _locate),
+    'gen_partition.rcb': ('mesh', _partition),
+    'parse_vgrid': ('mesh', _parse_vgrid),
+    'create_elev2d_th_nc': ('mesh', _create_elev2d_th_nc),
+    'create_grid_definition.hrrr': ('forcing', _create_grid_definition('hrrr')),
+    'create_grid_definition.gfs': ('forcing', _create_grid_definition('gfs')),
+    'calc_corners': ('forcing', _calc_corners),
+    'get_time_range': ('forcing', _get_time_range),
+}
+
+def run_case(name, files, workdir, repeat=1, warmup=1):
+    """
+    Runs benchmark case and returns its best wall time and peak memory
+    It is expected to run in a fresh process, so memory is not affected by other cases
+    Warm-up runs are not measured, they exclude one-time costs like lazy imports
+    """
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        func = CASES[name][1](files, workdir)
+    except ImportError as ie:
+        return {'status': 'skipped', 'reason': str(ie)}
+    except SystemExit as e:
+        # Utilities exit if their dependencies could not be imported
+        return {'status': 'skipped', 'reason': repr(e)}
+    try:
+        for i in range(warmup):
+            func()
+    except (Exception, SystemExit) as e:
+        return {'status': 'failed', 'reason': repr(e)}
+    profiler = Profiler(interval=0.01)
+    wall_time = []
+    cpu_time = []
+    peak_rss = 0
+    peak_increase = 0
+    for i in range(repeat):
+        gc.collect()
+        start_rss = profiler.rss()
+        try:
+            with profiler.section(name) as record:
+                func()
+        except (Exception, SystemExit) as e:
+            return {'status': 'failed', 'reason': repr(e)}
+        wall_time.append(record['wall_time'])
+        cpu_time.append(record['cpu_time_process'])
+        peak_rss = max(peak_rss, record['peak_rss'])
+        peak_increase = max(peak_increase, record['peak_rss']-start_rss)
+    return {
+        'status': 'ok',
+        'repeat': repeat,
+        'warmup': warmup,
+        'wall_time': min(wall_time),
+        'wall_time_mean': sum(wall_time)/len(wall_time),
+        'cpu_time': min(cpu_time),
+        'peak_rss': peak_rss,
+        'peak_rss_increase': peak_increase,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+    }
+
+def run_isolated(name, files, workdir, repeat=1, warmup=1):
+    """
+    Runs benchmark case in a new process
+    The process uses an empty cache directory, so cases are not affected by the caches of
+    earlier runs and do not write to the user cache
+    """
+    ctx = multiprocessing.get_context('spawn')
+    cache_dir = tempfile.mkdtemp(prefix='bench_cache_')
+    previous = os.environ.get('COASTAL_CACHE_DIR')
+    os.environ['COASTAL_CACHE_DIR'] = cache_dir
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            result = executor.submit(run_case, name, files, workdir, repeat, warmup).result()
+    except BrokenProcessPool as e:
+        result = {'status': 'failed', 'reason': repr(e)}
+    finally:
+        if previous is None:
+            del os.environ['COASTAL_CACHE_DIR']
+        else:
+            os.environ['COASTAL_CACHE_DIR'] = previous
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def import_time(modules, cwd=None, top=10):
+    """
+    Measures import time of given modules in a new interpreter using python -X importtime
+    """
+    cmd = [sys.executable, '-X', 'importtime', '-c', '; '.join(f'import {m}' for m in modules)]
+    proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'status': 'failed', 'reason': lines[-1] if lines else 'exit code {}'.format(proc.returncode)}
+    # Lines are in the form of 'import time: self [us] | cumulative | imported package'
+    total = 0
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        cumulative[name.strip()] = int(cumulative_us)/1.0e6
+    slowest = sorted(cumulative.items(), key=lambda x: x[1], reverse=True)[:top]
+    return {
+        'status': 'ok',
+        'wall_time': total/1.0e6,
+        'modules': len(cumulative),
+        'slowest': dict(slowest)
+    }
+
+def case_key(name, **params):
+    """
+    Returns key used to store the result of a case in the baseline
+    """
+    return '{}[{}]'.format(name, ','.join('{}={}'.format(k, v) for k, v in params.items()))
+
+def metadata():
+    """
+    Returns information about the environment benchmarks run
+    """
+    meta = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'versions': {}
+    }
+    for module in ['numpy', 'xarray', 'netCDF4', 'pyschism', 'uwtools']:
+        try:
+            meta['versions'][module] = __import__(module).__version__
+        except (ImportError, AttributeError):
+            meta['versions'][module] = None
+    return meta
+
+def write_baseline(filename, results):
+    """
+    Writes benchmark results to JSON file
+    """
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({'metadata': metadata(), 'results': results}, f, indent=2, sort_keys=True)
+    logging.info('Benchmark results are written to %s', filename)
+    return filename
+
+def compare(old, new, threshold=0.1):
+    """
+    Compares two sets of benchmark results
+    Returns rows of (key, metric, old, new, ratio, regression flag)
+    """
+    rows = []
+    for key in sorted(set(old.keys()) | set(new.keys())):
+        a = old.get(key, {})
+        b = new.get(key, {})
+        if a.get('status') != 'ok' or b.get('status') != 'ok':
+            rows.append((key, 'status', a.get('status', 'missing'), b.get('status', 'missing'), None, False))
+            continue
+        for metric in ['wall_time', 'peak_rss_increase']:
+            if not metric in a or not metric in b:
+                continue
+            ratio = b[metric]/a[metric] if a[metric] else None
+            rows.append((key, metric, a[metric], b[metric], ratio, ratio is not None and ratio > 1.0+threshold))
+    return rows
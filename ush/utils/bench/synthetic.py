@@ -0,0 +1,152 @@
+import os
+import math
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+
+def mesh_shape(nnodes):
+    """
+    Returns number of nodes in x and y directions for a structured mesh that has about nnodes nodes
+    """
+    nx = max(2, int(math.ceil(math.sqrt(nnodes))))
+    ny = max(2, int(math.ceil(nnodes/nx)))
+    return nx, ny
+
+def write_hgrid(filename, nnodes, open_boundaries=1, extent=[-74.0, 39.0, -71.0, 41.0]):
+    """
+    Writes synthetic SCHISM horizontal grid (hgrid.gr3) with triangular elements
+    The southern edge is split into open boundary segments, the rest of the domain edge is land
+    """
+    nx, ny = mesh_shape(nnodes)
+    min_lon, min_lat, max_lon, max_lat = extent
+    lon, lat = np.meshgrid(np.linspace(min_lon, max_lon, nx), np.linspace(min_lat, max_lat, ny))
+    # Depth increases towards the open boundary
+    depth = 1.0+99.0*(1.0-(lat-min_lat)/(max_lat-min_lat))
+    np_ = nx*ny
+
+    # Two triangles for each quad, counter-clockwise
+    ids = np.arange(1, np_+1).reshape(ny, nx)
+    ll = ids[:-1,:-1].ravel()
+    lr = ids[:-1,1:].ravel()
+    ur = ids[1:,1:].ravel()
+    ul = ids[1:,:-1].ravel()
+    elements = np.concatenate([np.c_[ll, lr, ur], np.c_[ll, ur, ul]])
+    ne = elements.shape[0]
+
+    # Boundaries
+    south = ids[0,:]
+    segments = np.array_split(south, max(1, open_boundaries))
+    land = np.concatenate([ids[:,-1], ids[-1,::-1][1:], ids[::-1,0][1:]])
+
+    logging.info('Writing synthetic hgrid with %d nodes and %d elements to %s', np_, ne, filename)
+    with open(filename, 'w') as f:
+        f.write('synthetic hgrid {}x{}\n'.format(nx, ny))
+        f.write('{} {}\n'.format(ne, np_))
+        np.savetxt(f, np.c_[ids.ravel(), lon.ravel(), lat.ravel(), depth.ravel()], fmt='%d %.8f %.8f %.4f')
+        np.savetxt(f, np.c_[np.arange(1, ne+1), np.full(ne, 3), elements], fmt='%d')
+        f.write('{} = Number of open boundaries\n'.format(len(segments)))
+        f.write('{} = Total number of open boundary nodes\n'.format(sum(len(s) for s in segments)))
+        for i, segment in enumerate(segments):
+            f.write('{} = Number of nodes for open boundary {}\n'.format(len(segment), i+1))
+            np.savetxt(f, segment, fmt='%d')
+        f.write('1 = Number of land boundaries\n')
+        f.write('{} = Total number of land boundary nodes\n'.format(len(land)))
+        f.write('{} 0 = Number of nodes for land boundary 1\n'.format(len(land)))
+        np.savetxt(f, land, fmt='%d')
+    return filename
+
+def write_vgrid(filename, nnodes, nvrt=20, ivcor=1):
+    """
+    Writes synthetic SCHISM vertical grid (vgrid.in), LSC2 (ivcor=1) or SZ (ivcor=2)
+    """
+    nx, ny = mesh_shape(nnodes)
+    np_ = nx*ny
+    with open(filename, 'w') as f:
+        if ivcor == 1:
+            # All nodes use all levels
+            f.write('1 !ivcor\n')
+            f.write('{} !nvrt\n'.format(nvrt))
+            sigma = np.linspace(-1.0, 0.0, nvrt)
+            kbp = np.ones(np_, dtype=int)
+            data = np.c_[np.arange(1, np_+1), kbp, np.tile(sigma, (np_, 1))]
+            np.savetxt(f, data, fmt=['%d', '%d']+['%.6f']*nvrt)
+        else:
+            # Pure S levels below a single Z level
+            f.write('2 !ivcor\n')
+            f.write('{} 1 10000. !nvrt, kz, h_s\n'.format(nvrt))
+            f.write('Z levels\n')
+            f.write('1 -10000.\n')
+            f.write('S levels\n')
+            f.write('30. 0.7 5. !h_c, theta_b, theta_f\n')
+            for k, s in enumerate(np.linspace(-1.0, 0.0, nvrt)):
+                f.write('{} {:.6f}\n'.format(k+1, s))
+    return filename
+
+def write_forcing(filename, nx, ny, ntimes=25, kind='hrrr', start=datetime(2008, 8, 23), interval=timedelta(hours=1), extent=[280.0, 37.0, 294.0, 43.0]):
+    """
+    Writes synthetic atmospheric forcing file that looks like the files created from HRRR (curvilinear) or GFS (regular) data
+    """
+    import xarray as xr
+    min_lon, min_lat, max_lon, max_lat = extent
+    times = np.array([np.datetime64(start+i*interval) for i in range(ntimes)])
+    rng = np.random.default_rng(0)
+    shape = (ntimes, ny, nx)
+    if kind == 'hrrr':
+        # Slightly rotated curvilinear grid
+        x, y = np.meshgrid(np.linspace(0.0, 1.0, nx), np.linspace(0.0, 1.0, ny))
+        lon = min_lon+(max_lon-min_lon)*x+0.5*y
+        lat = min_lat+(max_lat-min_lat)*y+0.2*x
+        coords = {'time': times, 'latitude': (('y', 'x'), lat), 'longitude': (('y', 'x'), lon)}
+        dims = ('time', 'y', 'x')
+        pres = 'mslma'
+    else:
+        coords = {'time': times, 'latitude': np.linspace(max_lat, min_lat, ny), 'longitude': np.linspace(min_lon, max_lon, nx)}
+        dims = ('time', 'latitude', 'longitude')
+        pres = 'prmsl'
+    ds = xr.Dataset(
+        {
+            'u10': (dims, rng.normal(0.0, 5.0, shape).astype(np.float32)),
+            'v10': (dims, rng.normal(0.0, 5.0, shape).astype(np.float32)),
+            pres: (dims, rng.normal(101325.0, 500.0, shape).astype(np.float32)),
+        },
+        coords=coords)
+    ds.to_netcdf(filename)
+    return filename
+
+def write_elev_th(filename, ntimes=145, interval=600.0):
+    """
+    Writes synthetic elevation time series (elev.th) used by time-elev boundary mode
+    """
+    t = np.arange(ntimes)*interval
+    np.savetxt(filename, np.c_[t, 0.5*np.sin(2.0*np.pi*t/44712.0)], fmt='%.1f %.6f')
+    return filename
+
+def create_mesh(output_dir, nnodes, open_boundaries=1, nvrt=20):
+    """
+    Creates synthetic grid files (hgrid.gr3, vgrid.in, elev.th) for a benchmark case, existing files are reused
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = {
+        'hgrid': os.path.join(output_dir, 'hgrid.gr3'),
+        'vgrid': os.path.join(output_dir, 'vgrid.in'),
+        'elev_th': os.path.join(output_dir, 'elev.th')
+    }
+    if not os.path.isfile(files['hgrid']):
+        write_hgrid(files['hgrid'], nnodes, open_boundaries=open_boundaries)
+    if not os.path.isfile(files['vgrid']):
+        write_vgrid(files['vgrid'], nnodes, nvrt=nvrt)
+    if not os.path.isfile(files['elev_th']):
+        write_elev_th(files['elev_th'])
+    return files
+
+def create_forcing(output_dir, nx, ny, ntimes=25):
+    """
+    Creates synthetic HRRR and GFS like forcing files for a benchmark case, existing files are reused
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = {}
+    for kind in ['hrrr', 'gfs']:
+        files[kind] = os.path.join(output_dir, f'{kind}.nc')
+        if not os.path.isfile(files[kind]):
+            write_forcing(files[kind], nx, ny, ntimes=ntimes, kind=kind)
+    return files
@@ -0,0 +1,135 @@
+import os
+import hashlib
+import logging
+from copy import deepcopy
+from . import get_herbie
+from . import get_input
+from . import shared
+from ..staging import stage_file
+
+def shared_config(cfg, data_dir):
+    """
+    Returns stream configuration that writes its files to the shared data directory of the campaign
+    """
+    cfg = deepcopy(cfg)
+    cfg['data']['target_directory'] = data_dir
+    cfg['stream_data_files'] = [os.path.join(data_dir, os.path.basename(fn)) for fn in cfg['stream_data_files']]
+    return cfg
+
+def union_dates(cfg, cycles):
+    """
+    Returns dates retrieved by any of the cycles and dates of each cycle
+    """
+    dates = {cycle: get_herbie.options(cfg, cycle)[4] for cycle in cycles}
+    return sorted(set(date for dl in dates.values() for date in dl)), dates
+
+def slice_cycles(combined, positions, outputs, variables=None, pack=False):
+    """
+    Writes records of each cycle from the combined file to the stream file of the cycle
+    Existing stream files are only kept if they are newer than the combined file
+    """
+    import xarray as xr
+
+    mtime = os.stat(combined).st_mtime_ns
+    with xr.open_dataset(combined, engine='netcdf4') as ds:
+        for ofile, idxs in zip(outputs, positions):
+            if os.path.isfile(ofile) and os.stat(ofile).st_mtime_ns >= mtime:
+                continue
+            os.makedirs(os.path.dirname(ofile), exist_ok=True)
+            tmp = '{}.{}.tmp'.format(ofile, os.getpid())
+            piece = ds.isel(time=idxs)
+            if variables:
+                piece = shared.finalize(piece, variables, pack=pack)
+            piece.to_netcdf(tmp)
+            os.replace(tmp, ofile)
+            logging.info('Created %s with %d records', ofile, len(idxs))
+
+def herbie_stream(cfgs, data_dir, bbox=None):
+    """
+    Retrieves each hour needed by the cycles once, combines them to a single file and writes the
+    records of each cycle to its stream file
+    """
+    cycles = list(cfgs.keys())
+    cfg = shared_config(cfgs[cycles[0]], data_dir)
+    overwrite, combine, source, fxx, _ = get_herbie.options(cfg, cycles[0])
+    dates, cycle_dates = union_dates(cfg, cycles)
+    logging.info('Retrieving %d hours for %d cycles', len(dates), len(cycles))
+    files = get_herbie.retrieve(cfg, source, fxx, overwrite, dates, bbox)
+
+    # Single combined file of the campaign, records are in date order
+    available = [date for date in dates if date in files.keys()]
+    store, chunks, workers = shared.combine_options(cfg)
+    variables, pack = shared.finalize_options(cfg)
+    # Name depends on the dates, so the file is created again if the campaign is extended
+    h = hashlib.blake2b(','.join(available).encode('utf-8'), digest_size=8).hexdigest()
+    combined = os.path.join(data_dir, 'campaign_{}_{}'.format(h, os.path.basename(cfg['stream_data_files'][0])))
+    # Cycles are sliced from the combined netCDF file, the zarr store (if it is used) is only an intermediate step
+    if not os.path.isfile(combined):
+        shared.combine([files[date] for date in available], combined, store=store, chunks=chunks, workers=workers)
+
+    # Records of each cycle, the cycles with missing hours are left to the regular retrieval
+    positions, outputs = [], []
+    position = {date: i for i, date in enumerate(available)}
+    for cycle in cycles:
+        missing = [date for date in cycle_dates[cycle] if not date in files.keys()]
+        if missing:
+            logging.warning('Data for %s is not complete, missing %s', cycle, ', '.join(missing))
+            continue
+        positions.append([position[date] for date in cycle_dates[cycle]])
+        outputs.append(cfgs[cycle]['stream_data_files'][0])
+    slice_cycles(combined, positions, outputs, variables=variables, pack=pack)
+    return outputs
+
+def static_stream(cfgs, data_dir, bbox=None):
+    """
+    Retrieves files of the stream that does not depend on cycle once and stages them to the cycles
+    """
+    cycles = list(cfgs.keys())
+    cfg = shared_config(cfgs[cycles[0]], data_dir)
+    if not all(os.path.isfile(fn) for fn in cfg['stream_data_files']):
+        get_input.download(cfg, cycles[0], bbox=bbox)
+    outputs = []
+    for cycle in cycles:
+        for src, dst in zip(cfg['stream_data_files'], cfgs[cycle]['stream_data_files']):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            stage_file(src, dst)
+            outputs.append(dst)
+    return outputs
+
+def share_meshes(base, streams):
+    """
+    Stages ESMF mesh files of the base cycle's streams, the source grids do not change between cycles
+    """
+    staged = []
+    for comp in streams.keys():
+        for key, cfg in streams[comp].items():
+            src = base[comp][key]['stream_mesh_file']
+            dst = cfg['stream_mesh_file']
+            if os.path.isfile(src) and os.path.abspath(src) != os.path.abspath(dst):
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                stage_file(src, dst)
+                staged.append(dst)
+    return staged
+
+def provision_forcing(streams, data_dir, bbox=None):
+    """
+    Retrieves forcing data of all cycles, streams is the configuration of the streams for each cycle
+    Returns list of created stream files
+    """
+    cycles = sorted(streams.keys())
+    outputs = []
+    first = streams[cycles[0]]
+    for comp in first.keys():
+        for key, cfg in first[comp].items():
+            subset = False
+            if 'subset' in cfg['data'].keys():
+                subset = cfg['data']['subset']
+            cfgs = {cycle: streams[cycle][comp][key] for cycle in cycles}
+            stream_dir = os.path.join(data_dir, comp, key)
+            os.makedirs(stream_dir, exist_ok=True)
+            logging.info('Retrieving forcing data for %s and %s for %d cycles', comp, key, len(cycles))
+            if cfg['data']['protocol'] == 'herbie':
+                outputs += herbie_stream(cfgs, stream_dir, bbox=bbox if subset else None)
+            else:
+                outputs += static_stream(cfgs, stream_dir, bbox=bbox if subset else None)
+    return outputs
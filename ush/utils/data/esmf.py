@@ -4,9 +4,6 @@ try:
     import os
     import sys
     import numpy as np
-    import xarray as xr
-    import dask.array as da
-    import dask.dataframe as dd
     import subprocess
     from datetime import datetime
 except ImportError as ie:
@@ -17,6 +14,8 @@ def create_grid_definition(input_file, output_file='mesh.nc', mask_var=None, ff=
     """
     Create grid definition file in SCRIP or ESMF Mesh format
     """
+    import xarray as xr
+
     # Open input file
     if os.path.isfile(input_file):
         ds = xr.open_dataset(input_file, mask_and_scale=False, decode_times=False)
@@ -86,6 +85,7 @@ def to_scrip(xc, yc, xo, yo, mc, dims, output_file='scrip.nc', output_dir='./'):
     """
     Writes grid in SCRIP format
     """
+    import xarray as xr
 
     # Create new dataset in SCRIP format
     out = xr.Dataset()
@@ -111,7 +111,9 @@ def to_scrip(xc, yc, xo, yo, mc, dims, output_file='scrip.nc', output_dir='./'):
 
     # Write dataset
     ofile = os.path.join(output_dir, output_file)
-    out.to_netcdf(ofile)
+    tmp = '{}.{}.tmp'.format(ofile, os.getpid())
+    out.to_netcdf(tmp)
+    os.replace(tmp, ofile)
     return(ofile)
 
 def scrip_to_mesh(input_file, output_file='mesh.nc', output_dir='./'):
@@ -133,9 +135,11 @@ def scrip_to_mesh(input_file, output_file='mesh.nc', output_dir='./'):
             if bindir:
                 exe = Path(bindir[0], 'ESMF_Scrip2Unstruct')
                 log = Path(ofile).parent / "mesh.log"
+                # Existing mesh might be hard linked to the mesh of other members, it is not written in place
+                if os.path.lexists(ofile):
+                    os.remove(ofile)
                 cmd = f"{exe} {input_file} {ofile} 0 >{log} 2>&1"                
-                #logging.debug("Running: %s", cmd)
-                print("Running: %s", cmd)
+                logging.info("Running: %s", cmd)
                 result = subprocess.check_call(cmd, cwd=Path(ofile).parent, shell=True)
 
     return(ofile)
@@ -1,18 +1,31 @@
 import os
 import sys
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from datetime import timedelta
-from herbie import Herbie
 import numpy as np
-import xarray as xr
 import logging
+from . import shared
+from .journal import Journal, merge_ranges
+from ..staging import stage_file
 import warnings
 
 warnings.filterwarnings('ignore')
 EPSILON = timedelta(seconds=5)
+# Directory used to keep cfgrib index files, they are not written next to the data
+CACHE_DIR = os.environ.get('COASTAL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ufs-coastal'))
+# Fields retrieved from each source
+SEARCH = {
+    'hrrr': '(:[U|V]GRD:10 m|:MSLMA:)',
+    'gfs': '(:[U|V]GRD:10 m above ground|:PRMSL:)'
+}
 
-def download(config, cycle, bbox=[]):
-    # Check configuration and set defaults
+def options(config, cycle):
+    """
+    Returns options (overwrite, combine, source, fxx) and list of dates that will be retrieved for given cycle
+    """
     overwrite = False
     if 'overwrite' in config.keys():
         overwrite = config['overwrite']
@@ -61,82 +74,239 @@ def download(config, cycle, bbox=[]):
         logging.warning('Nothing to do! Exiting.')
         sys.exit()
 
-    logging.info('List of dates that will be retrieved: %s', ', '.join(map(str, date_list)))
+    return overwrite, combine, source, fxx, date_list
+
+def herbie_object(date, source, fxx, overwrite, output_dir):
+    """
+    Returns Herbie object for given date and source
+    """
+    from herbie import Herbie
+
+    if source == 'hrrr':
+        H = Herbie(date=date, model='hrrr', product='sfc', fxx=fxx, save_dir=output_dir, overwrite=overwrite)
+    elif source == 'gfs':
+        H = Herbie(date=date, model='gfs', product='pgrb2.0p25', fxx=fxx, save_dir=output_dir, overwrite=overwrite)
+    return H
 
-    # Loop over dates and download them
-    file_set = set()
+def cached_output_file(date, source, output_dir):
+    """
+    Returns name of the netCDF file that would be created for given date, without contacting Herbie
+    Herbie stores files under save_dir/model/YYYYMMDD
+    """
+    day = datetime.strptime(date, '%Y-%m-%d %H:%M').strftime('%Y%m%d')
+    return output_file(os.path.join(output_dir, source, day, 'grib'), date)
+
+def output_file(lfile, date):
+    """
+    Returns name of the netCDF file created from the downloaded GRIB file
+    """
+    dirname = os.path.dirname(lfile)
+    return os.path.join(dirname, datetime.strptime(date, '%Y-%m-%d %H:%M').strftime('%Y%m%d_%Hz') + '.nc')
+
+def plan(config, cycle, bbox=[]):
+    """
+    Returns remote objects that would be retrieved for given cycle, nothing is downloaded
+    The sizes are found from the byte ranges of the requested fields in the index files
+    """
+    overwrite, combine, source, fxx, date_list = options(config, cycle)
+    searchString = SEARCH[source]
+    objects = []
     for date in date_list:
-        logging.info("Getting data for %s", date)
+        obj = {'date': date, 'url': None, 'local': None, 'size': None, 'cached': False}
         try:
-            target_directory = config['data']['target_directory']
-            ofile = get(date, source, fxx, bbox, overwrite, target_directory)
-            file_set.add(ofile)
+            H = herbie_object(date, source, fxx, False, config['data']['target_directory'])
+            if H.grib is None:
+                obj['status'] = 'missing'
+                objects.append(obj)
+                continue
+            obj['url'] = str(H.grib)
+            obj['local'] = output_file(str(H.get_localFilePath(searchString)), date)
+            obj['cached'] = os.path.isfile(obj['local']) and not overwrite
+            # The last field in the index does not have end byte, its size is unknown
+            inv = H.inventory(searchString)
+            if len(inv) > 0 and not inv['end_byte'].isnull().any():
+                obj['size'] = int((inv['end_byte']-inv['start_byte']+1).sum())
+            obj['status'] = 'ok'
         except Exception as ex:
-            logging.error('Download failed for %s: %s', date, str(ex))
+            obj['status'] = 'error'
+            obj['reason'] = str(ex)
+        objects.append(obj)
+    return objects
+
+def download(config, cycle, bbox=[]):
+    # Check configuration and set defaults
+    overwrite, combine, source, fxx, date_list = options(config, cycle)
+
+    # Nothing to retrieve if combined file is already created (or prefetched)
+    if combine and not overwrite:
+        cached = shared.cycle_cache_file(config['data']['target_directory'], cycle, config['stream_data_files'][0])
+        if not os.path.isfile(config['stream_data_files'][0]) and os.path.isfile(cached):
+            logging.info('Using %s combined by prefetch.', cached)
+            stage_file(cached, config['stream_data_files'][0])
+        if os.path.isfile(config['stream_data_files'][0]):
+            logging.info('Skip retrieving data since %s is already created.', config['stream_data_files'][0])
+            return
+
+    logging.info('List of dates that will be retrieved: %s', ', '.join(map(str, date_list)))
+
+    # Download and decode files
+    files = retrieve(config, source, fxx, overwrite, date_list, bbox)
 
-    # Combine files
-    file_list = list(file_set)
-    file_list.sort()
+    # Combine files, only if all of them are retrieved completely
+    file_list = sorted(set(files.values()))
     if combine:
+        missing = [date for date in date_list if not date in files.keys()]
+        if missing:
+            logging.error('Data for %s could not be retrieved, run again to resume retrieval.', ', '.join(missing))
+            sys.exit()
+        journal = Journal(config['data']['target_directory'])
+        incomplete = [fn for fn in file_list if not journal.verify(fn)]
+        if incomplete:
+            logging.error('Files %s are not complete, they are not combined.', ', '.join(incomplete))
+            sys.exit()
         if not os.path.isfile(config['stream_data_files'][0]):
-            logging.info('List of files that will be combined: %s', ' '.join(map(str, file_list)))
-            ds = xr.open_mfdataset(file_list, combine='nested', concat_dim='time', coords='minimal', compat='override', engine='netcdf4')
-            ds.to_netcdf(config['stream_data_files'][0])
+            store, chunks, workers = shared.combine_options(config)
+            variables, pack = shared.finalize_options(config)
+            shared.combine(file_list, config['stream_data_files'][0], store=store, chunks=chunks, workers=workers, variables=variables, pack=pack)
         else:
             logging.info('Skip combining files since %s is already created.', config['stream_data_files'][0])
 
-def get(date, source, fxx, bbox, overwrite, output_dir):
-    # Create object
-    if source == 'hrrr':
-        H = Herbie(date=date, model='hrrr', product='sfc', fxx=fxx, save_dir=output_dir, overwrite=overwrite)
-    elif source == 'gfs':
-        H = Herbie(date=date, model='gfs', product='pgrb2.0p25', fxx=fxx, save_dir=output_dir, overwrite=overwrite)
+def retrieve(config, source, fxx, overwrite, date_list, bbox=[]):
+    """
+    Downloads and decodes data for given dates, returns netCDF file of each date
+    """
+    # Number of source grid cells added around the bounding box
+    halo = 1
+    if 'halo' in config['data'].keys():
+        halo = config['data']['halo']
+
+    # Variables that are decoded, the variables of the stream are decoded by default
+    variables = None
+    if 'stream_data_variables' in config.keys():
+        variables = shared.stream_variables(config['stream_data_variables'])
+    if 'variables' in config['data'].keys():
+        variables = config['data']['variables']
+
+    # Number of processes used to decode GRIB files
+    decoders = 2
+    if 'decoders' in config['data'].keys():
+        decoders = config['data']['decoders']
+
+    # Loop over dates and download them, files are decoded in the pool while the next ones are downloaded
+    # Retrieved files are recorded in the journal of the target directory, so retrieval resumes if it is interrupted
+    files = {}
+    target_directory = config['data']['target_directory']
+    journal = Journal(target_directory)
+    with ProcessPoolExecutor(max_workers=decoders, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {}
+        for date in date_list:
+            logging.info("Getting data for %s", date)
+            try:
+                lfile, ofile = fetch(date, source, fxx, overwrite, target_directory, journal=journal)
+                if lfile is None:
+                    # Files created before the journal is used are recorded as they are
+                    if journal.get(ofile) is None:
+                        journal.complete(ofile)
+                    files[date] = ofile
+                else:
+                    futures[executor.submit(decode, lfile, ofile, bbox, halo=halo, variables=variables, overwrite=overwrite)] = date
+            except Exception as ex:
+                logging.error('Download failed for %s: %s', date, str(ex))
+        for future in as_completed(futures):
+            try:
+                files[futures[future]] = future.result()
+                journal.complete(files[futures[future]])
+            except Exception as ex:
+                logging.error('Decoding failed for %s: %s', futures[future], str(ex))
+
+    return files
 
-    # Set search string
-    searchString = '(:[U|V]GRD:10 m|:MSLMA:)'
-    if source == 'gfs':
-        searchString = '(:[U|V]GRD:10 m above ground|:PRMSL:)'
+def get(date, source, fxx, bbox, overwrite, output_dir, halo=1, variables=None):
+    """
+    Downloads and decodes data for given date, returns name of the netCDF file
+    """
+    lfile, ofile = fetch(date, source, fxx, overwrite, output_dir)
+    if lfile is None:
+        return ofile
+    return decode(lfile, ofile, bbox, halo=halo, variables=variables, overwrite=overwrite)
+
+def fetch(date, source, fxx, overwrite, output_dir, journal=None):
+    """
+    Downloads GRIB file for given date, the byte ranges of the requested fields are downloaded
+    and partially downloaded files recorded in the journal are resumed
+    Returns names of the GRIB file (None if the netCDF file is already created) and netCDF file
+    """
+    if journal is None:
+        journal = Journal(output_dir)
+
+    # Skip contacting Herbie if the file is already created (i.e. by prefetch) and not changed since then
+    ofile = cached_output_file(date, source, output_dir)
+    if os.path.isfile(ofile) and not overwrite:
+        if journal.get(ofile) is None or journal.verify(ofile):
+            logging.info('Using existing file %s', ofile)
+            return None, ofile
+        logging.warning('%s is changed since it is created, it will be created again', ofile)
+        os.remove(ofile)
+
+    # Create object
+    H = herbie_object(date, source, fxx, overwrite, output_dir)
+    searchString = SEARCH[source]
 
     # Download data
-    if (H.find_grib() is not None):
-        lfile = H.download(search=searchString, overwrite=overwrite)
-    else:
+    if (H.find_grib() is None):
         logging.error('Requested file could not found! Exiting')
         sys.exit()
+    lfile = str(H.get_localFilePath(searchString))
+    if overwrite or not journal.verify(lfile):
+        url = str(H.grib)
+        if url.startswith('http'):
+            # The last field in the index does not have end byte, it is read to the end of the file
+            inv = H.inventory(searchString)
+            ranges = [(int(start), None if np.isnan(end) else int(end)) for start, end in zip(inv['start_byte'], inv['end_byte'])]
+            journal.download(url, lfile, merge_ranges(ranges))
+        else:
+            lfile = str(H.download(search=searchString, overwrite=overwrite))
+            journal.complete(lfile, url=url)
+    else:
+        logging.info('Using existing file %s', lfile)
+    return lfile, output_file(lfile, date)
+
+def index_file(lfile):
+    """
+    Returns cfgrib index path template for given GRIB file in the cache directory
+    The name depends on the path, size and modification time of the file, so the index is created again if file changes
+    """
+    st = os.stat(lfile)
+    h = hashlib.blake2b(digest_size=16)
+    h.update('{}:{}:{}'.format(os.path.realpath(lfile), st.st_size, st.st_mtime_ns).encode('utf-8'))
+    return os.path.join(CACHE_DIR, 'cfgrib', h.hexdigest()+'.{short_hash}.idx')
+
+def decode(lfile, ofile, bbox, halo=1, variables=None, overwrite=False):
+    """
+    Decodes GRIB file and writes requested variables (subset if bounding box is given) to netCDF file
+    It runs in a separate process, only the names of the files are passed
+    """
+    import xarray as xr
 
     # Check the file and subset it if it is requested
     if os.path.isfile(lfile):
-        dirname = os.path.dirname(lfile)
-        ofile = os.path.join(dirname, datetime.strptime(date, '%Y-%m-%d %H:%M').strftime('%Y%m%d_%Hz') + '.nc')
         if not os.path.isfile(ofile) or overwrite:
-            # Load data
-            ds = xr.open_dataset(lfile, engine='cfgrib')
-            # Subset it if it is requested
+            # Load data, values are only decoded when they are written
+            os.makedirs(os.path.join(CACHE_DIR, 'cfgrib'), exist_ok=True)
+            ds = xr.open_dataset(lfile, engine='cfgrib', backend_kwargs={'indexpath': index_file(lfile)})
+            if variables:
+                missing = [v for v in variables if not v in ds.data_vars]
+                if missing:
+                    logging.warning('Variables %s are not found in %s', ', '.join(missing), lfile)
+                ds = ds[[v for v in variables if v in ds.data_vars]]
+            # Subset it if it is requested, only the window that covers the box is written
             if bbox:
-                # Create mask based on given box and coordinates
-                min_lon, min_lat, max_lon, max_lat = bbox
-                logging.info('Subset data using bounding box: min_lon = %f, min_lat = %f, max_lon = %f, max_lat = %f', min_lon, min_lat, max_lon, max_lat)
-                if 'lat' in ds.coords:
-                    lat = ds['lat']
-                elif 'latitude' in  ds.coords:
-                    lat = ds['latitude']
-                if 'lon' in ds.coords:
-                    lon = ds['lon']
-                elif 'longitude' in ds.coords:
-                    lon = ds['longitude']
-                mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
-
-                # Find indexes that match with given mask and modify mask
-                indx = np.argwhere(mask.values)
-                istart = indx[:,0].min()-1
-                iend = indx[:,0].max()+1
-                jstart = indx[:,1].min()-1
-                jend = indx[:,1].max()+1
-                mask[istart:iend+1,jstart:jend+1] = True
-
-                # Subset data and write to a new file
-                clipped_ds = ds.where(mask, drop=True)
-                clipped_ds.to_netcdf(ofile)
+                ds = shared.subset(ds, bbox, halo=halo)
+            # Write to temporary file first, the file might be used by other runs (i.e. prefetch)
+            tmp = '{}.{}.tmp'.format(ofile, os.getpid())
+            ds.to_netcdf(tmp)
+            ds.close()
+            os.replace(tmp, ofile)
 
     return ofile
 
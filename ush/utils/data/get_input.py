@@ -1,20 +1,32 @@
 import sys
 import logging
-from . import get_herbie
-from . import get_wget
-from . import get_s3
+import importlib
+
+# Modules that implement the protocols, they are only imported when they are used
+PROTOCOLS = {
+    'herbie': 'get_herbie',
+    'wget': 'get_wget',
+    's3': 'get_s3'
+}
 
 def download(config, cycle, bbox=None):
     """
     Generic wrapper for downloading data.
     """
     protocol = config['data']['protocol']
-    if protocol == 'herbie':
-        get_herbie.download(config, cycle, bbox=bbox)
-    elif protocol == 'wget':
-        get_wget.download(config, cycle, bbox=bbox)
-    elif protocol == 's3':
-        get_s3.download(config, cycle, bbox=bbox)
-    else:
+    if not protocol in PROTOCOLS.keys():
+        logging.error("Given protocol %s is not supported!", protocol)
+        sys.exit()
+    module = importlib.import_module('.'+PROTOCOLS[protocol], __package__)
+    module.download(config, cycle, bbox=bbox)
+
+def plan(config, cycle, bbox=None):
+    """
+    Generic wrapper for listing remote objects that would be downloaded.
+    """
+    protocol = config['data']['protocol']
+    if not protocol in PROTOCOLS.keys():
         logging.error("Given protocol %s is not supported!", protocol)
         sys.exit()
+    module = importlib.import_module('.'+PROTOCOLS[protocol], __package__)
+    return module.plan(config, cycle, bbox=bbox)
@@ -1,13 +1,7 @@
 import os
+import sys
 import warnings
 import logging
-try:
-    import boto3
-    import botocore.exceptions
-    from botocore import UNSIGNED
-    from botocore.client import Config
-except ImportError:
-    logging.error('Module boto3 not found.')
 try:
     import hashlib
 except ImportError:
@@ -20,12 +14,22 @@ except ImportError:
 
 warnings.filterwarnings('ignore')
 
+def _client():
+    # Create an S3 access object, config option allows accessing anonymously
+    try:
+        import boto3
+        from botocore import UNSIGNED
+        from botocore.client import Config
+    except ImportError:
+        logging.error('Module boto3 not found.')
+        sys.exit()
+    return boto3.client('s3', config=Config(signature_version=UNSIGNED))
+
 def download(config, cycle, bbox=[]):
     """
     Download data from S3 bucket 
     """
-    # Create an S3 access object, config option allows accessing anonymously
-    s3 = boto3.client('s3', config=Config(signature_version=UNSIGNED))
+    s3 = _client()
     # Get target directory
     target_dir = config['data']['target_directory']
     if not os.path.isdir(target_dir):
@@ -41,7 +45,7 @@ def download(config, cycle, bbox=[]):
         md5sum_remote = None
         try:
             md5sum_remote = s3.head_object(Bucket=end_point, Key=fn)['ETag'][1:-1]
-        except botocore.exceptions.ClientError as e:
+        except s3.exceptions.ClientError as e:
             logging.info('Skip checking md5sum for {} since the object does not exist in {}!'.format(fn, end_point))
             continue
         # Try to find checksum of local file
@@ -63,7 +67,6 @@ def download(config, cycle, bbox=[]):
 
 
 
-
     ## Check configuration
     #combine = True
     #print(config["data"].keys())
@@ -105,3 +108,25 @@ def download(config, cycle, bbox=[]):
     #    return([config['stream_data_files'][0]])
     #else:
     #    return(file_list)
+
+def plan(config, cycle, bbox=[]):
+    """
+    Returns remote objects that would be retrieved, sizes are found with head_object calls
+    Local files are compared by size, checksums are only computed while downloading
+    """
+    s3 = _client()
+    target_dir = config['data']['target_directory']
+    end_point = config['data']['end_point']
+    objects = []
+    for fn in config['data']['files']:
+        local_fn = os.path.join(target_dir, os.path.basename(fn))
+        obj = {'url': f's3://{end_point}/{fn}', 'local': local_fn, 'size': None, 'cached': False, 'status': 'ok'}
+        try:
+            obj['size'] = s3.head_object(Bucket=end_point, Key=fn)['ContentLength']
+        except s3.exceptions.ClientError as e:
+            obj['status'] = 'missing'
+            obj['reason'] = str(e)
+        if os.path.isfile(local_fn):
+            obj['cached'] = obj['size'] is not None and os.path.getsize(local_fn) == obj['size']
+        objects.append(obj)
+    return objects
@@ -2,34 +2,81 @@ import os
 import warnings
 import logging
 import subprocess
-import xarray as xr
+import urllib.request
 from pathlib import Path
 from . import shared
+from .journal import Journal
 
 warnings.filterwarnings('ignore')
 
+def plan(config, cycle, bbox=[]):
+    """
+    Returns remote objects that would be retrieved, sizes are found with HTTP HEAD requests
+    """
+    target_dir = config['data']['target_directory']
+    end_point = config['data']['end_point']
+    journal = Journal(target_dir)
+    objects = []
+    for fn in config['data']['files']:
+        # Same URL used by wget command
+        url = f"{end_point}:{fn}"
+        local_fn = os.path.join(target_dir, os.path.basename(fn))
+        obj = {'url': url, 'local': local_fn, 'size': None, 'cached': False, 'status': 'ok'}
+        try:
+            req = urllib.request.Request(url, method='HEAD')
+            with urllib.request.urlopen(req, timeout=30) as response:
+                length = response.headers.get('Content-Length')
+                if length is not None:
+                    obj['size'] = int(length)
+        except Exception as ex:
+            obj['status'] = 'error'
+            obj['reason'] = str(ex)
+        # Only files recorded as complete in the journal are not transferred again
+        obj['cached'] = journal.verify(local_fn)
+        objects.append(obj)
+    return objects
+
 def download(config, cycle, bbox=[]):
     """
     Download data using wget command
     """
+    import xarray as xr
+
     # Check configuration
     combine = True
-    print(config["data"].keys())
     if 'combine' in config['data'].keys():
         combine = config['data']['combine']
+    # Number of source grid cells added around the bounding box
+    halo = 1
+    if 'halo' in config['data'].keys():
+        halo = config['data']['halo']
     # Get target directory
     target_dir = config['data']['target_directory']
     if not os.path.isdir(target_dir):
         os.mkdir(target_dir)
-    # Loop over files
+    # Loop over files, retrieved files are recorded in the journal of the target directory
+    journal = Journal(target_dir)
     file_list = []
     for fn in config['data']['files']:
         local_fn = os.path.join(target_dir, os.path.basename(fn))
-        # Retrieve files with wget command
         end_point = config['data']['end_point']
-        cmd = f"wget --no-verbose --no-check-certificate -c {end_point}:{fn}"
+        url = f"{end_point}:{fn}"
+        # Skip files that are retrieved (and subset if it is required) completely and not changed since then
+        entry = journal.get(local_fn)
+        if journal.verify(local_fn) and entry.get('subset', False) == bool(bbox):
+            logging.info('Using existing file %s', local_fn)
+            file_list.append(local_fn)
+            continue
+        # Only partial downloads of the same object are continued, others (i.e. subset files) are retrieved again
+        if entry is None or entry.get('status') != 'partial' or entry.get('url') != url:
+            if os.path.isfile(local_fn):
+                os.remove(local_fn)
+            journal.start(local_fn, url=url)
+        # Retrieve files with wget command
+        cmd = f"wget --no-verbose --no-check-certificate -c {url}"
         logging.debug("Running: %s", cmd)
         result = subprocess.check_call(cmd, cwd=Path(local_fn).parent, shell=True)
+        journal.complete(local_fn, url=url, subset=False)
         # Subset file if it is required
         if bbox:
             # Open dataset
@@ -37,19 +84,20 @@ def download(config, cycle, bbox=[]):
             engine = 'cfgrib' if ext == '.grb' or ext == '.grib' else 'netcdf4'
             ds = xr.open_dataset(local_fn, engine=engine)
             # Subset data and write to a new file
-            mask = shared.bbox_mask(ds, bbox)
-            clipped_ds = ds.where(mask, drop=True)
+            clipped_ds = shared.subset(ds, bbox, halo=halo)
             ofile = local_fn.replace(ext, '_sub'.join(ext))
             clipped_ds.to_netcdf(ofile)
+            ds.close()
             os.rename(ofile, local_fn)
+            journal.complete(local_fn, url=url, subset=True)
         # Add file to list
         file_list.append(local_fn)
     # Combine files
     if combine and not os.path.exists(config['stream_data_files'][0]):
-        logging.info('List of files that will be combined: %s', ' '.join(map(str, file_list)))
         file_list.sort()
-        ds = xr.open_mfdataset(file_list, combine='nested', concat_dim='time', coords='minimal', compat='override', engine='netcdf4')
-        ds.to_netcdf(config['stream_data_files'][0])
+        store, chunks, workers = shared.combine_options(config)
+        variables, pack = shared.finalize_options(config)
+        shared.combine(file_list, config['stream_data_files'][0], store=store, chunks=chunks, workers=workers, variables=variables, pack=pack)
         return([config['stream_data_files'][0]])
     else:
         return(file_list)
@@ -0,0 +1,175 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+# Name of the journal file kept in the target directory
+JOURNAL_FILE = '.download_journal.json'
+
+# Number of bytes read at once while downloading and computing checksums
+BLOCK_SIZE = 1 << 20
+
+# Journals are updated by the threads of the same process (flock only serializes processes)
+_LOCK = threading.Lock()
+
+def checksum(filename):
+    """
+    Returns checksum (blake2b) of the file
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def merge_ranges(ranges):
+    """
+    Returns byte ranges (start and end, end is None for the rest of the file) where adjacent ranges are merged
+    """
+    merged = []
+    for start, end in ranges:
+        if merged and merged[-1][1] is not None and merged[-1][1]+1 == start:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+class Journal:
+    """
+    Download journal of a target directory, it keeps status (partial or complete), size and checksum
+    of each retrieved object, so interrupted retrievals resume where they stopped
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.filename = os.path.join(directory, JOURNAL_FILE)
+        self.entries = self._read()
+
+    def _read(self):
+        if not os.path.isfile(self.filename):
+            return {}
+        try:
+            with open(self.filename, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning('Ignoring download journal %s: %s', self.filename, str(e))
+            return {}
+
+    def _key(self, local):
+        return os.path.relpath(os.path.abspath(local), os.path.abspath(self.directory))
+
+    def _update(self, local, **entry):
+        # Journal is read, updated and written while it is locked, so entries written by other
+        # threads and processes since the journal is read are kept
+        key = self._key(local)
+        os.makedirs(self.directory, exist_ok=True)
+        with _LOCK, open(self.filename+'.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self._read()
+            entries[key] = dict(entries.get(key, self.entries.get(key, {})), **entry)
+            tmp = '{}.{}.{}.tmp'.format(self.filename, os.getpid(), threading.get_ident())
+            with open(tmp, 'w') as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.filename)
+            self.entries = entries
+
+    def get(self, local):
+        """
+        Returns entry of the file, None if it is not in the journal
+        """
+        return self.entries.get(self._key(local))
+
+    def start(self, local, url=None, size=None):
+        """
+        Records that the file is being retrieved, size is the expected size if it is known
+        """
+        self._update(local, status='partial', url=url, expected_size=size)
+
+    def complete(self, local, url=None, **info):
+        """
+        Records that the file is retrieved completely with its size and checksum
+        """
+        st = os.stat(local)
+        entry = self.get(local) or {}
+        if entry.get('expected_size') is not None and st.st_size != entry['expected_size']:
+            self._update(local, status='partial')
+            raise OSError('{} is truncated, {} of {} bytes'.format(local, st.st_size, entry['expected_size']))
+        self._update(local, status='complete', url=url or entry.get('url'), size=st.st_size, mtime_ns=st.st_mtime_ns, checksum=checksum(local), **info)
+
+    def verify(self, local):
+        """
+        Checks that the file is retrieved completely and not changed since then
+        The checksum is only computed again if the modification time of the file is changed
+        """
+        entry = self.get(local)
+        if entry is None or entry.get('status') != 'complete' or not os.path.isfile(local):
+            return False
+        st = os.stat(local)
+        if st.st_size != entry['size']:
+            return False
+        if st.st_mtime_ns == entry['mtime_ns']:
+            return True
+        if checksum(local) != entry['checksum']:
+            return False
+        self._update(local, mtime_ns=st.st_mtime_ns)
+        return True
+
+    def download(self, url, local, ranges=None, timeout=60):
+        """
+        Downloads given byte ranges (start and end, end is None for the rest of the file) of the remote object
+        to the local file, or the whole object if ranges are not given. Ranges are appended in the given order
+        and the download continues from the size of the partial file.
+        """
+        entry = self.get(local)
+        if entry is None or entry.get('status') != 'partial' or entry.get('url') != url:
+            # Files that are not started by this journal can not be resumed
+            if os.path.isfile(local):
+                os.remove(local)
+            size = None
+            if ranges and all(end is not None for _, end in ranges):
+                size = sum(end-start+1 for start, end in ranges)
+            self.start(local, url=url, size=size)
+        os.makedirs(os.path.dirname(os.path.abspath(local)), exist_ok=True)
+        done = os.path.getsize(local) if os.path.isfile(local) else 0
+        if done:
+            logging.info('Resuming %s from %d bytes', local, done)
+        with open(local, 'ab') as f:
+            offset = 0
+            for start, end in (ranges or [(0, None)]):
+                length = None if end is None else end-start+1
+                # Skip the ranges (and part of the range) that are already written
+                if length is not None and done >= offset+length:
+                    offset += length
+                    continue
+                first = start+max(done-offset, 0)
+                self._get(url, f, first, end, partial=first > 0 or end is not None, timeout=timeout)
+                if length is not None and f.tell() != offset+length:
+                    raise OSError('Range {}-{} of {} is truncated'.format(start, end, url))
+                offset = f.tell()
+                done = offset
+        self.complete(local, url=url)
+        return local
+
+    def _get(self, url, f, first, end, partial=True, timeout=60):
+        # Appends bytes from first to end (inclusive, None is the end of the object) to the file
+        headers = {'Range': 'bytes={}-{}'.format(first, '' if end is None else end)} if partial else {}
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+                if partial and response.status != 206:
+                    raise OSError('Byte ranges are not supported by {}'.format(url))
+                length = response.headers.get('Content-Length')
+                received = 0
+                for block in iter(lambda: response.read(BLOCK_SIZE), b''):
+                    f.write(block)
+                    received += len(block)
+                if length is not None and received != int(length):
+                    raise OSError('Download of {} is interrupted, {} of {} bytes are received'.format(url, received, length))
+        except urllib.error.HTTPError as e:
+            # Rest of the object is already written if the download stopped before it is recorded as complete
+            if e.code != 416 or end is not None:
+                raise
+        f.flush()
@@ -0,0 +1,80 @@
+import os
+import time
+import logging
+from copy import deepcopy
+from datetime import timedelta
+from . import get_input
+from . import shared
+
+def upcoming_cycles(first_cycle, cadence, ncycles):
+    """
+    Returns list of cycles starting from the first one with given cadence (in hours)
+    """
+    return [first_cycle+timedelta(hours=i*cadence) for i in range(ncycles)]
+
+def stream_config(cfg, cycle):
+    """
+    Returns stream configuration that writes combined file of the cycle to the shared data directory
+    """
+    cfg = deepcopy(cfg)
+    target_dir = cfg['data']['target_directory']
+    # Downloaded files are kept as they are, only the combined ones depend on cycle
+    data_files = [os.path.basename(fn) for fn in cfg['data'].get('files', [])]
+    cfg['stream_data_files'] = [fn if os.path.basename(fn) in data_files else shared.cycle_cache_file(target_dir, cycle, fn) for fn in cfg['stream_data_files']]
+    return cfg
+
+def fetch_cycle(streams, cycle, bbox=None):
+    """
+    Downloads data of all streams for given cycle if all remote objects are available
+    Returns True if data of all streams are ready
+    """
+    ready = True
+    for comp in streams.keys():
+        for key, cfg in streams[comp].items():
+            cfg = stream_config(cfg, cycle)
+            # Skip if combined file is already created
+            if all(os.path.isfile(fn) for fn in cfg['stream_data_files']):
+                continue
+            subset = False
+            if 'subset' in cfg['data'].keys():
+                subset = cfg['data']['subset']
+            # Data is retrieved only after all of it is published, so it is never combined partially
+            objects = get_input.plan(cfg, cycle, bbox=bbox if subset else None)
+            missing = [obj for obj in objects if obj['status'] != 'ok']
+            if missing:
+                logging.info('Data for %s/%s is not available yet for %s (%d of %d objects)', comp, key, cycle, len(missing), len(objects))
+                ready = False
+                continue
+            logging.info('Prefetching data for %s/%s for %s', comp, key, cycle)
+            os.makedirs(os.path.dirname(cfg['stream_data_files'][0]), exist_ok=True)
+            try:
+                get_input.download(cfg, cycle, bbox=bbox if subset else None)
+            except (Exception, SystemExit) as ex:
+                logging.error('Prefetch failed for %s/%s for %s: %s', comp, key, cycle, str(ex))
+                ready = False
+    return ready
+
+def run(streams, first_cycle, cadence, ncycles, bbox=None, poll=300, timeout=None, once=False):
+    """
+    Polls data sources and downloads data of the upcoming cycles to the shared data directories
+    Returns list of cycles that could not be retrieved
+    """
+    for comp in streams.keys():
+        for key, cfg in streams[comp].items():
+            if not os.path.isabs(cfg['data']['target_directory']):
+                logging.warning('Target directory of %s/%s is not absolute, prefetched data can not be shared with run directories.', comp, key)
+    pending = upcoming_cycles(first_cycle, cadence, ncycles)
+    start = time.monotonic()
+    while pending:
+        for cycle in list(pending):
+            if fetch_cycle(streams, cycle, bbox=bbox):
+                logging.info('Data for %s is ready', cycle)
+                pending.remove(cycle)
+        if not pending or once:
+            break
+        if timeout is not None and time.monotonic()-start+poll > timeout:
+            logging.warning('Prefetch timed out, data is not ready for %s', ', '.join(map(str, pending)))
+            break
+        logging.info('Waiting %d seconds for %d cycles', poll, len(pending))
+        time.sleep(poll)
+    return pending
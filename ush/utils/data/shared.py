@@ -1,19 +1,16 @@
 import os
+import sys
 import numpy as np
-import xarray as xr
 from datetime import datetime
 import logging
 import warnings
 
 warnings.filterwarnings('ignore')
 
-def bbox_mask(ds, bbox):
+def coordinates(ds):
     """
-    Calcuates mask associated with given bounding box and data file
+    Returns latitude and longitude of the data
     """
-    # Create mask based on given box and coordinates
-    min_lon, min_lat, max_lon, max_lat = bbox
-    logging.info('Subset data using bounding box: min_lon = %f, min_lat = %f, max_lon = %f, max_lat = %f', min_lon, min_lat, max_lon, max_lat)
     if 'lat' in ds.coords:
         lat = ds['lat']
     elif 'latitude' in  ds.coords:
@@ -22,21 +19,250 @@ def bbox_mask(ds, bbox):
         lon = ds['lon']
     elif 'longitude' in ds.coords:
         lon = ds['longitude']
-    mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
-    # Find indexes that match with given mask and modify mask
-    indx = np.argwhere(mask.values)
-    istart = indx[:,0].min()-1
-    iend = indx[:,0].max()+1
-    jstart = indx[:,1].min()-1
-    jend = indx[:,1].max()+1
-    mask[istart:iend+1,jstart:jend+1] = True
+    return lat, lon
+
+def in_lon_range(lon, min_lon, max_lon):
+    """
+    Checks if longitudes are in given range, the range can cross the dateline or the prime meridian
+    and the longitudes can be given in [-180,180] or [0,360] convention
+    """
+    width = max_lon-min_lon if max_lon >= min_lon else (max_lon-min_lon) % 360.0
+    if width >= 360.0:
+        return np.ones(np.shape(lon), dtype=bool)
+    return (np.asarray(lon)-min_lon) % 360.0 <= width
+
+def _window(idxs, n, halo, periodic=False):
+    # Index window that covers given indexes and halo cells, it might wrap around for periodic (global) grids
+    if periodic:
+        # Largest gap between the indexes is left out of the window
+        gaps = np.diff(np.r_[idxs, idxs[0]+n])
+        k = np.argmax(gaps)
+        if gaps[k] <= 2*halo+1:
+            return np.arange(n)
+        start = idxs[(k+1) % idxs.size]
+        length = n-gaps[k]+1
+        return (np.arange(start-halo, start+length+halo)) % n
+    return np.arange(max(idxs.min()-halo, 0), min(idxs.max()+halo+1, n))
+
+def subset_window(ds, bbox, halo=1):
+    """
+    Returns index windows (for each dimension of the coordinates) that covers given bounding box
+    and given number of halo cells around it. Regular (1d lat/lon) and curvilinear (2d lat/lon) grids are supported.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    logging.info('Subset data using bounding box: min_lon = %f, min_lat = %f, max_lon = %f, max_lat = %f', min_lon, min_lat, max_lon, max_lat)
+    lat, lon = coordinates(ds)
+    if lat.ndim == 1 and lon.ndim == 1:
+        lat_idxs = np.flatnonzero((lat.values >= min_lat) & (lat.values <= max_lat))
+        lon_idxs = np.flatnonzero(in_lon_range(lon.values, min_lon, max_lon))
+        # Global grids are periodic in longitude, window can wrap around the end of the array
+        dlon = np.abs(np.diff(lon.values)).mean() if lon.size > 1 else 0.0
+        periodic = lon.size*dlon >= 360.0-1e-6
+        if lat_idxs.size == 0 or lon_idxs.size == 0:
+            logging.error('Bounding box does not intersect with the data!')
+            sys.exit()
+        return {lat.dims[0]: _window(lat_idxs, lat.size, halo), lon.dims[0]: _window(lon_idxs, lon.size, halo, periodic=periodic)}
+    mask = (lat.values >= min_lat) & (lat.values <= max_lat) & in_lon_range(lon.values, min_lon, max_lon)
+    if not mask.any():
+        logging.error('Bounding box does not intersect with the data!')
+        sys.exit()
+    dims = lat.dims
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    return {dims[0]: _window(rows, mask.shape[0], halo), dims[1]: _window(cols, mask.shape[1], halo)}
+
+def subset(ds, bbox, halo=1):
+    """
+    Returns subset of the data that covers given bounding box
+    """
+    return ds.isel(subset_window(ds, bbox, halo=halo))
+
+def bbox_mask(ds, bbox, halo=1):
+    """
+    Calcuates mask associated with given bounding box and data file
+    """
+    import xarray as xr
+
+    lat, lon = coordinates(ds)
+    window = subset_window(ds, bbox, halo=halo)
+    mask = xr.zeros_like(lat if lat.ndim == 2 else lat*lon, dtype=bool)
+    mask[window] = True
     # Return mask
     return(mask)
 
+def combine_options(config):
+    """
+    Returns options (store, chunks, workers) used to combine the files of a stream
+    """
+    store = 'netcdf'
+    if 'store' in config['data'].keys():
+        store = config['data']['store']
+    chunks = {}
+    if 'chunks' in config['data'].keys():
+        chunks = config['data']['chunks']
+    workers = 4
+    if 'workers' in config['data'].keys():
+        workers = config['data']['workers']
+    return store, chunks, workers
+
+def finalize_options(config):
+    """
+    Returns options (variables, pack) used to finalize the stream file, variables is None if it is not finalized
+    """
+    finalize = True
+    if 'finalize' in config['data'].keys():
+        finalize = config['data']['finalize']
+    pack = False
+    if 'pack' in config['data'].keys():
+        pack = config['data']['pack']
+    variables = None
+    if finalize and 'stream_data_variables' in config.keys():
+        variables = stream_variables(config['stream_data_variables'])
+    return variables, pack
+
+def stream_variables(stream_data_variables):
+    """
+    Returns names of the variables in the stream files (i.e. u10 of 'u10 Sa_u10m')
+    """
+    if isinstance(stream_data_variables, str):
+        stream_data_variables = [stream_data_variables]
+    return [v.split()[0] for v in stream_data_variables]
+
+def finalize(ds, variables, pack=False):
+    """
+    Returns dataset laid out for CDEPS, only given variables, their time and horizontal coordinates are kept.
+    The data is written in single precision (or packed to 16-bit integers) with one chunk for each time record,
+    so each record CDEPS reads is contiguous in the file.
+    """
+    missing = [v for v in variables if not v in ds.data_vars]
+    if missing:
+        logging.warning('Variables %s are not found in the stream data', ', '.join(missing))
+    ds = ds[[v for v in variables if v in ds.data_vars]]
+    # Scalar and auxiliary coordinates added by cfgrib (step, valid_time, heightAboveGround etc.) are not used
+    ds = ds.drop_vars([c for c in ds.coords if not c in ds.dims and not c in ('lat', 'lon', 'latitude', 'longitude')])
+    ds.attrs = {k: v for k, v in ds.attrs.items() if not k.startswith('GRIB_')}
+    for v in ds.variables:
+        ds[v].attrs = {k: val for k, val in ds[v].attrs.items() if not k.startswith('GRIB_')}
+        ds[v].encoding = {k: val for k, val in ds[v].encoding.items() if k in ('dtype', 'units', 'calendar')}
+    for v in ds.data_vars:
+        var = ds[v]
+        encoding = {'dtype': 'float32', 'zlib': False}
+        if 'time' in var.dims:
+            encoding['chunksizes'] = tuple(1 if d == 'time' else ds.sizes[d] for d in var.dims)
+        if pack:
+            vmin, vmax = float(var.min()), float(var.max())
+            # Values are mapped to [-32766, 32766], -32767 is left for missing values
+            scale = (vmax-vmin)/65532.0 if vmax > vmin else 1.0
+            encoding.update({'dtype': 'int16', 'scale_factor': scale, 'add_offset': (vmax+vmin)/2.0, '_FillValue': np.int16(-32767)})
+        var.encoding = encoding
+    ds.encoding = {'unlimited_dims': {'time'}} if 'time' in ds.dims else {}
+    return ds
+
+def combine(file_list, ofile, store='netcdf', chunks={}, workers=4, variables=None, pack=False):
+    """
+    Combines files along time and writes them to given netCDF file
+    If store is zarr, the files are written to an intermediate zarr store (kept next to the netCDF file) first
+    If variables are given, the file is finalized for CDEPS (see finalize)
+    """
+    import xarray as xr
+
+    logging.info('List of files that will be combined: %s', ' '.join(map(str, file_list)))
+    if store == 'zarr':
+        zstore = os.path.splitext(ofile)[0]+'.zarr'
+        write_zarr(file_list, zstore, chunks=chunks, workers=workers)
+        zarr_to_netcdf(zstore, ofile, variables=variables, pack=pack)
+    elif store == 'netcdf':
+        ds = xr.open_mfdataset(file_list, combine='nested', concat_dim='time', coords='minimal', compat='override', engine='netcdf4')
+        if variables:
+            ds = finalize(ds, variables, pack=pack)
+        tmp = '{}.{}.tmp'.format(ofile, os.getpid())
+        ds.to_netcdf(tmp)
+        ds.close()
+        os.replace(tmp, ofile)
+    else:
+        logging.error('Given store %s is not supported! Use netcdf or zarr.', store)
+        sys.exit()
+    return ofile
+
+def _time_slice(fn):
+    # Variables of the file that depend on time, time is added as dimension if it is a scalar coordinate
+    import xarray as xr
+
+    ds = xr.open_dataset(fn, engine='netcdf4')
+    if not 'time' in ds.dims:
+        ds = ds.expand_dims('time')
+    return ds.drop_vars([v for v in ds.variables if not 'time' in ds[v].dims])
+
+def write_zarr(file_list, store, chunks={}, workers=4):
+    """
+    Writes files to zarr store along time, each file is written to its own region of the store concurrently
+    The data is chunked along time (one record) and given spatial dimensions
+    """
+    import xarray as xr
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Create store with the metadata of all variables, then write the time independent variables (i.e. 2d latitude
+    # and longitude) since they are not written by the regions. Data of the time dependent variables is not written yet.
+    ds = xr.open_mfdataset(file_list, combine='nested', concat_dim='time', coords='minimal', compat='override', engine='netcdf4')
+    spec = dict({'time': 1}, **{k: v for k, v in chunks.items() if k in ds.dims})
+    ds = ds.chunk(spec)
+    for v in ds.variables:
+        ds[v].encoding = {}
+    time_vars = [v for v in ds.variables if 'time' in ds[v].dims]
+    static = ds.drop_vars(time_vars)
+    ds.to_zarr(store, mode='w', compute=False)
+    static.to_zarr(store, mode='a')
+
+    # Offset of each file along time
+    sizes = []
+    for fn in file_list:
+        with _time_slice(fn) as piece:
+            sizes.append(piece.sizes['time'])
+    offsets = np.cumsum([0]+sizes)
+    def write(i):
+        with _time_slice(file_list[i]) as piece:
+            piece = piece.chunk({k: v for k, v in spec.items() if k in piece.dims})
+            piece.to_zarr(store, region={'time': slice(offsets[i], offsets[i+1])})
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(write, range(len(file_list))))
+
+    # Time independent variables (coordinates of the stream mesh) must survive the round trip
+    with xr.open_zarr(store) as out:
+        changed = [v for v in static.variables if not v in out.variables or not np.array_equal(out[v].values, static[v].values, equal_nan=out[v].dtype.kind == 'f')]
+    if changed:
+        logging.error('Variables %s are not written correctly to %s!', ', '.join(changed), store)
+        sys.exit()
+    logging.info('Combined %d files to %s', len(file_list), store)
+    return store
+
+def zarr_to_netcdf(store, ofile, variables=None, pack=False):
+    """
+    Converts zarr store to netCDF file, the file is written to temporary file first and renamed when it is completed
+    """
+    import xarray as xr
+
+    with xr.open_zarr(store) as ds:
+        for v in ds.variables:
+            ds[v].encoding = {k: val for k, val in ds[v].encoding.items() if k in ('dtype', 'units', 'calendar', '_FillValue')}
+        if variables:
+            ds = finalize(ds, variables, pack=pack)
+        tmp = '{}.{}.tmp'.format(ofile, os.getpid())
+        ds.to_netcdf(tmp, engine='netcdf4')
+    os.replace(tmp, ofile)
+    return ofile
+
+def cycle_cache_file(target_dir, cycle, filename):
+    """
+    Returns path of the file prepared for given cycle in the shared data directory
+    """
+    return os.path.join(target_dir, 'cycles', cycle.strftime('%Y%m%d%H'), os.path.basename(filename))
+
 def get_time_range(input_files, run_dir):
     """
     Returns date range
     """
+    import xarray as xr
+
     # Open data files and combine them
     input_files_with_dir = [os.path.join(run_dir, fn) for fn in input_files]
     ds = xr.open_mfdataset(input_files_with_dir, combine='nested', concat_dim='time', coords='minimal', compat='override', engine='netcdf4')
@@ -0,0 +1,141 @@
+import os
+import sys
+import hashlib
+import logging
+import numpy as np
+from ..schism.utils import CACHE_DIR, file_signature, load_mesh
+from ..staging import stage_file
+
+# Supported mapping algorithms, bilinear is linear interpolation on the triangulation of the source points
+MAPALGOS = ['bilinear', 'nearest']
+
+def mesh_centers(filename):
+    """
+    Returns element centers of ESMF mesh file, they are computed from the nodes if the file has no centerCoords
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(filename) as nc:
+        if 'centerCoords' in nc.variables.keys():
+            centers = nc.variables['centerCoords'][:].filled(np.nan)
+            return centers[:,0].astype(np.float64), centers[:,1].astype(np.float64)
+        nodes = nc.variables['nodeCoords'][:].filled(np.nan)
+        conn = np.ma.filled(nc.variables['elementConn'][:], -1).astype(np.int64)
+    valid = conn > 0
+    idx = np.where(valid, conn-1, 0)
+    n = valid.sum(axis=1)
+    x = np.where(valid, nodes[idx,0], 0.0).sum(axis=1)/n
+    y = np.where(valid, nodes[idx,1], 0.0).sum(axis=1)/n
+    return x, y
+
+def model_points(hgrid_fname, location='node'):
+    """
+    Returns coordinates of the SCHISM nodes or element centroids (location is element)
+    """
+    mesh = load_mesh(hgrid_fname)
+    if location != 'element':
+        return mesh.x, mesh.y
+    conn = mesh.elements
+    valid = conn >= 0
+    idx = np.where(valid, conn, 0)
+    n = valid.sum(axis=1)
+    return np.where(valid, mesh.x[idx], 0.0).sum(axis=1)/n, np.where(valid, mesh.y[idx], 0.0).sum(axis=1)/n
+
+def _align(src_x, dst_x):
+    # Longitudes of the destination in the convention of the source
+    west = np.nanmin(src_x)
+    return (dst_x-west) % 360.0+west if np.nanmax(src_x)-west <= 360.0 else dst_x
+
+def _unit_vectors(x, y):
+    lon, lat = np.radians(x), np.radians(y)
+    return np.column_stack((np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)))
+
+def nearest(src_x, src_y, dst_x, dst_y):
+    """
+    Returns source index (col), destination index (row) and weights of nearest neighbor mapping
+    """
+    from scipy.spatial import cKDTree
+
+    _, col = cKDTree(_unit_vectors(src_x, src_y)).query(_unit_vectors(dst_x, dst_y))
+    row = np.arange(dst_x.size)
+    return col.astype(np.int64), row, np.ones(dst_x.size)
+
+def bilinear(src_x, src_y, dst_x, dst_y):
+    """
+    Returns source index (col), destination index (row) and weights of linear interpolation
+    on the Delaunay triangulation of the source points, the points outside of the source
+    points use the nearest source point
+    """
+    from scipy.spatial import Delaunay
+
+    dst_x = _align(src_x, dst_x)
+    tri = Delaunay(np.column_stack((src_x, src_y)))
+    pts = np.column_stack((dst_x, dst_y))
+    simplex = tri.find_simplex(pts)
+    inside = simplex >= 0
+    # Barycentric coordinates from the affine transformation of each triangle
+    trans = tri.transform[simplex[inside]]
+    b = np.einsum('nij,nj->ni', trans[:,:2], pts[inside]-trans[:,2])
+    w = np.column_stack((b, 1.0-b.sum(axis=1)))
+    col = tri.simplices[simplex[inside]].ravel()
+    row = np.repeat(np.flatnonzero(inside), 3)
+    S = w.ravel()
+    if not inside.all():
+        logging.info('%d of %d destination points are outside of the source points, nearest point is used', np.count_nonzero(~inside), inside.size)
+        ncol, nrow, nS = nearest(src_x, src_y, dst_x[~inside], dst_y[~inside])
+        col = np.concatenate((col, ncol))
+        row = np.concatenate((row, np.flatnonzero(~inside)[nrow]))
+        S = np.concatenate((S, nS))
+    # Tiny weights (points on the edges) are dropped
+    keep = np.abs(S) > 1e-12
+    order = np.lexsort((col[keep], row[keep]))
+    return col[keep][order], row[keep][order], S[keep][order]
+
+def write_weights(filename, col, row, S, src, dst, mapalgo='bilinear'):
+    """
+    Writes weights in ESMF (SCRIP) sparse matrix format, indices are one-based
+    """
+    import netCDF4
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with netCDF4.Dataset(tmp, 'w') as nc:
+        nc.createDimension('n_a', src[0].size)
+        nc.createDimension('n_b', dst[0].size)
+        nc.createDimension('n_s', S.size)
+        for name, dim, values in [('xc_a', 'n_a', src[0]), ('yc_a', 'n_a', src[1]), ('xc_b', 'n_b', dst[0]), ('yc_b', 'n_b', dst[1])]:
+            var = nc.createVariable(name, 'f8', (dim,))
+            var.units = 'degrees'
+            var[:] = values
+        frac = np.zeros(dst[0].size)
+        np.add.at(frac, row, S)
+        nc.createVariable('frac_b', 'f8', ('n_b',))[:] = frac
+        nc.createVariable('col', 'i4', ('n_s',))[:] = col+1
+        nc.createVariable('row', 'i4', ('n_s',))[:] = row+1
+        nc.createVariable('S', 'f8', ('n_s',))[:] = S
+        nc.title = 'Mapping weights'
+        nc.map_method = 'Bilinear remapping' if mapalgo == 'bilinear' else 'Nearest neighbor remapping'
+    os.replace(tmp, filename)
+    return filename
+
+def create(mesh_file, hgrid_fname, output_file, mapalgo='bilinear', location='node', cache_dir=None):
+    """
+    Creates weights that map fields on the elements of ESMF mesh file (i.e. DATM mesh) to the SCHISM grid
+    Weights are cached for each source points, SCHISM grid, location and mapping algorithm
+    """
+    if not mapalgo in MAPALGOS:
+        logging.error('Unknown mapping algorithm %s, it can be %s.', mapalgo, ', '.join(MAPALGOS))
+        sys.exit()
+    src = mesh_centers(mesh_file)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(np.column_stack(src)).tobytes())
+    h.update('{}:{}:{}'.format(file_signature(hgrid_fname), location, mapalgo).encode('utf-8'))
+    cfile = os.path.join(cache_dir or CACHE_DIR, 'weights', '{}.nc'.format(h.hexdigest()))
+    if not os.path.isfile(cfile):
+        dst = model_points(hgrid_fname, location)
+        logging.info('Creating %s weights from %d source points to %d destination points', mapalgo, src[0].size, dst[0].size)
+        func = bilinear if mapalgo == 'bilinear' else nearest
+        col, row, S = func(src[0], src[1], dst[0], dst[1])
+        write_weights(cfile, col, row, S, src, dst, mapalgo=mapalgo)
+    stage_file(cfile, output_file, overwrite=True)
+    return output_file
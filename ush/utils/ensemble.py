@@ -0,0 +1,70 @@
+import os
+import json
+import logging
+from copy import deepcopy
+from .staging import stage_file
+
+def merge(config, overrides):
+    """
+    Returns copy of the configuration updated with the (nested) overrides of a member
+    """
+    out = deepcopy(config)
+    for key, val in (overrides or {}).items():
+        if isinstance(val, dict) and isinstance(out.get(key), dict):
+            out[key] = merge(out[key], val)
+        else:
+            out[key] = deepcopy(val)
+    return out
+
+def stream_signature(cfg):
+    """
+    Returns signature of a stream configuration that does not depend on the location of its files
+    """
+    cfg = deepcopy(cfg)
+    cfg['data'].pop('target_directory', None)
+    cfg['stream_data_files'] = [os.path.basename(fn) for fn in cfg.get('stream_data_files', [])]
+    cfg['stream_mesh_file'] = os.path.basename(cfg.get('stream_mesh_file', ''))
+    return json.dumps(cfg, sort_keys=True, default=str)
+
+def stream_files(cfg):
+    """
+    Returns files created for a stream (data and mesh)
+    """
+    return cfg['stream_data_files']+[cfg['stream_mesh_file']]
+
+def share_streams(base, member):
+    """
+    Stages forcing files of the base member's streams to the member if their configurations are same
+    Returns list of staged files
+    """
+    staged = []
+    for comp in member.keys():
+        for key, cfg in member[comp].items():
+            if not key in base.get(comp, {}).keys():
+                continue
+            if stream_signature(base[comp][key]) != stream_signature(cfg):
+                continue
+            for src, dst in zip(stream_files(base[comp][key]), stream_files(cfg)):
+                if os.path.isfile(src) and os.path.abspath(src) != os.path.abspath(dst):
+                    stage_file(src, dst)
+                    staged.append(dst)
+    return staged
+
+def share_outputs(base_files, files):
+    """
+    Stages files generated for base member to the member
+    """
+    for src, dst in zip(base_files, files):
+        stage_file(src, dst, overwrite=True)
+    logging.info('Shared %s', ', '.join(os.path.basename(str(fn)) for fn in files))
+    return files
+
+def unshare_outputs(files):
+    """
+    Removes files before they are generated again, the files might be hard linked to the
+    files of other members and some generators (i.e. pyschism) write existing files in place
+    """
+    for fn in files:
+        if os.path.lexists(fn):
+            os.remove(fn)
+    return files
@@ -0,0 +1,308 @@
+import os
+import re
+import math
+
+# Columns of the ESMF profile tables, summary (ESMF_Profile.summary) and per PET (ESMF_Profile.NNNN) files
+COLUMNS = {
+    'PETs': 'pets',
+    'PEs': 'pes',
+    'Count': 'count',
+    'Total (s)': 'total',
+    'Self (s)': 'self',
+    'Mean (s)': 'mean',
+    'Min (s)': 'min',
+    'Min PET': 'min_pet',
+    'Max (s)': 'max',
+    'Max PET': 'max_pet'
+}
+
+# Relative decrease in run time of the component when its PETs are doubled is 1-0.5**exponent
+# Data components and the mediator mostly copy and regrid fields, they scale worse than the models
+SCALING = {
+    'cmeps': 0.5,
+    'datm': 0.5,
+    'docn': 0.5,
+    'dwav': 0.5,
+    'drof': 0.5,
+    'dice': 0.5,
+    'dlnd': 0.5
+}
+
+# Maximum number of core splits that are tried for the concurrent groups, cores are given to the
+# slowest group one by one if there are more splits
+MAX_SPLITS = 100000
+
+_LABEL = re.compile(r'^\[([^\]]+)\]\s*(.*)$')
+
+def phase_kind(phase):
+    """
+    Returns kind of the NUOPC phase (init, run or final)
+    """
+    if phase.startswith('Final'):
+        return 'final'
+    if 'Init' in phase or phase.startswith('IPD') or phase.startswith('Data'):
+        return 'init'
+    return 'run'
+
+def parse_summary(filename):
+    """
+    Parses ESMF profile table (ESMF_RUNTIME_PROFILE_OUTPUT="SUMMARY" or "TEXT")
+    Returns list of regions, each region has its name, depth, label (component or connector),
+    phase, index of its parent and the timing columns of the table
+    """
+    with open(filename, 'r') as f:
+        lines = [line.rstrip('\n') for line in f]
+    header = [i for i, line in enumerate(lines) if line.lstrip().startswith('Region')]
+    if not header:
+        raise ValueError('{} is not an ESMF profile, no table header is found'.format(filename))
+    names = re.findall('|'.join(re.escape(c) for c in COLUMNS.keys()), lines[header[0]])
+    keys = [COLUMNS[n] for n in names]
+
+    regions = []
+    stack = []
+    for line in lines[header[0]+1:]:
+        tokens = line.split()
+        if len(tokens) <= len(keys):
+            continue
+        try:
+            values = [float(t) for t in tokens[-len(keys):]]
+        except ValueError:
+            continue
+        indent = len(line)-len(line.lstrip())
+        name = ' '.join(tokens[:-len(keys)])
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        region = dict(zip(keys, values))
+        match = _LABEL.match(name)
+        region.update({
+            'name': name,
+            'depth': len(stack),
+            'parent': stack[-1][1] if stack else None,
+            'label': match.group(1) if match else None,
+            'phase': match.group(2) if match else name
+        })
+        # Mean, min and max of per PET tables are the times of a single call, total time is the time
+        # of the single PET and it is used as its mean and max
+        if not 'pets' in region.keys():
+            region['mean'] = region['max'] = region['min'] = region.get('total', 0.0)
+        stack.append((indent, len(regions)))
+        regions.append(region)
+    return regions
+
+def parse_configure(filename):
+    """
+    Parses ufs.configure of a run directory
+    Returns components (model, first and last PET, number of threads) and the run sequence
+    """
+    with open(filename, 'r') as f:
+        text = f.read()
+    components = {}
+    for m in re.finditer(r'^\s*(\w+?)_(model|petlist_bounds|omp_num_threads):\s*(.*)$', text, re.MULTILINE):
+        key, option, value = m.group(1), m.group(2), m.group(3).strip()
+        comp = components.setdefault(key, {'model': None, 'petlist': None, 'threads': 1})
+        if option == 'model':
+            comp['model'] = value
+        elif option == 'petlist_bounds':
+            bounds = [int(v) for v in value.replace('-', ' ').split()]
+            comp['petlist'] = (bounds[0], bounds[-1])
+        else:
+            comp['threads'] = int(value)
+    match = re.search(r'^runSeq::\s*\n(.*?)^::', text, re.MULTILINE | re.DOTALL)
+    return {'components': components, 'run_sequence': match.group(1) if match else ''}
+
+def parse_sequence(text):
+    """
+    Returns entries of the NUOPC run sequence with the profile label and phase of each entry
+    """
+    entries = []
+    interval = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('@'):
+            interval = int(line[1:]) if line[1:].strip().isdigit() else interval
+            continue
+        tokens = line.split()
+        if len(tokens) >= 3 and tokens[1] == '->':
+            label, phase = '{}-TO-{}'.format(tokens[0], tokens[2]), 'RunPhase1'
+        elif len(tokens) >= 2 and not tokens[1].startswith(':'):
+            label, phase = tokens[0], tokens[1]
+        else:
+            label, phase = tokens[0], 'RunPhase1'
+        entries.append({'entry': line, 'label': label, 'phase': phase, 'interval': interval})
+    return entries
+
+def _outermost(regions):
+    # Regions that are not nested in a region of the same label, their times are not counted twice
+    out = []
+    for region in regions:
+        if region['label'] is None:
+            continue
+        parent = region['parent']
+        nested = False
+        while parent is not None:
+            if regions[parent]['label'] == region['label']:
+                nested = True
+                break
+            parent = regions[parent]['parent']
+        if not nested:
+            out.append(region)
+    return out
+
+def attribute(regions, sequence=None):
+    """
+    Attributes profiled time to components (and connectors) and to the entries of the run sequence
+    Times are the maximum over PETs (slowest PET sets the pace of the coupled run)
+    """
+    components = {}
+    for region in _outermost(regions):
+        comp = components.setdefault(region['label'], {'init': 0.0, 'run': 0.0, 'final': 0.0, 'mean_run': 0.0, 'pets': 0})
+        kind = phase_kind(region['phase'])
+        comp[kind] += region['max']
+        comp['pets'] = max(comp['pets'], int(region.get('pets', 1)))
+        if kind == 'run':
+            comp['mean_run'] += region['mean']
+    # Load imbalance of each component, 1 is perfectly balanced
+    for comp in components.values():
+        comp['balance'] = comp['mean_run']/comp['run'] if comp['run'] > 0 else 1.0
+
+    entries = []
+    for entry in sequence or []:
+        matched = [r for r in regions if r['label'] == entry['label'] and r['phase'] == entry['phase']]
+        entries.append(dict(entry, calls=int(sum(r['count'] for r in matched)), time=sum(r['max'] for r in matched)))
+    # Share of each entry in the time spent in the run sequence
+    total = sum(e['time'] for e in entries)
+    for entry in entries:
+        entry['share'] = entry['time']/total if total > 0 else 0.0
+    return components, entries
+
+def wall_time(regions):
+    """
+    Returns total time of the run, the time of the outermost region
+    """
+    top = [r['max'] for r in regions if r['depth'] == 0]
+    return max(top) if top else 0.0
+
+def pet_groups(components):
+    """
+    Groups components with overlapping PETs, components in a group run one after another
+    while the groups run concurrently
+    Returns list of (first PET, last PET, component names)
+    """
+    groups = []
+    for name, comp in sorted(components.items(), key=lambda kv: kv[1]['petlist']):
+        lo, hi = comp['petlist']
+        if groups and lo <= groups[-1][1]:
+            groups[-1] = (groups[-1][0], max(hi, groups[-1][1]), groups[-1][2]+[name])
+        else:
+            groups.append((lo, hi, [name]))
+    return groups
+
+def compositions(total, parts):
+    """
+    Yields splits of total into given number of positive parts (in order)
+    """
+    if parts == 1:
+        if total >= 1:
+            yield (total,)
+        return
+    for first in range(1, total-parts+2):
+        for rest in compositions(total-first, parts-1):
+            yield (first,)+rest
+
+def _estimate(time, cores, new_cores, exponent):
+    return time*(float(cores)/new_cores)**exponent
+
+def advise(config, components, cores=None, scaling=None):
+    """
+    Recommends PET layout for given total number of cores
+    config: parsed ufs.configure, components: attributed times (see attribute)
+    PET bounds are given in cores (globalResourceControl), a component with N threads has one MPI task for N cores.
+    The run time of each component is scaled as time*(cores/new_cores)**exponent, groups of components
+    with overlapping PETs are kept and their cores are split to minimize the slowest group.
+    A layout that runs all components on all PETs one after another is also evaluated.
+    Data components and the mediator are given one thread, others keep their threads.
+    """
+    exponents = dict(SCALING, **(scaling or {}))
+    comps = config['components']
+    exponent = lambda name: exponents.get(comps[name]['model'], 1.0)
+    npets = lambda name: comps[name]['petlist'][1]-comps[name]['petlist'][0]+1
+    run = lambda name: components.get(name, {}).get('run', 0.0)
+    threads = {name: 1 if exponent(name) < 1.0 else comps[name]['threads'] for name in comps.keys()}
+    groups = pet_groups(comps)
+    used = sum(hi-lo+1 for lo, hi, _ in groups)
+    cores = cores or used
+
+    def group_time(names, ncores):
+        # Cores of the group must be divisible by the threads of its components
+        if any(ncores < threads[n] or ncores % threads[n] for n in names):
+            return float('inf'), 0
+        return sum(_estimate(run(n), npets(n), ncores, exponent(n)) for n in names), ncores
+
+    current = max(sum(run(n) for n in names) for _, _, names in groups)
+    layouts = []
+    # Concurrent groups, every split of the cores (compositions of cores) is tried if there are not
+    # too many of them, otherwise cores are given one by one to the slowest group
+    times = [{} for _ in groups]
+    def estimate(i, n):
+        if not n in times[i]:
+            times[i][n] = group_time(groups[i][2], n)
+        return times[i][n]
+    if cores < len(groups):
+        splits = []
+    elif math.comb(cores-1, len(groups)-1) <= MAX_SPLITS:
+        splits = compositions(cores, len(groups))
+    else:
+        split = [1]*len(groups)
+        for _ in range(cores-len(groups)):
+            slowest = [estimate(i, n)[0] for i, n in enumerate(split)]
+            split[slowest.index(max(slowest))] += 1
+        splits = [tuple(split)]
+    best_split = None
+    for split in splits:
+        slowest = max(estimate(i, n)[0] for i, n in enumerate(split))
+        if slowest < float('inf') and (best_split is None or slowest < best_split[0]):
+            best_split = (slowest, split)
+    if best_split:
+        slowest, split = best_split
+        estimates = [estimate(i, n) for i, n in enumerate(split)]
+        layouts.append({'layout': 'concurrent', 'time': slowest,
+                        'groups': [(names, pets) for (_, _, names), (_, pets) in zip(groups, estimates)],
+                        'idle': [1.0-t/slowest if slowest > 0 else 0.0 for t, _ in estimates]})
+    # All components share all PETs
+    names = list(comps.keys())
+    t, pets = group_time(names, cores)
+    if pets > 0:
+        layouts.append({'layout': 'sequential', 'time': t, 'groups': [(names, pets)], 'idle': [0.0]})
+    best = min(layouts, key=lambda l: l['time'])
+
+    # PET bounds of the recommended layout, groups take consecutive PETs
+    petlist = {}
+    start = 0
+    for names, pets in best['groups']:
+        for name in names:
+            petlist[name] = '{}-{}'.format(start, start+pets-1)
+        start += pets
+    return {
+        'cores': cores,
+        'current_cores': used,
+        'current_time': current,
+        'layout': best['layout'],
+        'time': best['time'],
+        'speedup': current/best['time'] if best['time'] > 0 else 1.0,
+        'idle': dict(zip([','.join(n) for n, _ in best['groups']], best['idle'])),
+        'petlist_bounds': petlist,
+        'omp_num_threads': threads
+    }
+
+def find_files(rundir):
+    """
+    Returns profile summary and ufs.configure of a run directory
+    """
+    summary = os.path.join(rundir, 'ESMF_Profile.summary')
+    if not os.path.isfile(summary):
+        # Without SUMMARY output, the table of the first PET is used
+        pets = sorted(fn for fn in os.listdir(rundir) if re.match(r'ESMF_Profile\.\d+$', fn))
+        summary = os.path.join(rundir, pets[0]) if pets else summary
+    return summary, os.path.join(rundir, 'ufs.configure')
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import date, datetime
+
+MANIFEST_FILE = 'coastal.manifest.json'
+
+def file_hash(path, block_size=8*1024*1024):
+    """
+    Returns hash of given file content
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def _default(obj):
+    # Make dates and paths JSON serializable
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    return str(obj)
+
+class Manifest:
+    """
+    Fingerprints of the inputs used to generate files in the run directory
+    """
+
+    def __init__(self, rundir):
+        self.path = os.path.join(rundir, MANIFEST_FILE)
+        # Tasks might update manifest concurrently
+        self.lock = threading.RLock()
+        self.data = {'files': {}, 'tasks': {}}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except ValueError:
+                logging.warning('Manifest file %s is corrupted, ignoring it.', self.path)
+
+    def signature(self, path):
+        """
+        Returns hash of given file, the hash is only recomputed if file size or mtime changes
+        """
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        entry = self.data['files'].get(path)
+        if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+            return entry['hash']
+        logging.info('Computing hash of %s', path)
+        entry = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': file_hash(path)}
+        with self.lock:
+            self.data['files'][path] = entry
+        return entry['hash']
+
+    def fingerprint(self, config, files=[]):
+        """
+        Returns fingerprint of given configuration (sub)section and input files
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(json.dumps(config, sort_keys=True, default=_default).encode('utf-8'))
+        for fn in files:
+            if fn and os.path.isfile(fn):
+                h.update(self.signature(fn).encode('utf-8'))
+            else:
+                h.update(str(fn).encode('utf-8'))
+        return h.hexdigest()
+
+    def is_current(self, key, fingerprint, outputs):
+        """
+        Checks if outputs of the given task are created with the same inputs
+        """
+        entry = self.data['tasks'].get(key)
+        if not entry or entry['fingerprint'] != fingerprint:
+            return False
+        return all(os.path.isfile(fn) for fn in outputs)
+
+    def update(self, key, fingerprint, outputs):
+        """
+        Records fingerprint of the inputs used to create outputs
+        """
+        with self.lock:
+            self.data['tasks'][key] = {'fingerprint': fingerprint, 'outputs': [str(fn) for fn in outputs]}
+            self.save()
+
+    def save(self):
+        """
+        Writes manifest file, temporary file is used to avoid partially written manifest
+        """
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path+'.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
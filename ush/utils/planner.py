@@ -0,0 +1,88 @@
+import os
+import logging
+from .data import get_input
+from .schism import gen_bctides
+
+def vgrid_levels(vgrid):
+    """
+    Returns number of vertical levels defined in vgrid.in (LSC2 or SZ)
+    """
+    with open(vgrid, 'r') as f:
+        f.readline()
+        return int(f.readline().split()[0])
+
+def th_nc_size(nnodes, nlevels, ncomp, ntimes):
+    """
+    Returns estimated size of *.th.nc file (in bytes), the data is stored as float32 without compression
+    """
+    return ntimes*(nnodes*nlevels*ncomp*4+8)
+
+def estimate_boundary(files, hgrid, vgrid, ocean_bnd_ids, rnday=1, interval=24):
+    """
+    Returns estimated sizes of open boundary files
+    """
+    # Planning does not change anything on disk, so the parsed grid is not cached
+    _, nodes_per_boundary = gen_bctides.read_hgrid_boundaries(hgrid, cache=False)
+    nnodes = sum(nodes_per_boundary[i] for i in ocean_bnd_ids if i < len(nodes_per_boundary))
+    nvrt = vgrid_levels(vgrid) if os.path.isfile(vgrid) else 1
+    ntimes = int(rnday*24/interval)+1
+    sizes = {}
+    for fn in files:
+        name = os.path.basename(fn)
+        if name == 'elev2D.th.nc':
+            sizes[fn] = th_nc_size(nnodes, 1, 1, ntimes)
+        elif name == 'uv3D.th.nc':
+            sizes[fn] = th_nc_size(nnodes, nvrt, 2, ntimes)
+        else:
+            sizes[fn] = th_nc_size(nnodes, nvrt, 1, ntimes)
+    return sizes
+
+def estimate_gr3(files, hgrid):
+    """
+    Returns estimated sizes of gr3 files, each of them has the same nodes and elements with hgrid
+    """
+    size = os.path.getsize(hgrid) if os.path.isfile(hgrid) else None
+    return {fn: size for fn in files}
+
+def remote_objects(streams, cycle, bbox=None):
+    """
+    Returns remote objects of CDEPS streams without downloading them
+    """
+    objects = []
+    for comp in streams.keys():
+        for key, cfg in streams[comp].items():
+            subset = False
+            if "subset" in cfg["data"].keys():
+                subset = cfg["data"]["subset"]
+            logging.info("Planning forcing data for %s and %s", comp, key)
+            for obj in get_input.plan(cfg, cycle, bbox=bbox if subset else None):
+                obj.update({'component': comp, 'stream': key, 'protocol': cfg['data']['protocol']})
+                objects.append(obj)
+    return objects
+
+def summary(plan):
+    """
+    Returns totals of the plan
+    """
+    out = {
+        'remote_objects': len(plan['downloads']),
+        'cached_objects': 0,
+        'download_bytes': 0,
+        'cached_bytes': 0,
+        'unknown_sizes': 0,
+        'files_to_generate': 0,
+        'generate_bytes': 0
+    }
+    for obj in plan['downloads']:
+        if obj['cached']:
+            out['cached_objects'] += 1
+            out['cached_bytes'] += obj['size'] or 0
+        elif obj['size'] is None:
+            out['unknown_sizes'] += 1
+        else:
+            out['download_bytes'] += obj['size']
+    for item in plan['generate']:
+        if item['status'] == 'generate':
+            out['files_to_generate'] += 1
+            out['generate_bytes'] += item['size'] or 0
+    return out
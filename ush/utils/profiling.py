@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import inspect
+import logging
+import importlib
+import resource
+import threading
+from functools import wraps
+from contextlib import contextmanager
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class Profiler:
+    """
+    Collects wall time, CPU time, peak memory and I/O of code sections
+    Memory, I/O and network counters are process (or system) wide, so they also
+    include the work done by other sections running at the same time
+    """
+
+    def __init__(self, interval=0.05, t0=None):
+        self.interval = interval
+        self.records = []
+        # Start of the profile, perf_counter is system wide so the workers use the start of their parent
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.lock = threading.Lock()
+        self.active = {}
+        self.sampler = None
+        self.instrumented = []
+        self.modules = []
+        self.process = psutil.Process() if psutil else None
+
+    def rss(self):
+        """
+        Returns resident memory of the process and its children (in bytes)
+        """
+        if self.process is None:
+            # Peak of the process lifetime, best we can do without psutil
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+        rss = self.process.memory_info().rss
+        try:
+            for child in self.process.children(recursive=True):
+                rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+        return rss
+
+    def counters(self):
+        """
+        Returns snapshot of I/O counters
+        """
+        out = {'read_bytes': None, 'write_bytes': None, 'net_bytes': None}
+        if self.process is None:
+            return out
+        try:
+            io = self.process.io_counters()
+            out['read_bytes'] = getattr(io, 'read_chars', io.read_bytes)
+            out['write_bytes'] = getattr(io, 'write_chars', io.write_bytes)
+        except (AttributeError, psutil.Error):
+            pass
+        out['net_bytes'] = psutil.net_io_counters().bytes_recv
+        return out
+
+    def _sample(self):
+        # Update peak memory of active sections until there is no active section
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.sampler = None
+                    return
+                rss = self.rss()
+                for record in self.active.values():
+                    record['peak_rss'] = max(record['peak_rss'], rss)
+            time.sleep(self.interval)
+
+    @contextmanager
+    def section(self, name, category='task'):
+        """
+        Profiles the code block
+        """
+        key = object()
+        record = {
+            'name': name,
+            'category': category,
+            'thread': threading.current_thread().name,
+            'start': time.perf_counter()-self.t0,
+            'peak_rss': self.rss()
+        }
+        start_counters = self.counters()
+        cpu = time.thread_time()
+        cpu_process = time.process_time()
+        with self.lock:
+            self.active[key] = record
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, daemon=True)
+                self.sampler.start()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = time.perf_counter()-self.t0-record['start']
+            record['cpu_time'] = time.thread_time()-cpu
+            record['cpu_time_process'] = time.process_time()-cpu_process
+            end_counters = self.counters()
+            for k, v in start_counters.items():
+                record[k] = None if v is None else end_counters[k]-v
+            with self.lock:
+                record['peak_rss'] = max(record['peak_rss'], self.rss())
+                del self.active[key]
+                self.records.append(record)
+
+    def wrap(self, func, name=None, category='function'):
+        """
+        Returns profiled version of the function
+        """
+        name = name or '{}.{}'.format(func.__module__, func.__name__)
+
+        @wraps(func)
+        def profiled(*args, **kwargs):
+            with self.section(name, category=category):
+                return func(*args, **kwargs)
+        profiled.__profiled__ = func
+        return profiled
+
+    def instrument(self, module, category='function'):
+        """
+        Profiles public functions defined in the module
+        Since functions are replaced in module namespace, the calls within the module are profiled too
+        """
+        for name, obj in list(vars(module).items()):
+            if name.startswith('_') or not inspect.isfunction(obj) or obj.__module__ != module.__name__:
+                continue
+            if hasattr(obj, '__profiled__'):
+                continue
+            setattr(module, name, self.wrap(obj, category=category))
+            self.instrumented.append((module, name, obj))
+        self.modules.append((module.__name__, category))
+
+    def restore(self):
+        """
+        Restores instrumented functions
+        """
+        for module, name, obj in self.instrumented:
+            setattr(module, name, obj)
+        self.instrumented = []
+        self.modules = []
+
+    def merge(self, records):
+        """
+        Adds records collected by another profiler (i.e. in a worker process)
+        """
+        with self.lock:
+            self.records.extend(records)
+
+    def report(self):
+        """
+        Returns report as dictionary
+        """
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(record['name'], {'category': record['category'], 'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss': 0})
+            entry['calls'] += 1
+            entry['wall_time'] += record['wall_time']
+            entry['cpu_time'] += record['cpu_time']
+            entry['peak_rss'] = max(entry['peak_rss'], record['peak_rss'])
+        return {
+            'pid': os.getpid(),
+            'psutil': self.process is not None,
+            'records': sorted(self.records, key=lambda r: r['start']),
+            'summary': summary
+        }
+
+    def write(self, filename):
+        """
+        Writes JSON report
+        """
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        logging.info('Profiling report is written to %s', filename)
+        return filename
+
+    def write_chrome_trace(self, filename):
+        """
+        Writes report in Chrome trace event format (chrome://tracing, Perfetto)
+        """
+        threads = {}
+        events = []
+        for record in sorted(self.records, key=lambda r: r['start']):
+            tid = threads.setdefault(record['thread'], len(threads)+1)
+            events.append({
+                'name': record['name'],
+                'cat': record['category'],
+                'ph': 'X',
+                'ts': record['start']*1.0e6,
+                'dur': record['wall_time']*1.0e6,
+                'pid': os.getpid(),
+                'tid': tid,
+                'args': {k: v for k, v in record.items() if k not in ('name', 'category', 'thread', 'start', 'wall_time')}
+            })
+        for name, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}})
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        logging.info('Chrome trace is written to %s', filename)
+        return filename
+
+def run_profiled(func, name, category, modules, t0, args, kwargs):
+    """
+    Runs the function with its own profiler in a worker process, the modules (name, category) are instrumented
+    as in the parent since the worker does not see its instrumentation. Returns result and profile records.
+    """
+    profiler = Profiler(t0=t0)
+    for module, cat in modules:
+        profiler.instrument(importlib.import_module(module), category=cat)
+    try:
+        with profiler.section(name, category=category) as record:
+            record['pid'] = os.getpid()
+            result = func(*args, **kwargs)
+    finally:
+        profiler.restore()
+    return result, profiler.records
@@ -0,0 +1,113 @@
+import os
+import glob
+import logging
+from datetime import timedelta
+from .staging import stage_file
+
+# Names of the pointer files used by the data components, others use their own name
+POINTERS = {
+    'datm': 'rpointer.atm',
+    'docn': 'rpointer.ocn'
+}
+
+def restart_stamp(cycle):
+    """
+    Returns time stamp used in the names of the restart files written at given date (YYYY-MM-DD-SSSSS)
+    """
+    seconds = cycle.hour*3600+cycle.minute*60+cycle.second
+    return '{}-{:05d}'.format(cycle.strftime('%Y-%m-%d'), seconds)
+
+def previous_rundir(pattern, cycle, cadence):
+    """
+    Returns previous cycle and its run directory, pattern is processed by strftime with previous cycle
+    """
+    previous = cycle-timedelta(hours=cadence)
+    return previous, previous.strftime(pattern)
+
+def _component(fn):
+    # Component name is found from the file name (case_name.component.r.stamp.nc)
+    return os.path.basename(fn).split('.r.')[0].split('.')[-1]
+
+def find_restarts(prev_dir, cycle):
+    """
+    Returns restart files of the previous cycle written at given cycle and content of their pointer files
+    The files are found from their names in RESTART directory, the pointer files (rpointer.*) of the previous
+    cycle are only used as a hint for the names of the pointer files and the restart files outside RESTART
+    """
+    stamp = restart_stamp(cycle)
+    # Pointer files might point to restart files written at another time (i.e. end of the previous run)
+    hints = {}
+    pointed = {}
+    for rp in sorted(glob.glob(os.path.join(prev_dir, 'rpointer.*'))):
+        with open(rp, 'r') as f:
+            lines = [line.strip() for line in f if line.strip()]
+        for line in lines:
+            hints[_component(line)] = os.path.basename(rp)
+            if stamp in os.path.basename(line):
+                pointed[os.path.join(prev_dir, line)] = (os.path.basename(rp), line)
+            else:
+                logging.info('%s points to %s, restart at %s is searched in RESTART directory', rp, line, stamp)
+    files = {}
+    pointers = {}
+    for fn in sorted(glob.glob(os.path.join(prev_dir, 'RESTART', '*.r.{}.nc'.format(stamp)))):
+        rel = os.path.relpath(fn, prev_dir)
+        files[fn] = rel
+        comp = _component(fn)
+        pointers.setdefault(hints.get(comp, POINTERS.get(comp, 'rpointer.{}'.format(comp))), []).append(rel)
+    # Restart files that are not in RESTART directory
+    found = [os.path.abspath(fn) for fn in files.keys()]
+    missing = []
+    for fn, (name, line) in pointed.items():
+        if os.path.abspath(fn) in found:
+            continue
+        if not os.path.isfile(fn):
+            missing.append(fn)
+            continue
+        files[fn] = line
+        pointers.setdefault(name, []).append(line)
+    if missing:
+        raise ValueError('Restart files {} are not found'.format(', '.join(missing)))
+    if not files:
+        raise ValueError('No restart file at {} is found in {}'.format(stamp, prev_dir))
+    return files, pointers
+
+def find_hotstart(prev_dir, pattern, seconds):
+    """
+    Returns SCHISM hotstart file of the previous cycle whose time matches with given time (in seconds from its start)
+    """
+    import netCDF4
+
+    found = []
+    for fn in sorted(glob.glob(os.path.join(prev_dir, pattern))):
+        with netCDF4.Dataset(fn) as nc:
+            time = float(nc.variables['time'][0])
+        found.append('{} ({} s)'.format(fn, time))
+        if abs(time-seconds) < 1.0:
+            return fn
+    raise ValueError('No hotstart file at {} s is found in {} ({})'.format(seconds, os.path.join(prev_dir, pattern), ', '.join(found) or 'no file'))
+
+def stage(files, pointers, rundir):
+    """
+    Stages restart files to the run directory and writes their pointer files
+    Returns list of staged files
+    """
+    staged = []
+    for src, dst in files.items():
+        dst = os.path.join(rundir, dst)
+        method = stage_file(src, dst, overwrite=True)
+        logging.info('Staged %s (%s)', dst, method)
+        staged.append(dst)
+    for name, lines in pointers.items():
+        with open(os.path.join(rundir, name), 'w') as f:
+            f.write('\n'.join(lines)+'\n')
+    return staged
+
+def update_attributes(driver):
+    """
+    Sets start type of the coupled run to continue in nuopc/driver section
+    """
+    for section in ['allcomp', 'med']:
+        if section in driver.keys() and 'attributes' in driver[section].keys():
+            if 'start_type' in driver[section]['attributes'].keys():
+                driver[section]['attributes']['start_type'] = 'continue'
+    return driver
@@ -0,0 +1,166 @@
+import os
+import re
+import sys
+import csv
+import json
+import logging
+import itertools
+from . import esmf_profile
+
+def parse_bounds(bounds):
+    """
+    Returns first and last PET of petlist_bounds (i.e. '0-2' or '0 2')
+    """
+    values = [int(v) for v in str(bounds).replace('-', ' ').split()]
+    return values[0], values[-1]
+
+def scale_layout(nuopc, cores):
+    """
+    Returns petlist_bounds of the components for given total number of cores
+    The cores of each group of components with overlapping PETs are scaled in proportion to the base layout
+    """
+    comps = {name: {'petlist': parse_bounds(val['petlist_bounds'])} for name, val in nuopc.items() if name != 'driver'}
+    groups = esmf_profile.pet_groups(comps)
+    sizes = [hi-lo+1 for lo, hi, _ in groups]
+    base = sum(sizes)
+    new = [max(1, int(round(cores*s/float(base)))) for s in sizes]
+    # Rounding error is given to (or taken from) the largest group
+    new[sizes.index(max(sizes))] += cores-sum(new)
+    if min(new) < 1:
+        logging.error('%d cores are not enough for %d groups of components', cores, len(groups))
+        sys.exit()
+    layout = {}
+    start = 0
+    for (lo, hi, names), size, n in zip(groups, sizes, new):
+        scale = n/float(size)
+        for name in names:
+            clo, chi = comps[name]['petlist']
+            first = start+int((clo-lo)*scale)
+            last = max(first, start+int(round((chi-lo+1)*scale))-1)
+            layout[name] = '{}-{}'.format(first, last)
+        start += n
+    return layout
+
+def set_interval(run_sequence, interval):
+    """
+    Returns run sequence with given coupling interval (in seconds) for the outer time loop
+    """
+    return re.sub(r'^(\s*)@\d+', r'\g<1>@{}'.format(int(interval)), run_sequence, count=1, flags=re.MULTILINE)
+
+def case_overrides(config, layout, threads, interval, driver_name):
+    """
+    Returns options of the case with the same structure used in the configuration file
+    """
+    nuopc = {name: {'petlist_bounds': bounds} for name, bounds in layout.items()}
+    for name, n in threads.items():
+        nuopc.setdefault(name, {})['omp_num_threads'] = n
+    if interval is not None:
+        nuopc['driver'] = {'runSequence': set_interval(config['nuopc']['driver']['runSequence'], interval)}
+    cores = max(parse_bounds(bounds)[1] for bounds in layout.values())+1
+    return {'nuopc': nuopc, driver_name: {'execution': {'batchargs': {'cores': cores}}}}, cores
+
+def cases(config, driver_name):
+    """
+    Returns cases of the scaling study given in scaling section, each case is a combination of
+    a layout (given explicitly or scaled from the base layout), thread counts and a coupling interval
+    """
+    cfg = config[driver_name]['scaling']
+    nuopc = config['nuopc']
+    components = [name for name in nuopc.keys() if name != 'driver']
+    layouts = {}
+    if 'cores' in cfg.keys():
+        for n in cfg['cores']:
+            layouts['c{}'.format(n)] = scale_layout(nuopc, n)
+    if 'layouts' in cfg.keys():
+        for name, layout in cfg['layouts'].items():
+            layouts[name] = dict(((comp, nuopc[comp]['petlist_bounds']) for comp in components), **layout)
+    if not layouts:
+        layouts['base'] = {comp: nuopc[comp]['petlist_bounds'] for comp in components}
+    threads = [{}]
+    if 'omp_num_threads' in cfg.keys():
+        threads = cfg['omp_num_threads']
+    intervals = [None]
+    if 'coupling_interval' in cfg.keys():
+        intervals = cfg['coupling_interval']
+
+    out = {}
+    for (lname, layout), nthreads, interval in itertools.product(layouts.items(), threads, intervals):
+        name = lname
+        if nthreads:
+            name += '_'+'_'.join('{}{}'.format(comp, n) for comp, n in sorted(nthreads.items()))
+        if interval is not None:
+            name += '_dt{}'.format(interval)
+        # Combinations whose cores can not be shared by the threads are left out
+        uneven = [comp for comp, n in nthreads.items() if (parse_bounds(layout[comp])[1]-parse_bounds(layout[comp])[0]+1) % n]
+        if uneven:
+            logging.warning('Skipping %s, cores of %s are not divisible by the number of threads', name, ', '.join(uneven))
+            continue
+        overrides, cores = case_overrides(config, layout, nthreads, interval, driver_name)
+        out[name] = {'overrides': overrides, 'cores': cores, 'layout': layout, 'threads': nthreads, 'interval': interval}
+    if not out:
+        logging.error('No case is left in the scaling study!')
+        sys.exit()
+    return out
+
+def write_cases(filename, study):
+    """
+    Writes description of the cases, it is used by the collector
+    """
+    with open(filename, 'w') as f:
+        json.dump({name: {key: val for key, val in case.items() if key != 'overrides'} for name, case in study.items()}, f, indent=2)
+
+def collect(rundir):
+    """
+    Returns one row for each case of the scaling study in given directory with the wall time
+    and run time of the components found in ESMF profile of the case
+    """
+    with open(os.path.join(rundir, 'scaling.json'), 'r') as f:
+        study = json.load(f)
+    rows = []
+    for name, case in study.items():
+        row = {'case': name, 'cores': case['cores'], 'interval': case['interval'],
+               'threads': ' '.join('{}={}'.format(k, v) for k, v in sorted(case['threads'].items())), 'wall': None}
+        summary, _ = esmf_profile.find_files(os.path.join(rundir, name)) if os.path.isdir(os.path.join(rundir, name)) else (None, None)
+        if summary is None or not os.path.isfile(summary):
+            logging.warning('No ESMF profile is found for %s', name)
+            rows.append(row)
+            continue
+        regions = esmf_profile.parse_summary(summary)
+        components, _ = esmf_profile.attribute(regions)
+        row['wall'] = esmf_profile.wall_time(regions)
+        for comp in case['layout'].keys():
+            label = comp.upper()
+            if label in components.keys():
+                row[label] = components[label]['run']
+        # Connectors (i.e. ATM-TO-MED) are reported together
+        row['connectors'] = sum(c['run'] for label, c in components.items() if '-TO-' in label)
+        rows.append(row)
+
+    # Speedup and parallel efficiency relative to the case with the fewest cores
+    timed = [r for r in rows if r['wall']]
+    if timed:
+        ref = min(timed, key=lambda r: (r['cores'], r['wall']))
+        for row in timed:
+            row['speedup'] = ref['wall']/row['wall']
+            row['efficiency'] = row['speedup']*ref['cores']/row['cores']
+    return rows
+
+def write_table(rows, filename=None):
+    """
+    Prints rows as a table or writes them to CSV file
+    """
+    columns = []
+    for row in rows:
+        columns += [c for c in row.keys() if not c in columns]
+    fmt = lambda v: '' if v is None else ('{:.2f}'.format(v) if isinstance(v, float) else str(v))
+    if filename:
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([fmt(row.get(c)) for c in columns])
+        return
+    widths = [max([len(c)]+[len(fmt(r.get(c))) for r in rows]) for c in columns]
+    print(' '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print(' '.join(fmt(row.get(c)).rjust(w) for c, w in zip(columns, widths)))
@@ -0,0 +1,95 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+def run_graph(jobs, max_workers=1):
+    """
+    Runs jobs concurrently by respecting their dependencies
+    jobs: dictionary of name: (callable, [dependency names]), the callable
+          is called with the results of its dependencies (in the same order)
+    Returns results and timing information (start and end time) of each job
+    """
+    # Check dependencies
+    for name, (_, deps) in jobs.items():
+        for dep in deps:
+            if dep not in jobs:
+                raise ValueError(f"Job {name} depends on unknown job {dep}")
+
+    results = {}
+    timing = {}
+    pending = dict(jobs)
+    t0 = time.perf_counter()
+
+    def _run(name, func, args):
+        start = time.perf_counter()-t0
+        try:
+            return func(*args)
+        finally:
+            timing[name] = {'start': start, 'end': time.perf_counter()-t0}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        running = {}
+        while pending or running:
+            # Submit jobs that have all dependencies completed, in the given order
+            for name in list(pending.keys()):
+                func, deps = pending[name]
+                if all(dep in results for dep in deps):
+                    args = [results[dep] for dep in deps]
+                    running[executor.submit(_run, name, func, args)] = name
+                    del pending[name]
+            if not running:
+                raise ValueError("Jobs have circular dependencies: {}".format(', '.join(pending.keys())))
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+
+    return results, timing
+
+def critical_path(jobs, timing):
+    """
+    Returns chain of jobs that determines total execution time
+    It starts from the job finished last and follows the dependency that finished last
+    """
+    if not timing:
+        return []
+    name = max(timing.keys(), key=lambda n: timing[n]['end'])
+    path = [name]
+    while jobs[name][1]:
+        name = max(jobs[name][1], key=lambda n: timing[n]['end'])
+        path.insert(0, name)
+    return path
+
+def report(jobs, timing, label='Jobs'):
+    """
+    Logs duration of each job and the critical path
+    """
+    duration = lambda n: timing[n]['end']-timing[n]['start']
+    for name in sorted(timing.keys(), key=lambda n: timing[n]['start']):
+        logging.info('%s: %s took %.2f s (%.2f s - %.2f s)', label, name, duration(name), timing[name]['start'], timing[name]['end'])
+    path = critical_path(jobs, timing)
+    wall = max(t['end'] for t in timing.values()) if timing else 0.0
+    serial = sum(duration(n) for n in timing.keys())
+    logging.info('%s: wall time %.2f s, sum of job times %.2f s', label, wall, serial)
+    logging.info('%s: critical path %s', label, ' -> '.join('{} ({:.2f} s)'.format(n, duration(n)) for n in path))
+    return path
+
+@contextmanager
+def job_log(filename):
+    """
+    Writes log records of the calling thread (job) to the file while the context is active
+    Unlike swapping stdout, the records of other jobs running at the same time are not captured
+    """
+    handler = logging.FileHandler(filename, mode='w', encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    ident = threading.get_ident()
+    handler.addFilter(lambda record: record.thread == ident)
+    logger = logging.getLogger()
+    logger.addHandler(handler)
+    try:
+        yield handler
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
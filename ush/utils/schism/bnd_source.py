@@ -0,0 +1,263 @@
+import os
+import sys
+import glob
+import logging
+from datetime import timedelta
+import numpy as np
+from .thnc import ThWriter
+from .vgrid import boundary_zcor
+
+# Default variable names used in HYCOM (GOFS 3.1) files
+HYCOM_VARIABLES = {
+    'elev': 'surf_el',
+    'temp': 'water_temp',
+    'salt': 'salinity',
+    'u': 'water_u',
+    'v': 'water_v',
+    'lon': 'lon',
+    'lat': 'lat',
+    'depth': 'depth',
+    'time': 'time'
+}
+
+def get_source(config=None):
+    """
+    Returns boundary data source based on given configuration
+    """
+    # Default is remote HYCOM access through pyschism
+    if not config:
+        return RemoteHycomSource()
+    protocol = 'remote'
+    if 'protocol' in config.keys():
+        protocol = config['protocol']
+    if protocol == 'remote':
+        return RemoteHycomSource()
+    elif protocol == 'local':
+        return LocalHycomSource(config)
+    else:
+        logging.error("Given boundary data protocol %s is not supported!", protocol)
+        sys.exit()
+
+class RemoteHycomSource:
+    """
+    HYCOM data retrieved from remote THREDDS server using pyschism
+    """
+
+    def fetch(self, hgrid, vgrid_file, output_dir, start_date, rnday, ocean_bnd_ids, elev2D=True, TS=True, UV=True, zlib=False, shuffle=False):
+        from pyschism.forcing.hycom.hycom2schism import OpenBoundaryInventory
+
+        # NOTE: Files are written by pyschism, compression options are not used
+        bnd = OpenBoundaryInventory(hgrid, vgrid_file)
+        bnd.fetch_data(output_dir, start_date, rnday, elev2D=elev2D, TS=TS, UV=UV, ocean_bnd_ids=ocean_bnd_ids)
+
+    def input_files(self, start_date, rnday):
+        """
+        Returns local files read by the source, remote data has none
+        """
+        return []
+
+class LocalHycomSource:
+    """
+    HYCOM data read from local pre-staged archive (netCDF files or zarr stores)
+    """
+
+    def __init__(self, config):
+        if not 'directory' in config.keys():
+            logging.error("Local boundary data source requires 'directory' option!")
+            sys.exit()
+        self.directory = config['directory']
+        # File name pattern, processed by strftime to find files for given date
+        self.pattern = '*%Y%m%d*'
+        if 'pattern' in config.keys():
+            self.pattern = config['pattern']
+        # Time interval between boundary records (in hours)
+        self.interval = 24
+        if 'interval' in config.keys():
+            self.interval = config['interval']
+        # Variable names
+        self.variables = dict(HYCOM_VARIABLES)
+        if 'variables' in config.keys():
+            self.variables.update(config['variables'])
+
+    def files(self, date):
+        """
+        Returns list of files (or zarr stores) in the archive for given date
+        """
+        files = glob.glob(os.path.join(self.directory, date.strftime(self.pattern)))
+        files = [f for f in files if os.path.isfile(f) or f.rstrip('/').endswith('.zarr')]
+        files.sort()
+        return files
+
+    def dates(self, start_date, rnday):
+        """
+        Returns dates of the boundary records
+        """
+        interval = timedelta(hours=self.interval)
+        ntimes = int(timedelta(days=rnday)/interval)+1
+        return [start_date+i*interval for i in range(ntimes)]
+
+    def input_files(self, start_date, rnday):
+        """
+        Returns files of the archive read for the boundary records, the metadata file is used for zarr stores
+        """
+        inputs = []
+        for date in self.dates(start_date, rnday):
+            for f in self.files(date):
+                if f.rstrip('/').endswith('.zarr'):
+                    meta = [os.path.join(f, name) for name in ['zarr.json', '.zmetadata'] if os.path.isfile(os.path.join(f, name))]
+                    f = meta[0] if meta else f
+                if not f in inputs:
+                    inputs.append(f)
+        return inputs
+
+    def open(self, date):
+        """
+        Lazily opens archive file that includes given date
+        """
+        import xarray as xr
+
+        files = self.files(date)
+        if not files:
+            logging.error("No file found for %s in %s with pattern %s", date, self.directory, self.pattern)
+            sys.exit()
+        name = self.variables['time']
+        for f in files:
+            # Use chunks={} to keep on-disk chunking, nothing is read until the data is accessed
+            if f.rstrip('/').endswith('.zarr'):
+                ds = xr.open_zarr(f, chunks={})
+            else:
+                ds = xr.open_dataset(f, engine='netcdf4', chunks={})
+            times = ds[name].to_numpy()
+            idxs = np.where(np.abs(times-np.datetime64(date)) < np.timedelta64(30, 'm'))[0]
+            if len(idxs) > 0:
+                logging.info("Reading boundary data for %s from %s", date, f)
+                return ds.isel({name: idxs[0]})
+            ds.close()
+        logging.error("Date %s could not found in %s", date, ' '.join(files))
+        sys.exit()
+
+    def window(self, ds, blon, blat, pad=0.5):
+        """
+        Returns lat/lon index windows that covers given points, aligned with chunks in the archive
+        """
+        lon = ds[self.variables['lon']].to_numpy()
+        lat = ds[self.variables['lat']].to_numpy()
+        lat_idxs = np.where((lat >= blat.min()-pad) & (lat <= blat.max()+pad))[0]
+        lon_idxs = np.where((lon >= blon.min()-pad) & (lon <= blon.max()+pad))[0]
+        if lat_idxs.size == 0 or lon_idxs.size == 0:
+            logging.error("Open boundary is not covered by the data found in %s", self.directory)
+            sys.exit()
+        # Find chunk sizes of the data
+        var = ds[self.variables['elev']]
+        chunks = var.encoding.get('chunksizes', var.encoding.get('chunks', None))
+        lat_chunk = lon_chunk = 1
+        if chunks:
+            lat_chunk, lon_chunk = chunks[-2:]
+        # Expand window to chunk boundaries, partial chunk reads cost as much as full ones
+        lat_idx1 = (lat_idxs[0]//lat_chunk)*lat_chunk
+        lat_idx2 = min(((lat_idxs[-1]//lat_chunk)+1)*lat_chunk, lat.size)
+        lon_idx1 = (lon_idxs[0]//lon_chunk)*lon_chunk
+        lon_idx2 = min(((lon_idxs[-1]//lon_chunk)+1)*lon_chunk, lon.size)
+        return slice(lat_idx1, lat_idx2), slice(lon_idx1, lon_idx2)
+
+    def fetch(self, hgrid, vgrid_file, output_dir, start_date, rnday, ocean_bnd_ids, elev2D=True, TS=True, UV=True, zlib=False, shuffle=False):
+        # Get open boundary nodes
+        gdf = hgrid.boundaries.open.copy()
+        nodes = np.concatenate([np.asarray(gdf.iloc[ibnd].indexes, dtype=np.int64) for ibnd in ocean_bnd_ids])
+        nop = nodes.size
+
+        # Calculate zcor (positive downward) of open boundary nodes for 3d fields, in the order of the boundaries
+        zcor = None
+        nvrt = 1
+        if TS or UV:
+            zcor = -boundary_zcor(vgrid_file, nodes, -hgrid.values[nodes])
+            nvrt = zcor.shape[1]
+
+        # Create time vector
+        timevector = self.dates(start_date, rnday)
+
+        # Create output files, records are streamed to them
+        dt = timedelta(hours=self.interval).total_seconds()
+        writers = {}
+        if elev2D:
+            writers['elev'] = ThWriter(os.path.join(output_dir, 'elev2D.th.nc'), nop, 1, 1, time_step=dt, zlib=zlib, shuffle=shuffle)
+        if TS:
+            writers['salt'] = ThWriter(os.path.join(output_dir, 'SAL_3D.th.nc'), nop, nvrt, 1, time_step=dt, zlib=zlib, shuffle=shuffle)
+            writers['temp'] = ThWriter(os.path.join(output_dir, 'TEM_3D.th.nc'), nop, nvrt, 1, time_step=dt, zlib=zlib, shuffle=shuffle)
+        if UV:
+            writers['uv'] = ThWriter(os.path.join(output_dir, 'uv3D.th.nc'), nop, nvrt, 2, time_step=dt, zlib=zlib, shuffle=shuffle)
+        try:
+            for time, values in self.records(hgrid, zcor, timevector, ocean_bnd_ids, list(writers.keys())):
+                for key, writer in writers.items():
+                    writer.write(time, values[key])
+        except BaseException:
+            for writer in writers.values():
+                writer.abort()
+            raise
+        for writer in writers.values():
+            writer.close()
+
+    def records(self, hgrid, zcor, timevector, ocean_bnd_ids, keys):
+        """
+        Yields values interpolated to open boundary nodes for each time
+        """
+        from pyschism.forcing.hycom.hycom2schism import transform_ll_to_cpp, interp_to_points_2d, interp_to_points_3d, ConvertTemp
+
+        gdf = hgrid.boundaries.open.copy()
+        nop = sum(len(gdf.iloc[ibnd].indexes) for ibnd in ocean_bnd_ids)
+        nvrt = 1 if zcor is None else zcor.shape[1]
+        v = self.variables
+        for date in timevector:
+            # Single time slice for each variable
+            out = {}
+            if 'elev' in keys:
+                out['elev'] = np.zeros(nop)
+            if 'salt' in keys:
+                out['salt'] = np.zeros((nop, nvrt))
+                out['temp'] = np.zeros((nop, nvrt))
+            if 'uv' in keys:
+                out['uv'] = np.zeros((nop, nvrt, 2))
+            ds = self.open(date)
+            ind1 = 0
+            ind2 = 0
+            for ibnd in ocean_bnd_ids:
+                opbd = list(gdf.iloc[ibnd].indexes)
+                ind1 = ind2
+                ind2 = ind1+len(opbd)
+                blon = hgrid.coords[opbd,0]
+                blat = hgrid.coords[opbd,1]
+                # Use same longitude convention with the data
+                if ds[v['lon']].max() > 180.0:
+                    blon = blon % 360.0
+                # Read only required part of the data
+                lat_win, lon_win = self.window(ds, blon, blat)
+                sub = ds.isel({v['lat']: lat_win, v['lon']: lon_win}).load()
+                blonc = blon.mean()
+                blatc = blat.mean()
+                x2, y2 = transform_ll_to_cpp(sub[v['lon']].to_numpy(), sub[v['lat']].to_numpy(), blonc, blatc)
+                xi, yi = transform_ll_to_cpp(blon, blat, blonc, blatc)
+                bxy = np.c_[yi, xi]
+                if zcor is not None:
+                    zcor2 = zcor[ind1:ind2,:].copy()
+                    zcor2[zcor2 > 5000] = 5000.0-1.0e-6
+                    x2i = np.tile(xi, [nvrt,1]).T
+                    y2i = np.tile(yi, [nvrt,1]).T
+                    bxyz = np.c_[zcor2.reshape(np.size(zcor2)), y2i.reshape(np.size(y2i)), x2i.reshape(np.size(x2i))]
+                    dep = sub[v['depth']].to_numpy()
+                # Interpolate
+                if 'elev' in keys:
+                    ssh = np.squeeze(sub[v['elev']].to_numpy())
+                    out['elev'][ind1:ind2] = interp_to_points_2d(y2, x2, bxy, ssh)
+                if 'salt' in keys:
+                    salt = np.squeeze(sub[v['salt']].to_numpy())
+                    temp = np.squeeze(sub[v['temp']].to_numpy())
+                    out['salt'][ind1:ind2,:] = interp_to_points_3d(dep, y2, x2, bxyz, salt).reshape(zcor2.shape)
+                    ptemp = ConvertTemp(salt, temp, dep)
+                    out['temp'][ind1:ind2,:] = interp_to_points_3d(dep, y2, x2, bxyz, ptemp).reshape(zcor2.shape)
+                if 'uv' in keys:
+                    uvel = np.squeeze(sub[v['u']].to_numpy())
+                    vvel = np.squeeze(sub[v['v']].to_numpy())
+                    out['uv'][ind1:ind2,:,0] = interp_to_points_3d(dep, y2, x2, bxyz, uvel).reshape(zcor2.shape)
+                    out['uv'][ind1:ind2,:,1] = interp_to_points_3d(dep, y2, x2, bxyz, vvel).reshape(zcor2.shape)
+            ds.close()
+            yield (date-timevector[0]).total_seconds(), out
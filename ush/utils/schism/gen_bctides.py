@@ -68,13 +68,11 @@ Last Updated: January 2025
 """
 
 import os
+import sys
 import numpy as np
 import logging
-from netCDF4 import Dataset
-from pyschism.mesh.vgrid import Vgrid
-from pyschism.mesh import Hgrid
-from pyschism.forcing.bctides import Bctides
-from pyschism.forcing.hycom.hycom2schism import OpenBoundaryInventory
+from .thnc import write_th_nc
+from .utils import load_mesh
 
 def create_boundary_flags(num_nodes, bc_type, additional_flags=None):
     """
@@ -104,51 +102,25 @@ def create_boundary_flags(num_nodes, bc_type, additional_flags=None):
     
     return flags
 
-def create_elev2d_th_nc(filename, timeseries_data, hgrid, vgrid):
+def create_elev2d_th_nc(filename, timeseries_data, hgrid, vgrid, zlib=False, shuffle=False):
     open_boundaries = hgrid.boundaries.open
     nOpenBndNodes = sum(len(boundary) for boundary in open_boundaries['indexes'])
     time_data = timeseries_data[:, 0]
     elev_data = timeseries_data[:, 1]
-    
-    with Dataset(filename, 'w', format='NETCDF4') as nc:
-
-        # Define dimensions
-        nc.createDimension('nComponents', 1)
-        nc.createDimension('nLevels', 1)
-        nc.createDimension('time', None)
-        nc.createDimension('nOpenBndNodes', nOpenBndNodes)
-        nc.createDimension('one', 1)
-        
-        # Create variables
-        nComponents = nc.createVariable('nComponents', 'f8', ('nComponents',))
-        nComponents.point_spacing = "even"
-        nComponents.axis = "X"
-        
-        nLevels = nc.createVariable('nLevels', 'f8', ('nLevels',))
-        nLevels.point_spacing = "even"
-        nLevels.axis = "Y"
-        
-        time = nc.createVariable('time', 'f8', ('time',))
-        time[:] = time_data
-        
-        time_series = nc.createVariable('time_series', 'f4', 
-                                      ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-        for t in range(len(time_data)):
-            time_series[t, :, 0, 0] = elev_data[t]
-            
-        time_step = nc.createVariable('time_step', 'f4', ('one',))
-        time_step[:] = time_data[1] - time_data[0]
-        
-        nc.Conventions = "CF-1.6"
-        nc.history = "Created by SCHISM boundary condition generator"
+
+    # Same elevation is applied to all open boundary nodes
+    records = ((time_data[t], elev_data[t]) for t in range(len(time_data)))
+    write_th_nc(filename, records, nOpenBndNodes, time_step=time_data[1]-time_data[0], zlib=zlib, shuffle=shuffle)
 
 def create_elev2d_from_hycom(hgrid, vgrid, outdir, start_date, rnday, ocean_bnd_ids=None, elev2D=True, TS=False, UV=False, hgrid_file=None):
+    from pyschism.forcing.hycom.hycom2schism import OpenBoundaryInventory
+
     if ocean_bnd_ids is None:
         num_boundaries, _ = read_hgrid_boundaries(hgrid_file)
         ocean_bnd_ids = list(range(num_boundaries))
     
-    # Convert vgrid object to path string if needed
-    vgrid_path = vgrid.path if hasattr(vgrid, 'path') else args.vgrid
+    # pyschism reads the vertical grid by its path
+    vgrid_path = vgrid.path if hasattr(vgrid, 'path') else vgrid
     
     try:
         logging.info("elev2D = %s, TS = %s, UV = %s", elev2D, TS, UV)
@@ -160,7 +132,7 @@ def create_elev2d_from_hycom(hgrid, vgrid, outdir, start_date, rnday, ocean_bnd_
         logging.error("Error details: hgrid type is %s and vgrid type is %s", type(hgrid), type(vgrid))
         raise e
     
-def read_hgrid_boundaries(hgrid_file):
+def read_hgrid_boundaries(hgrid_file, cache=True):
     """
     Read boundary information from hgrid.ll file
     Supports multiple formats:
@@ -170,9 +142,15 @@ def read_hgrid_boundaries(hgrid_file):
     Returns:
         - Number of open boundaries
         - List of number of nodes for each boundary
+    The parsed grid is not written to the cache if cache is False
     """
     if not os.path.exists(hgrid_file):
         raise FileNotFoundError(f"hgrid.ll file not found: {hgrid_file}")
+
+    # Boundaries of the parsed (cached) grid are used, the file is only searched if they could not be found
+    mesh = load_mesh(hgrid_file, cache=cache)
+    if mesh.open_boundaries:
+        return len(mesh.open_boundaries), [len(b) for b in mesh.open_boundaries]
         
     with open(hgrid_file, 'r') as f:
         lines = f.readlines()
@@ -242,15 +220,21 @@ def read_hgrid_boundaries(hgrid_file):
 
 def write_timelev_bctides(outdir, start_date, flags):
     """Write timeseries of water elevation bctides.in file for type 4 boundary conditions"""
-    with open(f"{outdir}/bctides.in", 'w') as f:
+    filename = os.path.join(outdir, 'bctides.in')
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'w') as f:
         f.write(f"{start_date.strftime('%m/%d/%Y %H:%M:%S')} UTC\n")
         f.write(" 0  0.000   ! number of earth tidal potential, cut-off depth\n")
         f.write(" 0          ! number of boundary forcing freqs\n")
         f.write(f" {len(flags)}          ! number of open boundaries\n")
         for flag in flags:
             f.write(f" {' '.join(map(str, flag))} ! type of b.c.\n")
+    os.replace(tmp, filename)
 
 def execute(opts, start_date, rnday, output_dir="./"):
+    from pyschism.mesh import Hgrid
+    from pyschism.forcing.bctides import Bctides
+
     # Check grid files
     if os.path.exists(opts["hgrid"]):
         hgrid = opts["hgrid"]
@@ -320,6 +304,12 @@ def execute(opts, start_date, rnday, output_dir="./"):
             gen_bc = opts["gen_bc"]
         else:
             gen_bc = "elev"
+        zlib = False
+        if "zlib" in opts["bctides"].keys():
+            zlib = opts["bctides"]["zlib"]
+        shuffle = False
+        if "shuffle" in opts["bctides"].keys():
+            shuffle = opts["bctides"]["shuffle"]
 
     # Generate files 
     try:
@@ -327,8 +317,9 @@ def execute(opts, start_date, rnday, output_dir="./"):
         flags = create_boundary_flags(nodes_per_boundary, bc_type, additional_flags)
         
         if bc_mode == 'time-elev':
+            # Vertical grid is only read by the HYCOM source (by its path), it is not parsed here
+            hgrid_file = hgrid
             hgrid = Hgrid.open(hgrid, crs="epsg:4326")
-            vgrid = Vgrid.open(vgrid) if vgrid else None
             
             # Generate bctides.in
             write_timelev_bctides(output_dir, start_date, flags)
@@ -338,7 +329,7 @@ def execute(opts, start_date, rnday, output_dir="./"):
                 if not elev_th:
                     raise ValueError("Elevation timeseries file (--elev_th) required for timeseries mode")
                 timeseries_data = np.loadtxt(elev_th)
-                create_elev2d_th_nc('elev2D.th.nc', timeseries_data, hgrid, vgrid)
+                create_elev2d_th_nc(os.path.join(output_dir, 'elev2D.th.nc'), timeseries_data, hgrid, vgrid, zlib=zlib, shuffle=shuffle)
             elif elev_source == 'hycom':
                 # Convert options to booleans
                 elev2D = 'elev' in gen_bc
@@ -349,13 +340,16 @@ def execute(opts, start_date, rnday, output_dir="./"):
 
                 create_elev2d_from_hycom(hgrid, vgrid, output_dir, start_date, rnday,
                                          ocean_bnd_ids=ocean_bnd_ids, elev2D=elev2D, TS=TS, UV=UV,
-                                         hgrid_file=hgrid)
+                                         hgrid_file=hgrid_file)
                 
 
             logging.info("Successfully generated boundary files:")
             logging.info("  bctides.in  : %s", output_dir)
-            logging.info("  elev2D.th.nc: %s", os.path.abspath('elev2D.th.nc'))
+            logging.info("  elev2D.th.nc: %s", os.path.abspath(os.path.join(output_dir, 'elev2D.th.nc')))
             logging.info("  Start date  : %s", start_date)
+
+            # Return list of files that are generated (used in workflow level)
+            return(output_files(opts, output_dir=output_dir))
         else:
             # Verify required tidal arguments
             if not constituents or not database:
@@ -451,8 +445,36 @@ def execute(opts, start_date, rnday, output_dir="./"):
             )
 
             # Return list of files that are generated (used in workflow level)
-            return([os.path.join(output_dir, 'bctides.in')])
+            return(output_files(opts, output_dir=output_dir))
 
     except Exception as e:
         logging.error(str(e))
         sys.exit()
+
+def output_files(opts, output_dir="./"):
+    """
+    Returns list of files that will be generated
+    """
+    files = ['bctides.in']
+    if "bctides" in opts.keys() and "mode" in opts["bctides"].keys():
+        if opts["bctides"]["mode"] == 'time-elev':
+            files.append('elev2D.th.nc')
+    return([os.path.join(output_dir, name) for name in files])
+
+def input_files(opts):
+    """
+    Returns list of files (elevation time series, TPXO database) used to generate the files
+    """
+    files = []
+    bctides = opts.get("bctides") or {}
+    if "elev_th" in bctides.keys():
+        files.append(bctides["elev_th"])
+    database = "tpxo"
+    if "database" in bctides.keys():
+        database = bctides["database"]
+    if database == "tpxo":
+        if "tpxo_dir" in bctides.keys():
+            files += [os.path.join(bctides["tpxo_dir"], name) for name in ["h_tpxo9.v1.nc", "u_tpxo9.v1.nc"]]
+        else:
+            files += [os.environ[name] for name in ["TPXO_ELEVATION", "TPXO_VELOCITY"] if name in os.environ.keys()]
+    return(files)
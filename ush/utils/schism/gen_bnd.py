@@ -1,22 +1,26 @@
 import os
 import sys
 import logging
-try:
-    import pyschism
-    from pyschism.mesh.hgrid import Hgrid
-    from pyschism.forcing.hycom.hycom2schism import OpenBoundaryInventory
-except ImportError as ie:
-    logging.error(str(ie))
-    sys.exit()
+from . import bnd_source
 
-def execute(hgrid_file, vgrid_file, start_date, rnday, ocean_bnd_ids, output_dir="./", output_vars=[True,True,True]):
+def execute(hgrid_file, vgrid_file, start_date, rnday, ocean_bnd_ids, output_dir="./", output_vars=[True,True,True], source=None, zlib=False, shuffle=False):
     '''
+    source:
+        boundary data source configuration (remote HYCOM access if it is not given)
+    zlib, shuffle:
+        compression options for the files written by the local source
     outputs:
         elev2D.th.nc (elev=True)
         SAL_3D.th.nc (TS=True)
         TEM_3D.th.nc (TS=True)
         uv3D.th.nc   (UV=True)
     '''
+    try:
+        from pyschism.mesh.hgrid import Hgrid
+    except ImportError as ie:
+        logging.error(str(ie))
+        sys.exit()
+
     # read horizontal grid
     if os.path.exists(hgrid_file):
         hgrid = Hgrid.open(hgrid_file, crs='epsg:4326')
@@ -24,18 +28,23 @@ def execute(hgrid_file, vgrid_file, start_date, rnday, ocean_bnd_ids, output_dir
         logging.error("The file %s does not exist.", hgrid_file)
         sys.exit()
 
-    # create open boundary object
-    if os.path.exists(vgrid_file):
-        bnd = OpenBoundaryInventory(hgrid, vgrid_file)
-    else:
+    # check vertical grid
+    if not os.path.exists(vgrid_file):
         logging.error("The file %s does not exist.", vgrid_file)
         sys.exit()
 
     # create open boundary data files
     # ocean_bnd_ids - segment indices, starting from zero
-    bnd.fetch_data(output_dir, start_date, rnday, elev2D=output_vars[0], TS=output_vars[1], UV=output_vars[2], ocean_bnd_ids=ocean_bnd_ids)
+    bnd = bnd_source.get_source(source)
+    bnd.fetch(hgrid, vgrid_file, output_dir, start_date, rnday, ocean_bnd_ids, elev2D=output_vars[0], TS=output_vars[1], UV=output_vars[2], zlib=zlib, shuffle=shuffle)
 
     # return list of files that is generated (used in workflow level)
+    return(output_files(output_vars, output_dir=output_dir))
+
+def output_files(output_vars, output_dir="./"):
+    """
+    Returns list of files that will be generated
+    """
     output_vars_keys = ['elev2D', 'TS', 'UV']
     output_vars_dict = dict(zip(output_vars_keys, output_vars))
     output_vars_active = [key for key,val in output_vars_dict.items() if val]
@@ -49,3 +58,9 @@ def execute(hgrid_file, vgrid_file, start_date, rnday, ocean_bnd_ids, output_dir
         elif bnd_var == 'UV':
             bnd_files.append('uv3D.th.nc')
     return([os.path.join(output_dir, name) for name in bnd_files])
+
+def input_files(source, start_date, rnday):
+    """
+    Returns list of local files (boundary data archive) used to generate the files
+    """
+    return(bnd_source.get_source(source).input_files(start_date, rnday))
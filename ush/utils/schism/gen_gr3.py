@@ -1,6 +1,8 @@
 import os
+import sys
 from uwtools.exceptions import UWConfigError
-from pyschism.mesh.hgrid import Gr3
+from .utils import load_mesh, write_gr3
+from .sampling import node_values, input_files as spatial_inputs
 
 def execute(opts, output_dir="./"):
     # Read in horizontal grid
@@ -9,8 +11,7 @@ def execute(opts, output_dir="./"):
     else:
         print("The file {} does not exist.".format(opts["hgrid"]))
         sys.exit()    
-    hgrid = Gr3.open(hgrid_file, crs='epsg:4326')
-    grd = hgrid.copy()
+    mesh = load_mesh(hgrid_file)
 
     # Check output directory and create it if it is not created
     if not os.path.isdir(output_dir):
@@ -20,11 +21,27 @@ def execute(opts, output_dir="./"):
            raise UWConfigError(f"An error occurred {output_dir}") from e
 
     # Set file names
+    description, gr3_names, values = gr3_properties(opts)
+
+    for name, value in zip(gr3_names, values):
+        # Set output file name
+        ofile = os.path.join(output_dir, f'{name}.gr3')
+
+        # Constant or spatially varying (raster, polygons) values of the nodes
+        write_gr3(ofile, mesh, node_values(value, mesh.x, mesh.y), description=description)
+
+    # return list of files that is generated (used in workflow level)
+    return(output_files(opts, output_dir=output_dir))
+
+def gr3_properties(opts):
+    """
+    Returns description, names and values of gr3 files
+    """
+    description = "description"
     gr3_names = []
     values = []
     if "gr3" in opts.keys():
         # Check description
-        description = "description"
         if "description" in opts["gr3"].keys():
             description = opts["gr3"]["description"]
 
@@ -37,37 +54,18 @@ def execute(opts, output_dir="./"):
         # Parameters
         gr3_names = ['albedo', 'diffmax', 'diffmin', 'watertype', 'windrot_geo2proj','manning']
         values = [2.000000e-1, 1.0, 1e-6, 4, 0.00000000, 2.5000000e-02]
+    return description, gr3_names, values
 
-    for name, value in zip(gr3_names, values):
-        # Set output file name
-        ofile = os.path.join(output_dir, f'{name}.gr3')
-
-        with open(ofile, 'w') as f:
-            f.write(f"{description}\n")
-            f.write(f"{grd.triangles.shape[0]} {grd.values.shape[0]}\n")
-
-            for i in range(grd.values.shape[0]):
-                x, y = grd.coords[i]
-                if isinstance(value, float):
-                    value_str = f"{value:.6e}"
-                else:
-                    value_str = str(value)
-
-                # Format each value with desired spacing
-                formatted_id = f"{i + 1}"
-                formatted_x = f"{x:.6f}"
-                formatted_y = f"{y:.6f}"
-                formatted_value = value_str.replace('e-0', 'e-')  # Remove leading zero in exponent
-
-                # Ensure exactly 5 spaces between ID and X coordinate
-                id_field = formatted_id.ljust(len(formatted_id) + 5)
-
-                # Write the formatted line to the file with correct spacing
-                f.write(f"{id_field}{formatted_x}{' ' * 6}{formatted_y} {formatted_value}\n")
-
-            for i in range(grd.triangles.shape[0]):
-                elem = grd.triangles[i]
-                f.write(f"{i+1} 3 {elem[0]+1} {elem[1]+1} {elem[2]+1}\n")
-
-    # return list of files that is generated (used in workflow level)
+def output_files(opts, output_dir="./"):
+    """
+    Returns list of files that will be generated
+    """
+    _, gr3_names, _ = gr3_properties(opts)
     return([os.path.join(output_dir, f'{name}.gr3') for name in gr3_names])
+
+def input_files(opts):
+    """
+    Returns list of files (rasters, polygons) used by spatially varying gr3 properties
+    """
+    _, _, values = gr3_properties(opts)
+    return([fn for value in values for fn in spatial_inputs(value)])
@@ -0,0 +1,153 @@
+import os
+import sys
+import logging
+import numpy as np
+from .utils import load_mesh, cache_file, _save_npz, WRITE_CHUNK
+
+# Name of the file SCHISM reads instead of partitioning the mesh with ParMETIS
+PARTITION_FILE = 'partition.prop'
+
+def element_graph(mesh):
+    """
+    Returns dual graph of the mesh in compressed (CSR) format (xadj, adjncy)
+    Two elements are neighbors if they share a side
+    """
+    conn = mesh.elements
+    tri = conn[:,3] < 0
+    # Sides of each element, the third side of triangles goes back to the first node
+    nxt = conn[:,[1,2,3,0]].copy()
+    nxt[tri,2] = conn[tri,0]
+    valid = np.ones(conn.shape, dtype=bool)
+    valid[tri,3] = False
+    a, b = conn[valid], nxt[valid]
+    elem = np.repeat(np.arange(mesh.nelements), valid.sum(axis=1))
+    key = np.minimum(a, b).astype(np.int64)*mesh.nnodes+np.maximum(a, b)
+    order = np.argsort(key, kind='stable')
+    key, elem = key[order], elem[order]
+    # Interior sides appear twice, once for each element
+    shared = np.flatnonzero(key[1:] == key[:-1])
+    e1, e2 = elem[shared], elem[shared+1]
+    src = np.concatenate((e1, e2))
+    dst = np.concatenate((e2, e1))
+    order = np.argsort(src, kind='stable')
+    xadj = np.zeros(mesh.nelements+1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=mesh.nelements), out=xadj[1:])
+    return xadj, dst[order]
+
+def centroids(mesh):
+    """
+    Returns centroids of the elements, longitudes are scaled with cosine of the latitude for geographic meshes
+    """
+    conn = mesh.elements
+    n = np.where(conn[:,3] < 0, 3, 4)
+    idx = np.where(conn < 0, conn[:,:1], conn)
+    x = np.where(conn < 0, 0.0, mesh.x[idx]).sum(axis=1)/n
+    y = np.where(conn < 0, 0.0, mesh.y[idx]).sum(axis=1)/n
+    if np.abs(mesh.x).max() <= 360 and np.abs(mesh.y).max() <= 90:
+        x = x*np.cos(np.radians(y.mean()))
+    return x, y
+
+def bisect(x, y, nparts):
+    """
+    Recursive coordinate bisection, each part is split along its longer side
+    in proportion to the number of parts on each side
+    """
+    parts = np.zeros(x.size, dtype=np.int64)
+    stack = [(np.arange(x.size), 0, nparts)]
+    while stack:
+        idx, first, n = stack.pop()
+        if n == 1 or idx.size == 0:
+            parts[idx] = first
+            continue
+        left = n//2
+        k = idx.size*left//n
+        coord = x[idx] if np.ptp(x[idx]) >= np.ptp(y[idx]) else y[idx]
+        order = np.argpartition(coord, k) if 0 < k < idx.size else np.argsort(coord)
+        stack.append((idx[order[:k]], first, left))
+        stack.append((idx[order[k:]], first+left, n-left))
+    return parts
+
+def metis(mesh, nparts):
+    """
+    Partitions dual graph of the mesh with METIS (pymetis)
+    """
+    import pymetis
+
+    xadj, adjncy = element_graph(mesh)
+    _, parts = pymetis.part_graph(nparts, xadj=xadj, adjncy=adjncy)
+    return np.asarray(parts, dtype=np.int64)
+
+def partition(mesh, nparts, method='auto'):
+    """
+    Returns part (zero-based rank) of each element and the method used
+    method: metis, rcb (recursive coordinate bisection) or auto (metis if pymetis is available)
+    """
+    if method == 'auto':
+        try:
+            import pymetis
+            method = 'metis'
+        except ImportError:
+            logging.info('pymetis is not available, mesh is partitioned with recursive coordinate bisection')
+            method = 'rcb'
+    if nparts == 1:
+        return np.zeros(mesh.nelements, dtype=np.int64), method
+    if method == 'metis':
+        return metis(mesh, nparts), method
+    if method == 'rcb':
+        return bisect(*centroids(mesh), nparts), method
+    logging.error('Unknown partitioning method %s, it can be auto, metis or rcb.', method)
+    sys.exit()
+
+def load_partition(hgrid_fname, nparts, method='auto', cache=True, cache_dir=None):
+    """
+    Returns partition of the horizontal grid, partitions are cached for each grid, method and number of parts
+    """
+    mesh = load_mesh(hgrid_fname, cache=cache, cache_dir=cache_dir)
+    if not cache:
+        return partition(mesh, nparts, method)[0]
+    cfiles = [cache_file(hgrid_fname, 'partition.{}.{}'.format(m, nparts), cache_dir) for m in (['metis', 'rcb'] if method == 'auto' else [method])]
+    for cfile in cfiles:
+        if os.path.isfile(cfile):
+            try:
+                with np.load(cfile) as data:
+                    return data['parts']
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning('Ignoring partition cache %s: %s', cfile, str(e))
+    parts, method = partition(mesh, nparts, method)
+    try:
+        _save_npz(cache_file(hgrid_fname, 'partition.{}.{}'.format(method, nparts), cache_dir), parts=parts)
+    except OSError as e:
+        logging.info('Partition cache could not be written: %s', str(e))
+    return parts
+
+def write_partition(filename, parts):
+    """
+    Writes element id (one-based) and rank of each element
+    """
+    ids = np.arange(1, parts.size+1)
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'w') as f:
+        for start in range(0, parts.size, WRITE_CHUNK):
+            rows = np.column_stack((ids[start:start+WRITE_CHUNK], parts[start:start+WRITE_CHUNK]))
+            f.write(('%d %d\n'*rows.shape[0]) % tuple(rows.ravel().tolist()))
+    os.replace(tmp, filename)
+    return filename
+
+def execute(opts, nparts, output_dir="./"):
+    if not os.path.exists(opts["hgrid"]):
+        logging.error("The file %s does not exist.", opts["hgrid"])
+        sys.exit()
+    os.makedirs(output_dir, exist_ok=True)
+    method = "auto"
+    if "method" in (opts.get("partition") or {}).keys():
+        method = opts["partition"]["method"]
+    parts = load_partition(opts["hgrid"], nparts, method=method)
+    counts = np.bincount(parts, minlength=nparts)
+    logging.info("Mesh is partitioned into %d parts, %d to %d elements in each part", nparts, counts.min(), counts.max())
+    return [write_partition(os.path.join(output_dir, PARTITION_FILE), parts)]
+
+def output_files(output_dir="./"):
+    """
+    Returns list of files that will be generated
+    """
+    return [os.path.join(output_dir, PARTITION_FILE)]
@@ -0,0 +1,217 @@
+import os
+import logging
+import numpy as np
+from .utils import load_mesh, cache_file, _save_npz
+
+# Average number of elements in each cell of the bucket index
+ELEMENTS_PER_CELL = 4
+
+# Number of points located at once, limits memory used for candidate elements
+LOCATE_CHUNK = 50000
+
+def _ranges(starts, counts):
+    # Concatenated ranges [start, start+count) without python loop
+    total = int(counts.sum())
+    offsets = np.cumsum(counts)-counts
+    return np.repeat(starts-offsets, counts)+np.arange(total)
+
+class MeshIndex:
+    """
+    Spatial index of a SCHISM horizontal grid
+    A KD-tree over node coordinates and a uniform grid of buckets over elements (and nodes) is used,
+    queries only visit the nodes and elements close to the given points
+    """
+
+    def __init__(self, mesh, origin, cell_size, shape, elem_offsets, elem_ids, node_offsets, node_ids):
+        self.mesh = mesh
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.cell_size = np.asarray(cell_size, dtype=np.float64)
+        self.shape = tuple(int(n) for n in shape)
+        self.elem_offsets = elem_offsets
+        self.elem_ids = elem_ids
+        self.node_offsets = node_offsets
+        self.node_ids = node_ids
+        self._tree = None
+
+    @classmethod
+    def build(cls, mesh):
+        """
+        Creates index of given mesh
+        """
+        x, y = mesh.x, mesh.y
+        xmin, ymin, xmax, ymax = x.min(), y.min(), x.max(), y.max()
+        # Cells are square and cover the mesh extent, small padding keeps the max coordinates inside
+        ncells = max(mesh.nelements//ELEMENTS_PER_CELL, 1)
+        width, height = max(xmax-xmin, 1e-9), max(ymax-ymin, 1e-9)
+        size = np.sqrt(width*height/ncells)*(1+1e-9)
+        shape = (int(height//size)+1, int(width//size)+1)
+
+        # Each element is added to all cells covered by its bounding box
+        elements = np.where(mesh.elements < 0, mesh.elements[:,:1], mesh.elements)
+        ex, ey = x[elements], y[elements]
+        ix0 = ((ex.min(axis=1)-xmin)//size).astype(np.int64)
+        ix1 = ((ex.max(axis=1)-xmin)//size).astype(np.int64)
+        iy0 = ((ey.min(axis=1)-ymin)//size).astype(np.int64)
+        iy1 = ((ey.max(axis=1)-ymin)//size).astype(np.int64)
+        nx = ix1-ix0+1
+        counts = nx*(iy1-iy0+1)
+        elem = np.repeat(np.arange(mesh.nelements), counts)
+        local = _ranges(np.zeros(mesh.nelements, dtype=np.int64), counts)
+        cells = (iy0[elem]+local//nx[elem])*shape[1]+ix0[elem]+local%nx[elem]
+        elem_offsets, elem_ids = cls._buckets(cells, elem, shape)
+
+        # Each node is added to the cell that contains it
+        cells = ((y-ymin)//size).astype(np.int64)*shape[1]+((x-xmin)//size).astype(np.int64)
+        node_offsets, node_ids = cls._buckets(cells, np.arange(mesh.nnodes), shape)
+        return cls(mesh, (xmin, ymin), size, shape, elem_offsets, elem_ids, node_offsets, node_ids)
+
+    @staticmethod
+    def _buckets(cells, ids, shape):
+        # Compressed (CSR like) list of ids in each cell
+        order = np.argsort(cells, kind='stable')
+        offsets = np.zeros(shape[0]*shape[1]+1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=shape[0]*shape[1]), out=offsets[1:])
+        return offsets, ids[order]
+
+    @property
+    def tree(self):
+        """
+        KD-tree of node coordinates, created when it is first used
+        It is not cached, building it from the nodes is fast and the cache only keeps plain arrays
+        """
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.mesh.nodes[:,:2])
+        return self._tree
+
+    def save(self, filename):
+        """
+        Writes index to numpy (npz) file
+        """
+        _save_npz(filename,
+            origin=self.origin,
+            cell_size=self.cell_size,
+            shape=np.array(self.shape),
+            elem_offsets=self.elem_offsets,
+            elem_ids=self.elem_ids,
+            node_offsets=self.node_offsets,
+            node_ids=self.node_ids)
+
+    @classmethod
+    def load(cls, filename, mesh):
+        """
+        Reads index of given mesh from numpy (npz) file
+        """
+        with np.load(filename, allow_pickle=False) as data:
+            return cls(mesh, data['origin'], data['cell_size'], data['shape'],
+                       data['elem_offsets'], data['elem_ids'], data['node_offsets'], data['node_ids'])
+
+    def _cells(self, x, y):
+        # Cell (row, column) of the points, -1 is used for points outside of the grid
+        ix = np.floor((np.asarray(x, dtype=np.float64)-self.origin[0])/self.cell_size).astype(np.int64)
+        iy = np.floor((np.asarray(y, dtype=np.float64)-self.origin[1])/self.cell_size).astype(np.int64)
+        outside = (ix < 0) | (ix >= self.shape[1]) | (iy < 0) | (iy >= self.shape[0])
+        ix[outside] = -1
+        iy[outside] = -1
+        return iy, ix
+
+    def nearest(self, x, y, k=1):
+        """
+        Returns distances and indices of the k nearest nodes of given points
+        The distance is computed in mesh coordinates (i.e. degrees for hgrid.ll)
+        """
+        return self.tree.query(np.column_stack((np.atleast_1d(x), np.atleast_1d(y))), k=k)
+
+    def nodes_in_bbox(self, xmin, ymin, xmax, ymax):
+        """
+        Returns sorted indices of the nodes in given bounding box
+        """
+        x0, y0 = self.origin
+        x1, y1 = x0+self.shape[1]*self.cell_size, y0+self.shape[0]*self.cell_size
+        if xmax < x0 or xmin > x1 or ymax < y0 or ymin > y1:
+            return np.zeros(0, dtype=np.int64)
+        # Cells overlapping with the box
+        col = lambda v: int(np.clip((v-x0)//self.cell_size, 0, self.shape[1]-1))
+        row = lambda v: int(np.clip((v-y0)//self.cell_size, 0, self.shape[0]-1))
+        rows = np.arange(row(ymin), row(ymax)+1)
+        cols = np.arange(col(xmin), col(xmax)+1)
+        cells = (rows[:,None]*self.shape[1]+cols[None,:]).ravel()
+        starts = self.node_offsets[cells]
+        ids = self.node_ids[_ranges(starts, self.node_offsets[cells+1]-starts)]
+        x, y = self.mesh.x[ids], self.mesh.y[ids]
+        return np.sort(ids[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)])
+
+    def locate(self, x, y):
+        """
+        Finds elements that contain given points
+        Returns element indices (-1 for points outside of the mesh), nodes (n,3) and barycentric weights (n,3)
+        of the triangle that contains each point, quads are split into two triangles
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        elements = np.full(x.size, -1, dtype=np.int64)
+        nodes = np.zeros((x.size, 3), dtype=np.int64)
+        weights = np.zeros((x.size, 3))
+        for start in range(0, x.size, LOCATE_CHUNK):
+            sl = slice(start, start+LOCATE_CHUNK)
+            elements[sl], nodes[sl], weights[sl] = self._locate(x[sl], y[sl])
+        return elements, nodes, weights
+
+    def _locate(self, x, y):
+        iy, ix = self._cells(x, y)
+        cells = np.where(ix < 0, 0, iy*self.shape[1]+ix)
+        starts = self.elem_offsets[cells]
+        counts = np.where(ix < 0, 0, self.elem_offsets[cells+1]-starts)
+        # Candidate (point, element) pairs, each quad is tested as two triangles
+        point = np.repeat(np.arange(x.size), counts)
+        elem = self.elem_ids[_ranges(starts, counts)]
+        conn = self.mesh.elements[elem]
+        quad = conn[:,3] >= 0
+        point = np.concatenate((point, point[quad]))
+        elem = np.concatenate((elem, elem[quad]))
+        tri = np.concatenate((conn[:,:3], conn[quad][:,[0,2,3]]))
+
+        # Barycentric coordinates of the points
+        px, py = x[point], y[point]
+        x1, y1 = self.mesh.x[tri[:,0]], self.mesh.y[tri[:,0]]
+        x2, y2 = self.mesh.x[tri[:,1]], self.mesh.y[tri[:,1]]
+        x3, y3 = self.mesh.x[tri[:,2]], self.mesh.y[tri[:,2]]
+        det = (y2-y3)*(x1-x3)+(x3-x2)*(y1-y3)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w1 = ((y2-y3)*(px-x3)+(x3-x2)*(py-y3))/det
+            w2 = ((y3-y1)*(px-x3)+(x1-x3)*(py-y3))/det
+        w3 = 1.0-w1-w2
+        eps = -1e-10
+        inside = (w1 >= eps) & (w2 >= eps) & (w3 >= eps) & (det != 0)
+
+        # First containing element of each point
+        elements = np.full(x.size, -1, dtype=np.int64)
+        nodes = np.zeros((x.size, 3), dtype=np.int64)
+        weights = np.zeros((x.size, 3))
+        hit = np.flatnonzero(inside)
+        _, first = np.unique(point[hit], return_index=True)
+        hit = hit[first]
+        elements[point[hit]] = elem[hit]
+        nodes[point[hit]] = tri[hit]
+        weights[point[hit]] = np.column_stack((w1[hit], w2[hit], w3[hit]))
+        return elements, nodes, weights
+
+def load_index(hgrid_fname, cache=True, cache_dir=None):
+    """
+    Returns spatial index of the horizontal grid, the index is cached with the parsed grid
+    """
+    mesh = load_mesh(hgrid_fname, cache=cache, cache_dir=cache_dir)
+    if not cache:
+        return MeshIndex.build(mesh)
+    cfile = cache_file(hgrid_fname, 'index', cache_dir)
+    if os.path.isfile(cfile):
+        try:
+            return MeshIndex.load(cfile, mesh)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning('Ignoring mesh index cache %s: %s', cfile, str(e))
+    index = MeshIndex.build(mesh)
+    try:
+        index.save(cfile)
+    except OSError as e:
+        logging.info('Mesh index cache %s could not be written: %s', cfile, str(e))
+    return index
@@ -0,0 +1,209 @@
+import os
+import re
+import csv
+import glob
+import logging
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Number of time records read at once from an output file
+RECORDS = 24
+
+# Names of the variables in SCHISM 2D outputs (out2d_*.nc)
+VARIABLES = {
+    'elevation': 'elevation',
+    'u': 'depthAverageVelX',
+    'v': 'depthAverageVelY',
+    'dry': 'dryFlagNode'
+}
+
+def output_files(output_dir, pattern='out2d_*.nc'):
+    """
+    Returns output files in the order of their stack number
+    """
+    files = glob.glob(os.path.join(output_dir, pattern))
+    number = lambda fn: int(re.findall(r'(\d+)', os.path.basename(fn))[-1])
+    return sorted(files, key=number)
+
+def read_stations(filename):
+    """
+    Reads stations from CSV file (name, lon, lat columns) or SCHISM station.in file
+    Returns names and coordinates of the stations
+    """
+    names, x, y = [], [], []
+    if filename.endswith('.csv'):
+        with open(filename, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                names.append(row['name'])
+                x.append(float(row['lon']))
+                y.append(float(row['lat']))
+    else:
+        with open(filename, 'r') as f:
+            lines = f.readlines()
+        # First line has output flags, second one the number of stations, then id x y z (! name)
+        for line in lines[2:2+int(lines[1].split()[0])]:
+            data, _, comment = line.partition('!')
+            tokens = data.split()
+            names.append(comment.strip() or tokens[0])
+            x.append(float(tokens[1]))
+            y.append(float(tokens[2]))
+    return names, np.array(x), np.array(y)
+
+def _process_file(filename, nodes, weights, variables, records):
+    # Maximum elevation and velocity of each node and station time series of one output file
+    import netCDF4
+
+    out = {}
+    with netCDF4.Dataset(filename) as nc:
+        time = nc.variables['time']
+        ntimes = time.shape[0]
+        out['time'] = time[:].astype(np.float64)
+        out['time_units'] = getattr(time, 'units', '')
+        has_vel = variables['u'] in nc.variables.keys() and variables['v'] in nc.variables.keys()
+        has_dry = variables['dry'] in nc.variables.keys()
+        nnodes = nc.variables[variables['elevation']].shape[1]
+        out['zmax'] = np.full(nnodes, -np.inf)
+        out['zmax_time'] = np.full(nnodes, np.nan)
+        if has_vel:
+            out['vmax'] = np.full(nnodes, -np.inf)
+            out['vmax_time'] = np.full(nnodes, np.nan)
+        series = {key: [] for key in (['elevation', 'u', 'v'] if has_vel else ['elevation'])}
+        for start in range(0, ntimes, records):
+            sl = slice(start, min(start+records, ntimes))
+            t = out['time'][sl]
+            z = np.ma.filled(nc.variables[variables['elevation']][sl,:].astype(np.float64), np.nan)
+            if has_dry:
+                z[np.asarray(nc.variables[variables['dry']][sl,:]) == 1] = np.nan
+            _running_max(z, t, out['zmax'], out['zmax_time'])
+            chunk = {'elevation': z}
+            if has_vel:
+                u = np.ma.filled(nc.variables[variables['u']][sl,:].astype(np.float64), np.nan)
+                v = np.ma.filled(nc.variables[variables['v']][sl,:].astype(np.float64), np.nan)
+                _running_max(np.hypot(u, v), t, out['vmax'], out['vmax_time'])
+                chunk.update({'u': u, 'v': v})
+            if nodes is not None:
+                for key, values in chunk.items():
+                    series[key].append((values[:,nodes]*weights).sum(axis=2))
+        if nodes is not None:
+            for key, chunks in series.items():
+                out['station_'+key] = np.concatenate(chunks) if chunks else np.zeros((0, nodes.shape[0]))
+    return out
+
+def _running_max(values, time, vmax, vtime):
+    # Update maximum and time of maximum in place, NaN (dry) values are skipped
+    k = np.argmax(np.where(np.isnan(values), -np.inf, values), axis=0)
+    chunk_max = values[k, np.arange(values.shape[1])]
+    better = chunk_max > vmax
+    vmax[better] = chunk_max[better]
+    vtime[better] = time[k[better]]
+
+def process(files, stations=None, index=None, variables=None, workers=4, records=RECORDS):
+    """
+    Computes maximum elevation and velocity of each node and extracts time series at stations
+    Files are processed in parallel, each one is read in chunks of records, so memory does not depend on the file length
+    stations: names and coordinates returned by read_stations, index: MeshIndex of the grid
+    """
+    variables = dict(VARIABLES, **(variables or {}))
+    nodes = weights = None
+    inside = None
+    if stations is not None:
+        elements, nodes, weights = index.locate(stations[1], stations[2])
+        inside = elements >= 0
+        if not inside.all():
+            logging.warning('Stations outside of the grid: %s', ', '.join(n for n, i in zip(stations[0], inside) if not i))
+        weights = weights[None,:,:]
+
+    # Results are folded as they arrive, in time order, only the running maxima and station series are kept
+    out = {}
+    times, series = [], {}
+    pool = None
+    if workers > 1 and len(files) > 1:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(files)), mp_context=multiprocessing.get_context('spawn'))
+        results = pool.map(_process_file, files, repeat(nodes), repeat(weights), repeat(variables), repeat(records))
+    else:
+        results = (_process_file(fn, nodes, weights, variables, records) for fn in files)
+    try:
+        for res in results:
+            if not out:
+                out = {key: res[key] for key in ['zmax', 'zmax_time', 'vmax', 'vmax_time', 'time_units'] if key in res.keys()}
+            else:
+                for key, tkey in [('zmax', 'zmax_time'), ('vmax', 'vmax_time')]:
+                    if key in out.keys():
+                        better = res[key] > out[key]
+                        out[key][better] = res[key][better]
+                        out[tkey][better] = res[tkey][better]
+            times.append(res['time'])
+            for key in [k for k in res.keys() if k.startswith('station_')]:
+                series.setdefault(key, []).append(res[key])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for key in ['zmax', 'vmax']:
+        if key in out.keys():
+            out[key][np.isinf(out[key])] = np.nan
+    out['time'] = np.concatenate(times)
+    if stations is not None:
+        for key, chunks in series.items():
+            out[key] = np.concatenate(chunks)
+            out[key][:,~inside] = np.nan
+    return out
+
+def write_max(filename, mesh, out):
+    """
+    Writes maximum elevation and velocity of the nodes to netCDF file
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(filename, 'w') as nc:
+        nc.createDimension('node', mesh.nnodes)
+        for name, values, attrs in [('x', mesh.x, {'long_name': 'node x-coordinate'}),
+                                    ('y', mesh.y, {'long_name': 'node y-coordinate'}),
+                                    ('depth', mesh.depth, {'long_name': 'bathymetry', 'units': 'm'}),
+                                    ('zeta_max', out['zmax'], {'long_name': 'maximum water surface elevation', 'units': 'm'}),
+                                    ('time_of_zeta_max', out['zmax_time'], {'long_name': 'time of maximum water surface elevation', 'units': out['time_units']}),
+                                    ('vel_max', out.get('vmax'), {'long_name': 'maximum depth averaged velocity', 'units': 'm s-1'}),
+                                    ('time_of_vel_max', out.get('vmax_time'), {'long_name': 'time of maximum depth averaged velocity', 'units': out['time_units']})]:
+            if values is None:
+                continue
+            dtype = 'f8' if name in ['x', 'y'] or name.startswith('time') else 'f4'
+            var = nc.createVariable(name, dtype, ('node',), zlib=True, fill_value=np.nan if dtype == 'f4' else None)
+            var.setncatts({k: v for k, v in attrs.items() if v})
+            var[:] = values
+        nc.createDimension('nele', mesh.nelements)
+        nc.createDimension('nvertex', 4)
+        var = nc.createVariable('element', 'i4', ('nele', 'nvertex'), zlib=True, fill_value=-1)
+        var.long_name = 'element connectivity (one-based)'
+        var[:] = np.where(mesh.elements < 0, -1, mesh.elements+1)
+    return filename
+
+def write_stations(filename, stations, out):
+    """
+    Writes time series at stations to netCDF file
+    """
+    import netCDF4
+
+    names, x, y = stations
+    with netCDF4.Dataset(filename, 'w') as nc:
+        nc.createDimension('time', None)
+        nc.createDimension('station', len(names))
+        var = nc.createVariable('time', 'f8', ('time',))
+        if out['time_units']:
+            var.units = out['time_units']
+        var[:] = out['time']
+        var = nc.createVariable('station_name', str, ('station',))
+        var[:] = np.array(names, dtype=object)
+        nc.createVariable('lon', 'f8', ('station',))[:] = x
+        nc.createVariable('lat', 'f8', ('station',))[:] = y
+        for key, long_name, units in [('elevation', 'water surface elevation', 'm'),
+                                      ('u', 'depth averaged eastward velocity', 'm s-1'),
+                                      ('v', 'depth averaged northward velocity', 'm s-1')]:
+            if not 'station_'+key in out.keys():
+                continue
+            var = nc.createVariable(key, 'f4', ('time', 'station'), zlib=True, fill_value=np.nan, chunksizes=(min(len(out['time']), 1024) or 1, len(names)))
+            var.long_name = long_name
+            var.units = units
+            var[:] = out['station_'+key]
+    return filename
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import logging
+import numpy as np
+
+def node_values(spec, x, y):
+    """
+    Returns value of each node for given gr3 property
+    spec can be a number (constant value), raster ({raster, variable, band, default})
+    or polygons ({polygons, attribute or value, default})
+    """
+    if not isinstance(spec, dict):
+        return np.asarray(spec)
+    if 'raster' in spec.keys():
+        values = sample_raster(spec['raster'], x, y, variable=spec.get('variable'), band=spec.get('band', 1))
+    elif 'polygons' in spec.keys():
+        values = sample_polygons(spec['polygons'], x, y, attribute=spec.get('attribute'), value=spec.get('value'))
+    else:
+        logging.error('Spatial gr3 property needs either raster or polygons option: %s', spec)
+        sys.exit()
+    # Nodes outside of the data or without valid value
+    default = spec.get('default', 0.0)
+    missing = np.isnan(values)
+    if missing.any():
+        logging.info('%d of %d nodes are set to default value %s', np.count_nonzero(missing), values.size, default)
+        values[missing] = default
+    return values
+
+def input_files(spec):
+    """
+    Returns files read for given gr3 property
+    """
+    if not isinstance(spec, dict):
+        return []
+    return [spec[key] for key in ['raster', 'polygons'] if key in spec.keys()]
+
+def _check_file(filename):
+    if not os.path.isfile(filename):
+        logging.error('The file %s does not exist.', filename)
+        sys.exit()
+
+def sample_raster(filename, x, y, variable=None, band=1):
+    """
+    Returns values of the raster cells that contain the nodes, NaN is used for outside or nodata cells
+    netCDF files are read with xarray, other formats (i.e. GeoTIFF) with GDAL
+    """
+    _check_file(filename)
+    if filename.endswith(('.nc', '.nc4')):
+        return _sample_netcdf(filename, x, y, variable)
+    return _sample_gdal(filename, x, y, band)
+
+def _sample_netcdf(filename, x, y, variable):
+    import xarray as xr
+
+    with xr.open_dataset(filename) as ds:
+        if variable is None:
+            variable = [v for v in ds.data_vars if ds[v].ndim == 2][0]
+        da = ds[variable].squeeze()
+        lon_name, lat_name = _lonlat_dims(da)
+        da = da.transpose(lat_name, lon_name)
+        lon = ds[lon_name].values
+        lat = ds[lat_name].values
+        # Same longitude convention with the mesh
+        xq = np.where(x < 0, x+360.0, x) if lon.min() >= 0 else np.where(x > 180, x-360.0, x)
+        i = _nearest_index(lon, xq)
+        j = _nearest_index(lat, y)
+        inside = (i >= 0) & (j >= 0)
+        values = np.full(x.shape, np.nan)
+        # Only the window that covers the mesh is read
+        if inside.any():
+            i0, i1 = i[inside].min(), i[inside].max()+1
+            j0, j1 = j[inside].min(), j[inside].max()+1
+            window = da.isel({lon_name: slice(i0, i1), lat_name: slice(j0, j1)}).values.astype(np.float64)
+            values[inside] = window[j[inside]-j0, i[inside]-i0]
+        fill = da.attrs.get('_FillValue', da.encoding.get('_FillValue'))
+        if fill is not None:
+            values[values == fill] = np.nan
+    return values
+
+def _lonlat_dims(da):
+    # Longitude and latitude dimensions of the raster, found by CF attributes or by name
+    found = {}
+    for dim in da.dims:
+        attrs = da[dim].attrs if dim in da.coords else {}
+        units = str(attrs.get('units', '')).lower()
+        names = [str(attrs.get('standard_name', '')).lower(), str(attrs.get('axis', '')).lower(), dim.lower()]
+        if 'longitude' in names or 'x' in names or (units.startswith('degree') and units.endswith(('e', 'east'))) or dim.lower() in ['lon', 'long']:
+            found.setdefault('lon', dim)
+        elif 'latitude' in names or 'y' in names or (units.startswith('degree') and units.endswith(('n', 'north'))) or dim.lower() == 'lat':
+            found.setdefault('lat', dim)
+    if len(da.dims) != 2 or not 'lon' in found.keys() or not 'lat' in found.keys():
+        logging.error('Longitude and latitude dimensions of %s could not be found: %s', da.name, ', '.join(da.dims))
+        sys.exit()
+    return found['lon'], found['lat']
+
+def _nearest_index(coord, q):
+    # Index of the nearest coordinate, -1 if point is outside of the coordinates (more than half cell)
+    ascending = coord[-1] >= coord[0]
+    c = coord if ascending else coord[::-1]
+    k = np.clip(np.searchsorted(c, q), 1, c.size-1)
+    k = np.where(np.abs(q-c[k-1]) <= np.abs(q-c[k]), k-1, k)
+    half = np.abs(c[1]-c[0])/2 if c.size > 1 else 0.0
+    k = np.where((q < c[0]-half) | (q > c[-1]+half), -1, k)
+    return k if ascending else np.where(k < 0, -1, c.size-1-k)
+
+def _sample_gdal(filename, x, y, band):
+    try:
+        from osgeo import gdal
+    except ImportError:
+        logging.error('GDAL is required to read %s, convert it to netCDF or install GDAL python bindings.', filename)
+        sys.exit()
+
+    ds = gdal.Open(filename)
+    ox, dx, rx, oy, ry, dy = ds.GetGeoTransform()
+    if rx != 0 or ry != 0:
+        logging.error('Rotated rasters are not supported: %s', filename)
+        sys.exit()
+    i = np.floor((x-ox)/dx).astype(np.int64)
+    j = np.floor((y-oy)/dy).astype(np.int64)
+    inside = (i >= 0) & (i < ds.RasterXSize) & (j >= 0) & (j < ds.RasterYSize)
+    values = np.full(x.shape, np.nan)
+    if inside.any():
+        # Read only the window that covers the mesh
+        i0, i1 = int(i[inside].min()), int(i[inside].max())+1
+        j0, j1 = int(j[inside].min()), int(j[inside].max())+1
+        rb = ds.GetRasterBand(band)
+        window = rb.ReadAsArray(i0, j0, i1-i0, j1-j0).astype(np.float64)
+        nodata = rb.GetNoDataValue()
+        if nodata is not None:
+            window[window == nodata] = np.nan
+        values[inside] = window[j[inside]-j0, i[inside]-i0]
+    ds = None
+    return values
+
+def sample_polygons(filename, x, y, attribute=None, value=None):
+    """
+    Returns value of the polygon that contains each node, NaN is used for nodes outside of polygons
+    The value is either taken from attribute of the polygon or given constant, the last polygon wins if they overlap
+    """
+    import shapely
+    from shapely.geometry import shape
+
+    _check_file(filename)
+    geoms, vals = [], []
+    for geom, props in _read_features(filename):
+        geoms.append(shape(geom))
+        vals.append(props[attribute] if attribute is not None else value)
+    values = np.full(x.shape, np.nan)
+    if not geoms:
+        return values
+    tree = shapely.STRtree(geoms)
+    pidx, gidx = tree.query(shapely.points(x, y), predicate='intersects')
+    # Pairs are sorted by point, keep the last polygon of each point
+    order = np.lexsort((gidx, pidx))
+    pidx, gidx = pidx[order], gidx[order]
+    last = np.r_[pidx[1:] != pidx[:-1], True]
+    values[pidx[last]] = np.asarray(vals, dtype=np.float64)[gidx[last]]
+    return values
+
+def _read_features(filename):
+    # GeoJSON is read directly, other formats (i.e. shapefile) with OGR
+    if filename.endswith(('.json', '.geojson')):
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        features = data['features'] if data.get('type') == 'FeatureCollection' else [data]
+        return [(ft['geometry'], ft.get('properties') or {}) for ft in features]
+    try:
+        from osgeo import ogr
+    except ImportError:
+        logging.error('GDAL is required to read %s, convert it to GeoJSON or install GDAL python bindings.', filename)
+        sys.exit()
+    ds = ogr.Open(filename)
+    layer = ds.GetLayer()
+    return [(json.loads(ft.GetGeometryRef().ExportToJson()), ft.items()) for ft in layer]
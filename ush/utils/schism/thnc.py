@@ -0,0 +1,114 @@
+import os
+import logging
+import numpy as np
+
+# Target size of a chunk (in bytes) for the time_series variable
+CHUNK_BYTES = 4*1024*1024
+
+def chunk_length(nnodes, nlevels, ncomp, itemsize=4, chunk_bytes=CHUNK_BYTES):
+    """
+    Returns number of time records in a chunk
+    SCHISM reads a full record (all boundary nodes, levels and components) at each
+    time, so chunks are time-major and span the remaining dimensions completely
+    """
+    record_bytes = nnodes*nlevels*ncomp*itemsize
+    return max(1, chunk_bytes//max(1, record_bytes))
+
+class ThWriter:
+    """
+    Streaming writer for SCHISM *.th.nc open boundary files
+    Records are buffered and written one chunk at a time, so peak memory is one chunk
+    The file is written to a temporary file and replaced when it is closed, so the files
+    hard linked to it are not changed and partially written file is never seen
+    """
+
+    def __init__(self, filename, nnodes, nlevels=1, ncomp=1, time_step=None, chunk_time=None, zlib=False, shuffle=False, complevel=4):
+        from netCDF4 import Dataset
+
+        self.filename = filename
+        self.shape = (nnodes, nlevels, ncomp)
+        self.time_step = time_step
+        if chunk_time is None:
+            chunk_time = chunk_length(nnodes, nlevels, ncomp)
+        self.chunk_time = chunk_time
+        # Create file
+        self.tmp = '{}.{}.tmp'.format(filename, os.getpid())
+        self.nc = Dataset(self.tmp, 'w', format='NETCDF4')
+        self.nc.createDimension('nOpenBndNodes', nnodes)
+        self.nc.createDimension('one', 1)
+        self.nc.createDimension('time', None)
+        self.nc.createDimension('nLevels', nlevels)
+        self.nc.createDimension('nComponents', ncomp)
+        self.nc.createVariable('time_step', 'f4', ('one',))
+        self.nc.createVariable('time', 'f8', ('time',), chunksizes=(max(chunk_time, 1024),))
+        self.nc.createVariable('time_series', 'f4', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'),
+                               chunksizes=(chunk_time,)+self.shape, zlib=zlib, shuffle=shuffle, complevel=complevel)
+        self.nc.Conventions = "CF-1.6"
+        self.nc.history = "Created by SCHISM boundary condition generator"
+        # Buffer for single chunk
+        self.buffer = np.zeros((chunk_time,)+self.shape, dtype=np.float32)
+        self.times = []
+        self.nrec = 0
+
+    def write(self, time, values):
+        """
+        Adds a time record, values are broadcast to (nOpenBndNodes, nLevels, nComponents)
+        """
+        self.buffer[len(self.times)] = np.broadcast_to(np.asarray(values, dtype=np.float32).reshape(self._rshape(values)), self.shape)
+        self.times.append(time)
+        if len(self.times) == self.chunk_time:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes buffered records to the file
+        """
+        n = len(self.times)
+        if n == 0:
+            return
+        self.nc['time'][self.nrec:self.nrec+n] = self.times
+        self.nc['time_series'][self.nrec:self.nrec+n] = self.buffer[:n]
+        if self.time_step is None:
+            t = self.nc['time'][:min(self.nrec+n, 2)]
+            if t.size > 1:
+                self.time_step = t[1]-t[0]
+        self.nrec += n
+        self.times = []
+
+    def close(self):
+        self.flush()
+        if self.time_step is not None:
+            self.nc['time_step'][:] = self.time_step
+        self.nc.close()
+        os.replace(self.tmp, self.filename)
+        logging.info("%d records are written to %s", self.nrec, self.filename)
+
+    def abort(self):
+        """
+        Closes and removes the partially written file, the existing file is kept
+        """
+        if self.nc.isopen():
+            self.nc.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+    def _rshape(self, values):
+        # Append trailing singleton dimensions so that (nOpenBndNodes,) or (nOpenBndNodes, nLevels) are accepted
+        ndim = np.ndim(values)
+        if ndim == 0:
+            return ()
+        return np.shape(values)+(1,)*(len(self.shape)-ndim)
+
+def write_th_nc(filename, records, nnodes, nlevels=1, ncomp=1, time_step=None, chunk_time=None, zlib=False, shuffle=False, complevel=4):
+    """
+    Writes SCHISM *.th.nc file from generator of (time, values) records
+    """
+    writer = ThWriter(filename, nnodes, nlevels, ncomp, time_step=time_step, chunk_time=chunk_time, zlib=zlib, shuffle=shuffle, complevel=complevel)
+    try:
+        for time, values in records:
+            writer.write(time, values)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return filename
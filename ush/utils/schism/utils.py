@@ -1,25 +1,217 @@
+import io
+import os
+import hashlib
+import logging
+import functools
 import numpy as np
 
+# Directory used to keep parsed meshes
+CACHE_DIR = os.environ.get('COASTAL_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ufs-coastal'))
+
+# Number of lines written at once by the gr3 writer
+WRITE_CHUNK = 100000
+
 def bounding_rectangle_2d(hgrid_fname):
+    # Grid is only parsed again if it is changed, i.e. ensemble members share the same grid
+    st = os.stat(hgrid_fname)
+    return list(_bounding_rectangle_2d(os.path.realpath(hgrid_fname), st.st_size, st.st_mtime_ns))
+
+@functools.lru_cache(maxsize=8)
+def _bounding_rectangle_2d(hgrid_fname, size, mtime):
     num_points, num_elements, nodes = read_hgrid(hgrid_fname)
-    x_min, y_min = np.min(nodes[:, :2], axis=0)
-    x_max, y_max = np.max(nodes[:, :2], axis=0)
-    if (x_min < 0):
-        x_min = x_min % 360.0
-    if (x_max < 0):
-        x_max = x_max % 360.0    
-    return [x_min, y_min, x_max, y_max]
+    y_min, y_max = np.min(nodes[:,1]), np.max(nodes[:,1])
+    x_min, x_max = lon_extent(nodes[:,0])
+    return (x_min, y_min, x_max, y_max)
+
+def lon_extent(lon):
+    """
+    Returns western and eastern edges of the given longitudes in [0,360) range
+    The largest gap between the longitudes is left outside, so the western edge is
+    greater than the eastern one if the domain crosses the prime meridian
+    """
+    lon = np.unique(np.asarray(lon) % 360.0)
+    gaps = np.diff(np.r_[lon, lon[0]+360.0])
+    k = np.argmax(gaps)
+    return lon[(k+1) % lon.size], lon[k]
 
 def read_hgrid(hgrid_fname):
-    with open(hgrid_fname, 'r') as file:
-        info_string = file.readline().strip()
-        num_elements, num_points = map(int, file.readline().split())
-        node_coor = np.zeros((num_points, 3))
-
-        for i in range(num_points):
-            line = file.readline().split()
-            node_id = int(line[0])
-            x, y, z = map(float, line[1:])
-            node_coor[i] = [x, y, z]
-
-    return num_points, num_elements, node_coor
+    mesh = load_mesh(hgrid_fname)
+    return mesh.nnodes, mesh.nelements, mesh.nodes
+
+class Mesh:
+    """
+    SCHISM horizontal grid
+    nodes: (x, y, depth) of each node
+    elements: zero-based node indices of each element, -1 is used for the 4th node of triangles
+    open_boundaries, land_boundaries: zero-based node indices of each boundary segment
+    """
+
+    def __init__(self, nodes, elements, open_boundaries=[], land_boundaries=[], description=''):
+        self.nodes = nodes
+        self.elements = elements
+        self.open_boundaries = list(open_boundaries)
+        self.land_boundaries = list(land_boundaries)
+        self.description = description
+
+    @property
+    def x(self):
+        return self.nodes[:,0]
+
+    @property
+    def y(self):
+        return self.nodes[:,1]
+
+    @property
+    def depth(self):
+        return self.nodes[:,2]
+
+    @property
+    def nnodes(self):
+        return self.nodes.shape[0]
+
+    @property
+    def nelements(self):
+        return self.elements.shape[0]
+
+    def save(self, filename):
+        """
+        Writes mesh to numpy (npz) file
+        """
+        segments = lambda b: np.cumsum([0]+[len(s) for s in b])
+        concat = lambda b: np.concatenate(b) if b else np.zeros(0, dtype=np.int64)
+        _save_npz(filename,
+            nodes=self.nodes,
+            elements=self.elements,
+            open_boundaries=concat(self.open_boundaries),
+            open_offsets=segments(self.open_boundaries),
+            land_boundaries=concat(self.land_boundaries),
+            land_offsets=segments(self.land_boundaries),
+            description=np.array(self.description))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Reads mesh from numpy (npz) file
+        """
+        with np.load(filename) as data:
+            split = lambda b, o: [b[o[i]:o[i+1]] for i in range(len(o)-1)]
+            return cls(data['nodes'], data['elements'],
+                       open_boundaries=split(data['open_boundaries'], data['open_offsets']),
+                       land_boundaries=split(data['land_boundaries'], data['land_offsets']),
+                       description=str(data['description']))
+
+def file_signature(fname):
+    """
+    Returns signature of the file based on its path, size and modification time
+    """
+    st = os.stat(fname)
+    h = hashlib.blake2b(digest_size=16)
+    h.update('{}:{}:{}'.format(os.path.realpath(fname), st.st_size, st.st_mtime_ns).encode('utf-8'))
+    return h.hexdigest()
+
+def cache_file(fname, kind, cache_dir=None):
+    """
+    Returns name of the file that keeps processed version of the given file
+    """
+    return os.path.join(cache_dir or CACHE_DIR, 'mesh', '{}.{}.npz'.format(file_signature(fname), kind))
+
+def _save_npz(filename, **arrays):
+    # Write to temporary file first, so other processes never read partially written file
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, filename)
+
+def load_mesh(hgrid_fname, cache=True, cache_dir=None):
+    """
+    Returns parsed horizontal grid, the parsed grid is cached and reused until the file changes
+    """
+    if not cache:
+        return parse_hgrid(hgrid_fname)
+    cfile = cache_file(hgrid_fname, 'hgrid', cache_dir)
+    if os.path.isfile(cfile):
+        try:
+            return Mesh.load(cfile)
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning('Ignoring mesh cache %s: %s', cfile, str(e))
+    mesh = parse_hgrid(hgrid_fname)
+    try:
+        mesh.save(cfile)
+    except OSError as e:
+        logging.info('Mesh cache %s could not be written: %s', cfile, str(e))
+    return mesh
+
+def parse_hgrid(hgrid_fname):
+    """
+    Parses horizontal grid file (hgrid.gr3, hgrid.ll or any gr3 file)
+    Nodes and elements are parsed in bulk, only boundary section is processed line by line
+    """
+    import pandas as pd
+
+    with open(hgrid_fname, 'rb') as f:
+        data = f.read()
+    # Find line offsets, header has two lines
+    eol = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+    description = data[:eol[0]].decode('utf-8', errors='replace').strip()
+    num_elements, num_points = map(int, data[eol[0]+1:eol[1]].split()[:2])
+    node_end = eol[1+num_points] if eol.size > 1+num_points else len(data)
+    elem_end = eol[1+num_points+num_elements] if eol.size > 1+num_points+num_elements else len(data)
+
+    # Nodes: id, x, y, depth
+    nodes = pd.read_csv(io.BytesIO(data[eol[1]+1:node_end]), sep=r'\s+', header=None, usecols=[1, 2, 3],
+                        dtype=np.float64, engine='c').to_numpy()
+    # Elements: id, type, nodes (3 or 4)
+    elements = pd.read_csv(io.BytesIO(data[node_end+1:elem_end]), sep=r'\s+', header=None, names=range(6), engine='c')
+    elements = elements.iloc[:, 2:].fillna(0).to_numpy(dtype=np.int64)-1
+
+    # Boundaries
+    lines = data[elem_end+1:].decode('utf-8', errors='replace').splitlines()
+    open_boundaries = _parse_boundaries(lines, 0)
+    land_boundaries = _parse_boundaries(lines, 2+sum(len(b)+1 for b in open_boundaries)) if open_boundaries is not None else None
+    return Mesh(nodes, elements, open_boundaries or [], land_boundaries or [], description=description)
+
+def _parse_boundaries(lines, start):
+    # Boundary section: number of segments, total number of nodes, then number of nodes and node ids of each segment
+    first = lambda line: int(line.split()[0])
+    try:
+        nseg = first(lines[start])
+        boundaries = []
+        i = start+2
+        for _ in range(nseg):
+            n = first(lines[i])
+            boundaries.append(np.array([first(l) for l in lines[i+1:i+1+n]], dtype=np.int64)-1)
+            i += n+1
+        return boundaries
+    except (IndexError, ValueError):
+        return None
+
+def write_gr3(filename, mesh, values, description='description'):
+    """
+    Writes gr3 file with given node values, lines are formatted in chunks
+    The file is replaced, so the files hard linked to it (i.e. shared with other members) are not changed
+    """
+    values = np.broadcast_to(np.asarray(values), (mesh.nnodes,))
+    integer = np.issubdtype(values.dtype, np.integer)
+    node_fmt = '%d %.6f %.6f %d\n' if integer else '%d %.6f %.6f %.6e\n'
+    ids = np.arange(1, mesh.nnodes+1)
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(f"{description}\n")
+        f.write(f"{mesh.nelements} {mesh.nnodes}\n")
+        for start in range(0, mesh.nnodes, WRITE_CHUNK):
+            sl = slice(start, start+WRITE_CHUNK)
+            rows = np.column_stack((ids[sl], mesh.x[sl], mesh.y[sl], values[sl]))
+            f.write((node_fmt*rows.shape[0]) % tuple(rows.ravel().tolist()))
+        nvert = np.where(mesh.elements[:,3] < 0, 3, 4)
+        eids = np.arange(1, mesh.nelements+1)
+        for start in range(0, mesh.nelements, WRITE_CHUNK):
+            sl = slice(start, start+WRITE_CHUNK)
+            elems = mesh.elements[sl]+1
+            if np.all(nvert[sl] == 3):
+                rows = np.column_stack((eids[sl], elems[:,:3]))
+                f.write(('%d 3 %d %d %d\n'*rows.shape[0]) % tuple(rows.ravel().tolist()))
+            else:
+                f.write(''.join('{} {} {}\n'.format(i, n, ' '.join(map(str, e[:n]))) for i, n, e in zip(eids[sl], nvert[sl], elems)))
+    os.replace(tmp, filename)
+    return filename
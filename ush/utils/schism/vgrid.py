@@ -0,0 +1,171 @@
+import io
+import os
+import sys
+import hashlib
+import logging
+import numpy as np
+from .utils import cache_file, _save_npz
+
+class VGrid:
+    """
+    SCHISM vertical grid
+    ivcor: 1 (LSC2) or 2 (SZ)
+    nvrt: number of levels
+    kbp: zero-based bottom level of each node (LSC2)
+    sigma: sigma coordinate of each node and level (LSC2), NaN below the bottom level
+    ztot, sigma: z levels and sigma levels of S region (SZ), h_s, h_c, theta_b, theta_f: SZ parameters
+    """
+
+    def __init__(self, ivcor, nvrt, kbp=None, sigma=None, ztot=None, h_s=None, h_c=None, theta_b=None, theta_f=None):
+        self.ivcor = ivcor
+        self.nvrt = nvrt
+        self.kbp = kbp
+        self.sigma = sigma
+        self.ztot = ztot
+        self.h_s = h_s
+        self.h_c = h_c
+        self.theta_b = theta_b
+        self.theta_f = theta_f
+
+    @property
+    def kz(self):
+        return self.ztot.size
+
+    def zcor(self, depth, nodes=None):
+        """
+        Returns z-coordinates (positive upward, at zero elevation) of the levels of given nodes (all nodes by default)
+        Levels below the bottom are set to the bottom
+        """
+        depth = np.asarray(depth, dtype=np.float64)
+        if self.ivcor == 1:
+            nodes = np.arange(self.kbp.size) if nodes is None else np.asarray(nodes)
+            sigma = self.sigma[nodes].astype(np.float64)
+            z = sigma*depth[:,None]
+            bottom = z[np.arange(nodes.size), self.kbp[nodes]]
+            return np.where(np.isnan(z), bottom[:,None], z)
+        return self._zcor_sz(depth)
+
+    def _zcor_sz(self, depth):
+        # S levels are stretched over min(depth, h_s), Z levels are used below h_s
+        kz = self.kz
+        s = self.sigma
+        cs = (1.0-self.theta_b)*np.sinh(self.theta_f*s)/np.sinh(self.theta_f) \
+            +self.theta_b*(np.tanh(self.theta_f*(s+0.5))-np.tanh(self.theta_f*0.5))/(2.0*np.tanh(self.theta_f*0.5))
+        hmod = np.minimum(depth, self.h_s)[:,None]
+        z = np.empty((depth.size, self.nvrt))
+        z[:,kz-1:] = np.where(hmod <= self.h_c, s*hmod, self.h_c*s+(hmod-self.h_c)*cs)
+        if kz > 1:
+            # Z levels above the bottom, the bottom level is at the depth and the levels below it are set to it
+            ztot = self.ztot[:-1]
+            bottom = -depth[:,None]
+            z[:,:kz-1] = np.where(ztot > bottom, ztot, bottom)
+            deep = depth > self.h_s
+            z[~deep,:kz-1] = z[~deep,kz-1:kz]
+        return z
+
+    def save(self, filename):
+        """
+        Writes vertical grid to numpy (npz) file
+        """
+        arrays = {k: v for k, v in self.__dict__.items() if v is not None}
+        _save_npz(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Reads vertical grid from numpy (npz) file
+        """
+        with np.load(filename) as data:
+            scalar = lambda v: v.item() if v.ndim == 0 else v
+            return cls(**{k: scalar(data[k]) for k in data.files})
+
+def parse_vgrid(vgrid_fname):
+    """
+    Parses vertical grid file (vgrid.in), the levels of LSC2 grids are parsed in bulk
+    Both the current (levels in rows) and the old (nodes in rows) LSC2 formats are supported
+    """
+    with open(vgrid_fname, 'rb') as f:
+        data = f.read()
+    lines = data.split(b'\n', 2)
+    ivcor = int(lines[0].split()[0])
+    if ivcor == 1:
+        nvrt = int(lines[1].split()[0])
+        return _parse_lsc2(lines[2], nvrt)
+    if ivcor == 2:
+        return _parse_sz(data.decode('utf-8', errors='replace').splitlines())
+    logging.error('Vertical grid type ivcor = %d in %s is not supported!', ivcor, vgrid_fname)
+    sys.exit()
+
+def _parse_lsc2(data, nvrt):
+    import pandas as pd
+
+    first, _, rest = data.partition(b'\n')
+    second = rest.split(b'\n', 1)[0].split()
+    if second and int(float(second[0])) == 1 and len(second) == len(first.split())+1:
+        # Bottom level of all nodes, then level id and sigma of all nodes for each level (-9 below the bottom)
+        kbp = np.array(first.split(), dtype=np.int64)-1
+        values = np.fromstring(rest.decode('ascii'), sep=' ').reshape(nvrt, kbp.size+1)
+        sigma = values[:,1:].T.copy()
+        sigma[np.arange(nvrt)[None,:] < kbp[:,None]] = np.nan
+    else:
+        # Node id, bottom level and sigma from the bottom level to the surface for each node
+        table = pd.read_csv(io.BytesIO(data), sep=r'\s+', header=None, names=range(nvrt+2), engine='c', dtype=np.float64).to_numpy()
+        kbp = table[:,1].astype(np.int64)-1
+        level = np.arange(nvrt)[None,:]
+        col = np.clip(2+level-kbp[:,None], 2, nvrt+1)
+        sigma = np.where(level >= kbp[:,None], np.take_along_axis(table, col, axis=1), np.nan)
+    return VGrid(1, nvrt, kbp=kbp, sigma=sigma.astype(np.float32))
+
+def _parse_sz(lines):
+    nvrt, kz, h_s = lines[1].split()[:3]
+    nvrt, kz, h_s = int(nvrt), int(kz), float(h_s)
+    # Z levels (after 'Z levels' line) and S levels (after 'S levels' and parameters lines)
+    ztot = np.array([float(l.split()[1]) for l in lines[3:3+kz]])
+    h_c, theta_b, theta_f = map(float, lines[4+kz].split()[:3])
+    sigma = np.array([float(l.split()[1]) for l in lines[5+kz:5+kz+nvrt-kz+1]])
+    return VGrid(2, nvrt, ztot=ztot, sigma=sigma, h_s=abs(h_s), h_c=h_c, theta_b=theta_b, theta_f=theta_f)
+
+def load_vgrid(vgrid_fname, cache=True, cache_dir=None):
+    """
+    Returns parsed vertical grid, the parsed grid is cached and reused until the file changes
+    """
+    if not cache:
+        return parse_vgrid(vgrid_fname)
+    cfile = cache_file(vgrid_fname, 'vgrid', cache_dir)
+    if os.path.isfile(cfile):
+        try:
+            return VGrid.load(cfile)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning('Ignoring vertical grid cache %s: %s', cfile, str(e))
+    vgrid = parse_vgrid(vgrid_fname)
+    try:
+        vgrid.save(cfile)
+    except OSError as e:
+        logging.info('Vertical grid cache %s could not be written: %s', cfile, str(e))
+    return vgrid
+
+def boundary_zcor(vgrid_fname, nodes, depth, cache=True, cache_dir=None):
+    """
+    Returns z-coordinates (positive upward) of the levels of given nodes (i.e. open boundary nodes) with given depths
+    They are cached for the vertical grid, nodes and depths
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    depth = np.asarray(depth, dtype=np.float64)
+    if not cache:
+        return load_vgrid(vgrid_fname, cache=False).zcor(depth, nodes)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(nodes.tobytes())
+    h.update(depth.tobytes())
+    cfile = cache_file(vgrid_fname, 'zcor.{}'.format(h.hexdigest()), cache_dir)
+    if os.path.isfile(cfile):
+        try:
+            with np.load(cfile) as data:
+                return data['zcor']
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning('Ignoring z-coordinate cache %s: %s', cfile, str(e))
+    zcor = load_vgrid(vgrid_fname, cache_dir=cache_dir).zcor(depth, nodes)
+    try:
+        _save_npz(cfile, zcor=zcor)
+    except OSError as e:
+        logging.info('Z-coordinate cache %s could not be written: %s', cfile, str(e))
+    return zcor
@@ -0,0 +1,54 @@
+import os
+import errno
+import fcntl
+import shutil
+import logging
+
+# ioctl request used to clone file content (reflink) on copy-on-write file systems (Btrfs, XFS)
+FICLONE = 0x40049409
+
+def stage_file(src, dst, overwrite=False):
+    """
+    Makes file available in given path, hard link is used if it is possible, then reflink and otherwise file is copied
+    Returns method used to stage the file ('exists', 'link', 'reflink' or 'copy')
+    """
+    src = os.fspath(src)
+    dst = os.fspath(dst)
+    if os.path.lexists(dst):
+        if not overwrite or (os.path.exists(dst) and os.path.samefile(src, dst)):
+            return 'exists'
+        os.remove(dst)
+    dirname = os.path.dirname(dst)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError as e:
+        # Different file systems or no hard link support
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+    # Copy to temporary file first, so partially copied file is never seen
+    tmp = dst+'.tmp'
+    if reflink(src, tmp):
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+        return 'reflink'
+    logging.debug('Could not link %s, copying it to %s', src, dst)
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return 'copy'
+
+def reflink(src, dst):
+    """
+    Creates copy of the file that shares its data blocks with the source (copy-on-write)
+    Returns False if it is not supported by the file system
+    """
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False